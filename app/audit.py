@@ -1,26 +1,128 @@
 """
-Модуль для аудита запросов к API. Сохраняет информацию о каждом запросе в базу данных.
+Модуль для аудита запросов к API.
+Записи копятся в памяти и пишутся в request_audit пачками (multi-row INSERT)
+фоновой задачей — запрос не ждёт INSERT+COMMIT.
+Если пачка не записалась, она делится пополам и пишется по частям,
+так что теряются только строки, которые не записываются сами по себе.
 """
 
-from app.database import RequestAudit
-from fastapi import Depends
-from app.dependencies import get_db
-from sqlalchemy.orm import Session
+import asyncio
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from sqlalchemy import insert
+from app.database import AsyncSessionLocal, RequestAudit
+from app.config import settings
 from cl import logger
 
-def log_api_access(request, api_token_id: int, db: Session = Depends(get_db)):
-    try:
-        pass
-        # audit = RequestAudit(
-        #     path=request.url.path,
-        #     method=request.method,
-        #     client_ip=request.client.host,
-        #     api_token_id=api_token_id
-        # )
-        # db.add(audit)
-        # db.commit()
-        # logger.info(f"Audit created: path={audit.path}, ip={audit.client_ip}, token_id={api_token_id}")
-    except Exception as e:
-        logger.exception(f"Failed to write audit: {e}")
-    finally:
-        db.close()
+
+class AuditSink:
+    """Write-behind буфер записей аудита с ограничением по памяти"""
+
+    def __init__(self, max_queue: int = 50000, batch_size: int = 500, flush_interval: float = 1.0):
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._buffer: deque = deque()
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def enqueue(self, path: str, method: str, client_ip: str, api_token_id: Optional[int]) -> bool:
+        """Кладёт запись в буфер. При переполнении запись отбрасывается."""
+        if len(self._buffer) >= self.max_queue:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(f"Audit queue overflow, dropped={self.dropped}")
+            return False
+
+        self._buffer.append({
+            "path": path[:255],
+            "method": method,
+            "client_ip": client_ip,
+            "api_token_id": api_token_id,
+            "timestamp": datetime.now(timezone.utc),
+        })
+        self.enqueued += 1
+
+        if len(self._buffer) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    async def flush(self):
+        """Записывает всё накопленное пачками по batch_size"""
+        async with self._flush_lock:
+            while self._buffer:
+                batch = [
+                    self._buffer.popleft()
+                    for _ in range(min(self.batch_size, len(self._buffer)))
+                ]
+                await self._write(batch)
+
+    async def _write(self, batch: List[Dict[str, Any]]):
+        """Пишет пачку; при ошибке — половины по отдельности, вплоть до одной строки"""
+        try:
+            async with AsyncSessionLocal() as session:
+                await session.execute(insert(RequestAudit).values(batch))
+                await session.commit()
+            self.written += len(batch)
+        except Exception as e:
+            if len(batch) == 1:
+                self.failed += 1
+                logger.error(f"Failed to write audit row {batch[0]}: {e}")
+                return
+            logger.warning(f"Failed to write audit batch ({len(batch)} rows), splitting: {e}")
+            middle = len(batch) // 2
+            await self._write(batch[:middle])
+            await self._write(batch[middle:])
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Останавливает фоновую задачу и дописывает остаток буфера.
+        Задача не отменяется: начатая пачка (уже вынутая из буфера) дописывается.
+        """
+        if self._task is not None:
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        logger.info(f"Audit sink stopped: written={self.written}, dropped={self.dropped}, failed={self.failed}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": len(self._buffer),
+            "max_queue": self.max_queue,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+
+audit_sink = AuditSink(
+    max_queue=settings.AUDIT_QUEUE_SIZE,
+    batch_size=settings.AUDIT_BATCH_SIZE,
+    flush_interval=settings.AUDIT_FLUSH_INTERVAL,
+)
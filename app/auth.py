@@ -182,10 +182,14 @@ from jose import jwt, JWTError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 import secrets
+from dataclasses import dataclass
 from typing import Optional, Dict, Any
 from urllib.parse import urlparse
-from app.database import APIToken, WhitelistedEntry, RequestAudit
+from app.database import APIToken, User
+from app.audit import audit_sink
 from app.config import settings
+from app.cache import TTLCache
+from app.whitelist_index import get_whitelist_index
 from cryptography.fernet import Fernet
 from app.dependencies import get_db
 from cl import logger
@@ -198,6 +202,32 @@ if not settings.FERNET_KEY:
     raise RuntimeError("FERNET_KEY not set in environment")
 fernet = Fernet(settings.FERNET_KEY.encode())
 
+
+@dataclass(frozen=True, slots=True)
+class TokenPrincipal:
+    """Облегчённое представление API токена, которое хранится в кэше"""
+    id: int
+    user_id: int
+    access_level: int
+    username: str
+    name: str
+    description: Optional[str] = None
+
+
+# Кэш ключ токена -> TokenPrincipal (в пределах одного процесса)
+token_cache = TTLCache(maxsize=settings.TOKEN_CACHE_SIZE, ttl=settings.TOKEN_CACHE_TTL)
+
+
+def invalidate_token(key: Optional[str]):
+    """Сбрасывает кэш для конкретного ключа токена"""
+    if key:
+        token_cache.pop(key)
+
+
+def invalidate_user_tokens(user_id: int):
+    """Сбрасывает кэш всех токенов пользователя (например, после смены username)"""
+    token_cache.pop_where(lambda p: p.user_id == user_id)
+
 def get_current_user(request: Request):
     """Синхронная проверка JWT (не требует БД)"""
     token = request.cookies.get("access_token")
@@ -262,17 +292,33 @@ async def generate_api_token(
     }
 
 
+def get_auth_context(conn) -> Optional[Dict[str, Any]]:
+    """Возвращает уже вычисленный auth-контекст запроса/WS-соединения (или None)"""
+    return getattr(conn.state, "auth_context", None)
+
+
 async def get_current_user_or_api_token(
     request: Request, 
     db: AsyncSession = Depends(get_db)
 ):
-    """ASYNC универсальная проверка доступа"""
+    """
+    ASYNC универсальная проверка доступа.
+    Результат сохраняется в request.state.auth_context: повторные вызовы в рамках
+    одного запроса (Depends + ручной вызов, WS-обработчики) не делают повторного
+    поиска токена и не пишут второй записи аудита.
+    Принимает как Request, так и WebSocket.
+    """
+    auth_context = get_auth_context(request)
+    if auth_context is not None:
+        return auth_context
+
     # 1) JWT cookie (admin)
     access_cookie = request.cookies.get("access_token")
     if access_cookie:
         username = get_current_user(request)
         logger.debug(f"Admin access by {username}")
-        return {"type": "admin", "username": username}
+        request.state.auth_context = {"type": "admin", "username": username}
+        return request.state.auth_context
 
     # 2) Bearer API token
     try:
@@ -292,17 +338,7 @@ async def get_current_user_or_api_token(
     whitelist_enabled = get_config_value("whitelist", default=True)
     
     if token_obj.access_level == 0 and whitelist_enabled:
-        domain_allowed = False
-        if domain:
-            stmt = select(WhitelistedEntry).where(WhitelistedEntry.value == domain)
-            result = await db.execute(stmt)
-            domain_allowed = result.scalar_one_or_none() is not None
-        
-        stmt = select(WhitelistedEntry).where(WhitelistedEntry.value == client_ip)
-        result = await db.execute(stmt)
-        ip_allowed = result.scalar_one_or_none() is not None
-
-        if not (domain_allowed or ip_allowed):
+        if not get_whitelist_index().is_allowed(client_ip, domain):
             logger.warning(
                 f"Level 0 token from non-whitelisted: {domain} / {client_ip}"
             )
@@ -311,30 +347,19 @@ async def get_current_user_or_api_token(
                 detail=f"Access denied. IP: {client_ip}, Domain: {domain or 'N/A'}"
             )
 
-    # 4) Audit
-    audit = RequestAudit(
-        path=request.url.path,
-        method=request.method,
-        client_ip=client_ip,
-        api_token_id=token_obj.id,
-    )
-    db.add(audit)
-    
-    try:
-        await db.commit()
-    except Exception as e:
-        logger.error(f"Failed to create audit: {e}")
-        await db.rollback()
-    
+    # 4) Audit (пишется фоном пачками, не больше одной записи на запрос)
+    _enqueue_audit(request, token_obj)
+
     logger.info(
         f"Access granted: token_id={token_obj.id}, "
         f"level={token_obj.access_level}, ip={client_ip}"
     )
 
-    return {"type": "api_token", "token_obj": token_obj}
+    request.state.auth_context = {"type": "api_token", "token_obj": token_obj}
+    return request.state.auth_context
 
 
-def require_access_level(token: APIToken, min_level: int):
+def require_access_level(token: TokenPrincipal, min_level: int):
     """Проверка уровня (синхронная)"""
     if token.access_level < min_level:
         raise HTTPException(
@@ -343,30 +368,49 @@ def require_access_level(token: APIToken, min_level: int):
         )
 
 
-def get_require_access_level(token: APIToken):
+def get_require_access_level(token: TokenPrincipal):
     return int(token.access_level)
 
 
 async def get_api_token_from_header(
     authorization: Optional[str],
     db: AsyncSession
-) -> APIToken:
-    """Async получение токена"""
+) -> TokenPrincipal:
+    """Async получение токена (сначала из кэша, затем из БД)"""
     token_value = get_token_from_header(authorization)
     if not token_value:
         raise HTTPException(status_code=401, detail="Токен не предоставлен")
 
-    stmt = select(APIToken).where(APIToken.key == token_value)
+    principal = token_cache.get(token_value)
+    if principal is not None:
+        return principal
+
+    # Только нужные колонки: без ORM-объектов и связей (audits, api_tokens)
+    stmt = (
+        select(
+            APIToken.id,
+            APIToken.user_id,
+            APIToken.access_level,
+            User.username,
+            APIToken.name,
+            APIToken.description,
+        )
+        .join(User, User.id == APIToken.user_id)
+        .where(APIToken.key == token_value)
+    )
     result = await db.execute(stmt)
-    token = result.scalar_one_or_none()
+    row = result.one_or_none()
     
-    if not token:
+    if not row:
         raise HTTPException(
             status_code=401, 
             detail="Неверный или недействительный токен"
         )
-    
-    return token
+
+    principal = TokenPrincipal(**row._mapping)
+    token_cache.set(token_value, principal)
+
+    return principal
 
 
 def get_token_from_header(authorization: Optional[str]) -> str:
@@ -387,19 +431,18 @@ def get_token_from_header(authorization: Optional[str]) -> str:
 async def create_audit_record(
     db: AsyncSession, 
     request: Request, 
-    api_token: APIToken
+    api_token: TokenPrincipal
 ):
-    """Async создание audit"""
-    audit = RequestAudit(
-        path=request.url.path,
-        method=request.method,
-        client_ip=request.client.host,
-        api_token_id=api_token.id,
-    )
-    db.add(audit)
-    
-    try:
-        await db.commit()
-    except Exception as e:
-        logger.error(f"Failed to create audit: {e}")
-        await db.rollback()
\ No newline at end of file
+    """
+    Постановка записи audit в фоновую очередь (без INSERT в запросе).
+    Если запрос уже прошёл get_current_user_or_api_token — запись уже есть, ничего не делаем.
+    """
+    _enqueue_audit(request, api_token)
+
+
+def _enqueue_audit(request: Request, api_token: TokenPrincipal):
+    if getattr(request.state, "audited", False):
+        return
+    request.state.audited = True
+    method = getattr(request, "method", "WS")
+    audit_sink.enqueue(request.url.path, method, request.client.host, api_token.id)
\ No newline at end of file
@@ -0,0 +1,102 @@
+"""
+Получение баланса Dessly (merchants/balance) с объединением запросов.
+Одновременные запросы баланса с одним Dessly-токеном ждут один вызов к Dessly.
+Дополнительно результат может жить BALANCE_CACHE_TTL секунд (0 — без кэша);
+после успешного пополнения запись токена сбрасывается.
+"""
+
+from typing import Any, Dict
+from app.cache import SingleFlight, TTLCache
+from app.config import settings
+from app.dessly_client import dessly_client
+from app.upstream import UpstreamUnavailable
+from cl import logger
+
+
+_MISSING = object()
+
+
+class BalanceError(Exception):
+    """Баланс не получен: Dessly вернул error_code (400), запрос не удался (500) или Dessly недоступен (503)"""
+
+    def __init__(self, detail: str, status_code: int):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+
+
+class BalanceCache:
+    def __init__(self, ttl: float = 1.0, maxsize: int = 10000):
+        self.ttl = ttl
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._flight = SingleFlight()
+        # Эпоха токена растёт при каждой его инвалидации: ответ запроса, начатого
+        # до пополнения, не кэшируется. Пополнение одного токена не трогает остальные.
+        # Эпоха нужна, только пока по токену есть запросы в полёте (_pending):
+        # после последнего из них запись удаляется, и словари не растут.
+        self._epochs: Dict[str, int] = {}
+        self._pending: Dict[str, int] = {}
+
+        self.fetches = 0
+        self.errors = 0
+
+    async def _fetch(self, dessly_token: str, epoch: int) -> Any:
+        self._pending[dessly_token] = self._pending.get(dessly_token, 0) + 1
+        try:
+            return await self._fetch_balance(dessly_token, epoch)
+        finally:
+            pending = self._pending.pop(dessly_token) - 1
+            if pending:
+                self._pending[dessly_token] = pending
+            else:
+                self._epochs.pop(dessly_token, None)
+
+    async def _fetch_balance(self, dessly_token: str, epoch: int) -> Any:
+        self.fetches += 1
+        try:
+            result = await dessly_client.balance(dessly_token)
+        except UpstreamUnavailable as e:
+            self.errors += 1
+            logger.warning(f"Баланс dessly: {e}")
+            raise BalanceError("Dessly API temporarily unavailable", 503) from e
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Исключение при получении баланса dessly: {str(e)}")
+            raise BalanceError("Internal server error while fetching balance", 500) from e
+
+        if not result.ok:
+            self.errors += 1
+            logger.warning(f"Ошибка при получении баланса dessly: {result}")
+            raise BalanceError("Error fetching balance from Dessly API", 400)
+
+        balance = result.balance
+        if self.ttl > 0 and epoch == self._epochs.get(dessly_token, 0):
+            self._cache.set(dessly_token, balance)
+        return balance
+
+    async def get(self, dessly_token: str) -> Any:
+        if self.ttl > 0:
+            balance = self._cache.get(dessly_token, _MISSING)
+            if balance is not _MISSING:
+                return balance
+        # Эпоха в ключе: после пополнения новые запросы не присоединяются к старому вызову
+        epoch = self._epochs.get(dessly_token, 0)
+        return await self._flight.do((dessly_token, epoch), lambda: self._fetch(dessly_token, epoch))
+
+    def invalidate(self, dessly_token: str):
+        """Сбрасывает баланс токена (после пополнения)"""
+        if dessly_token in self._pending:
+            self._epochs[dessly_token] = self._epochs.get(dessly_token, 0) + 1
+        self._cache.pop(dessly_token)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._cache.stats(),
+            "fetches": self.fetches,
+            "errors": self.errors,
+            "singleflight": self._flight.stats(),
+            "epochs": len(self._epochs),
+        }
+
+
+balance_cache = BalanceCache(ttl=settings.BALANCE_CACHE_TTL, maxsize=settings.BALANCE_CACHE_SIZE)
@@ -0,0 +1,150 @@
+"""
+In-memory кэши процесса.
+TTLCache — LRU-кэш ограниченного размера со временем жизни записей, необязательным
+окном stale (отдача устаревшего значения на время обновления) и счётчиками попаданий.
+SingleFlight — схлопывание одновременных запросов с одним ключом в один вызов.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+# Состояния записи для TTLCache.lookup
+FRESH = "fresh"
+STALE = "stale"
+MISS = "miss"
+
+
+class TTLCache:
+    """LRU-кэш с TTL (не потокобезопасный, рассчитан на один event loop)"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0, stale_ttl: float = 0.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        # key -> (value, expires_at, stale_until)
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        value, state = self.lookup(key, default)
+        return value if state == FRESH else default
+
+    def lookup(self, key: Hashable, default: Any = None) -> Tuple[Any, str]:
+        """
+        Значение и его состояние: FRESH, STALE (TTL истёк, но запись ещё
+        в окне stale_ttl — можно отдать, пока она обновляется) или MISS.
+        """
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return default, MISS
+
+        value, expires_at, stale_until = entry
+        now = time.monotonic()
+        if expires_at <= now:
+            if stale_until <= now:
+                del self._data[key]
+                self.misses += 1
+                return default, MISS
+            self._data.move_to_end(key)
+            self.stale_hits += 1
+            return value, STALE
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value, FRESH
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, stale_ttl: Optional[float] = None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        stale_until = expires_at + (self.stale_ttl if stale_ttl is None else stale_ttl)
+        self._data[key] = (value, expires_at, stale_until)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable):
+        """Удаляет запись, если она есть"""
+        return self._data.pop(key, (None, None, None))[0]
+
+    def pop_where(self, predicate: Callable[[Any], bool]) -> int:
+        """Удаляет все записи, значение которых удовлетворяет predicate"""
+        keys = [k for k, (v, _, _) in self._data.items() if predicate(v)]
+        for k in keys:
+            del self._data[k]
+        return len(keys)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class SingleFlight:
+    """
+    Одновременные вызовы do() с одним ключом ждут одну и ту же задачу,
+    поэтому N параллельных промахов кэша дают один запрос к апстриму.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.shared = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    def start(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> asyncio.Task:
+        """Запускает fn(), если по ключу ещё нет задачи в полёте, и возвращает задачу"""
+        task = self._inflight.get(key)
+        if task is not None:
+            self.shared += 1
+            return task
+
+        self.calls += 1
+        task = asyncio.ensure_future(fn())
+        self._inflight[key] = task
+
+        def _done(t: asyncio.Task):
+            if self._inflight.get(key) is t:
+                del self._inflight[key]
+            # Ошибку забирают ожидающие; здесь только помечаем её прочитанной,
+            # чтобы фоновые обновления без ожидающих не сыпали предупреждениями
+            if not t.cancelled():
+                t.exception()
+
+        task.add_done_callback(_done)
+        return task
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        # shield: отмена одного ожидающего не отменяет общий запрос
+        return await asyncio.shield(self.start(key, fn))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "inflight": len(self._inflight),
+            "calls": self.calls,
+            "shared": self.shared,
+        }
@@ -0,0 +1,345 @@
+"""
+Кэши Steam Gift: каталог игр (steamgift/games) и данные отдельных игр (steamgift/games/{app_id}).
+
+Каталог большой и почти статичный, поэтому хранится готовым ответом:
+JSON-тело уже сериализовано и сжато gzip, ETag посчитан заранее.
+Горячий путь — сравнение ETag или отдача готовых байтов без запроса к Dessly.
+
+Обновление как у курсов валют: свежий (GAMES_CACHE_TTL) отдаётся сразу,
+устаревший (ещё GAMES_STALE_TTL) — сразу, с фоновой перезагрузкой,
+одновременные загрузки схлопываются в одну.
+
+Режим GAMES_PASSTHROUGH: каталог не кэшируется и не разбирается — тело Dessly
+отдаётся клиенту кусками по мере чтения, конверт {"status", "error"} вставляется
+перед первым ключом. Проверяются только первые GAMES_PASSTHROUGH_PEEK байт:
+короткий ответ разбирается целиком (так распознаётся error_code), длинный
+считается каталогом. Память и CPU на запрос не зависят от размера каталога.
+Слот dessly_guard освобождается, как только начало ответа проверено: остальное
+тело читается со скоростью клиента, и его обрыв ошибкой Dessly не считается.
+Общего таймаута у такого запроса нет: ограничена только пауза между кусками
+(GAMES_PASSTHROUGH_READ_TIMEOUT).
+
+Данные игры: LRU по app_id (GAME_CACHE_SIZE) с TTL и окном stale. Ответы
+«такой игры нет» кэшируются отдельно на GAME_NEGATIVE_TTL, чтобы повторные
+запросы несуществующих app_id не доходили до Dessly. Временные ошибки
+(нет ответа, access_denied конкретного токена) не кэшируются.
+
+Оба кэша общие для всех токенов, поэтому токен запроса сначала проверяется
+(app/dessly_tokens.py): отклонённый Dessly токен получает ошибку, а не данные из кэша.
+"""
+
+import gzip
+import hashlib
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, Optional
+from app.cache import SingleFlight, TTLCache, FRESH, STALE
+from app.config import settings
+from app.dessly_client import dessly_client, dessly_error, json_dumps, json_loads
+from app.dessly_tokens import dessly_tokens, DesslyTokenError
+from app.upstream import UpstreamUnavailable
+from cl import logger
+
+
+
+@dataclass(frozen=True, slots=True)
+class CatalogSnapshot:
+    """Готовый ответ со списком игр"""
+
+    body: bytes
+    gzip_body: bytes
+    etag: str
+    count: int
+    fetched_at: float
+
+
+class CatalogError(Exception):
+    """Dessly вернул ошибку вместо каталога (error — код для ответа клиенту)"""
+
+    def __init__(self, error: Optional[str] = None):
+        super().__init__(error or "connection_error")
+        self.error = error
+
+
+def build_snapshot(games: Any) -> CatalogSnapshot:
+    body = json_dumps({"status": True, "error": None, "games": games})
+    return CatalogSnapshot(
+        body=body,
+        gzip_body=gzip.compress(body, compresslevel=6),
+        etag='"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"',
+        count=len(games) if isinstance(games, list) else 0,
+        fetched_at=time.monotonic(),
+    )
+
+
+# Начало ответа-каталога: к нему приклеивается тело Dessly без открывающей скобки
+ENVELOPE_PREFIX = b'{"status":true,"error":null,'
+
+
+def error_body(error: CatalogError) -> bytes:
+    if error.error is None:
+        return json_dumps({"status": False})
+    return json_dumps({"status": False, "error": error.error, "games": None})
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Проверка заголовка If-None-Match (список, слабые ETag W/"..." и *)"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+class GamesCatalog:
+    """Каталог один на все токены: список игр у Dessly общий"""
+
+    def __init__(self, ttl: float = 300.0, stale_ttl: float = 3600.0, peek: int = 4096):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.peek = peek
+
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._flight = SingleFlight()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.errors = 0
+        self.passthrough = 0
+
+    async def _fetch(self, dessly_token: str) -> CatalogSnapshot:
+        self.fetches += 1
+        try:
+            result = await dessly_client.games(dessly_token)
+            if result.http_status != 200:
+                raise RuntimeError(f"HTTP {result.http_status}")
+        except UpstreamUnavailable as e:
+            self.errors += 1
+            logger.warning(f"Список игр Steam: {e}")
+            raise CatalogError("upstream_unavailable") from e
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Ошибка при получении списка игр Steam: {e}")
+            raise CatalogError() from e
+
+        if not result.ok:
+            self.errors += 1
+            error = dessly_error(result.error_code)
+            error.log()
+            raise CatalogError(error.error)
+
+        snapshot = build_snapshot(result.games)
+        self._snapshot = snapshot
+        dessly_tokens.accept(dessly_token)
+        logger.info(
+            f"Список игр обновлён: {snapshot.count} игр, "
+            f"{len(snapshot.body)} байт ({len(snapshot.gzip_body)} gzip)"
+        )
+        return snapshot
+
+    async def get(self, dessly_token: str) -> CatalogSnapshot:
+        try:
+            await dessly_tokens.check(dessly_token)
+        except DesslyTokenError as e:
+            raise CatalogError(None if e.error == "connection_error" else e.error) from e
+
+        snapshot = self._snapshot
+        if snapshot is not None:
+            age = time.monotonic() - snapshot.fetched_at
+            if age < self.ttl:
+                self.hits += 1
+                return snapshot
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._flight.start("games", lambda: self._fetch(dessly_token))
+                return snapshot
+
+        self.misses += 1
+        return await self._flight.do("games", lambda: self._fetch(dessly_token))
+
+    async def stream(self, dessly_token: str) -> AsyncIterator[bytes]:
+        """
+        Тело ответа /dessly/steam/games потоком из Dessly (режим GAMES_PASSTHROUGH).
+        Ошибка до первого байта отдаётся обычным JSON-ответом об ошибке;
+        обрыв после — обрывает и ответ клиенту.
+        """
+        self.passthrough += 1
+        failure: Optional[CatalogError] = None
+        started = False
+        try:
+            async with dessly_client.games_stream(dessly_token) as upstream:
+                if upstream.status != 200:
+                    logger.error(f"Ошибка при получении списка игр Steam: HTTP {upstream.status}")
+                    failure = CatalogError()
+                else:
+                    chunks = upstream.chunks()
+                    head = b""
+                    complete = True
+                    async for chunk in chunks:
+                        head += chunk
+                        if len(head) >= self.peek:
+                            complete = False
+                            break
+
+                    if complete:
+                        # Короткий ответ — разбираем целиком: каталог или error_code
+                        data = json_loads(head) if head else {}
+                        data = data if isinstance(data, dict) else {}
+                        await upstream.release()
+                        if data.get("games") is not None:
+                            started = True
+                            yield json_dumps({"status": True, "error": None, "games": data["games"]})
+                        else:
+                            upstream.set_error_code(data.get("error_code"))
+                            error = dessly_error(data.get("error_code"))
+                            error.log()
+                            failure = CatalogError(error.error)
+
+                    else:
+                        head = head.lstrip()
+                        if head.startswith(b"{") and b'"error_code"' not in head:
+                            # Начало ответа проверено: дальше тело читает клиент, слот Dessly не нужен
+                            await upstream.release()
+                            started = True
+                            yield ENVELOPE_PREFIX + head[1:]
+                            async for chunk in chunks:
+                                yield chunk
+                        else:
+                            logger.error(f"Неожиданный ответ со списком игр Steam: {head[:200]!r}")
+                            failure = CatalogError(dessly_error(None).error)
+
+        except UpstreamUnavailable as e:
+            logger.warning(f"Список игр Steam: {e}")
+            failure = CatalogError("upstream_unavailable")
+        except Exception as e:
+            if started:
+                self.errors += 1
+                logger.error(f"Список игр Steam: поток прерван: {e}")
+                raise
+            logger.error(f"Ошибка при получении списка игр Steam: {e}")
+            failure = CatalogError()
+
+        if failure is not None:
+            self.errors += 1
+            yield error_body(failure)
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "cached": snapshot is not None,
+            "age": round(time.monotonic() - snapshot.fetched_at, 3) if snapshot else None,
+            "games": snapshot.count if snapshot else 0,
+            "bytes": len(snapshot.body) if snapshot else 0,
+            "gzip_bytes": len(snapshot.gzip_body) if snapshot else 0,
+            "etag": snapshot.etag if snapshot else None,
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "fetches": self.fetches,
+            "errors": self.errors,
+            "passthrough": self.passthrough,
+        }
+
+
+class GameDetailsCache:
+    """Ответы /dessly/steam/game по app_id (общие для всех токенов)"""
+
+    def __init__(self, maxsize: int = 5000, ttl: float = 600.0, negative_ttl: float = 60.0, stale_ttl: float = 3600.0):
+        self.negative_ttl = negative_ttl
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl, stale_ttl=stale_ttl)
+        self._flight = SingleFlight()
+
+        self.fetches = 0
+        self.negative = 0
+        self.errors = 0
+
+    async def _fetch(self, app_id: str, dessly_token: str) -> Dict[str, Any]:
+        self.fetches += 1
+        try:
+            response = await dessly_client.game(dessly_token, app_id)
+            if response.http_status not in (200, 404):
+                raise RuntimeError(f"HTTP {response.http_status}")
+        except UpstreamUnavailable as e:
+            self.errors += 1
+            logger.warning(f"Данные игры Steam: {e}")
+            return {"status": False, "error": "upstream_unavailable", "games": None}
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Ошибка при получении данных игры Steam: {e}")
+            return {"status": False}
+
+        if response.ok:
+            result = {"status": True, "error": None, "game": response.game}
+            self._cache.set(app_id, result)
+            dessly_tokens.accept(dessly_token)
+            return result
+
+        error = dessly_error(404 if response.http_status == 404 else response.error_code)
+        error.log()
+        result = {"status": False, "error": error.error, "games": None}
+        if not response.not_found:
+            return result
+
+        # Неизвестный app_id / неизвестная ошибка — кэшируем коротко и без окна stale
+        self.negative += 1
+        self._cache.set(app_id, result, ttl=self.negative_ttl, stale_ttl=0)
+        return result
+
+    async def get(self, app_id: str, dessly_token: str) -> Dict[str, Any]:
+        try:
+            await dessly_tokens.check(dessly_token)
+        except DesslyTokenError as e:
+            if e.error == "connection_error":
+                return {"status": False}
+            return {"status": False, "error": e.error, "games": None}
+
+        app_id = app_id.strip()
+        result, state = self._cache.lookup(app_id)
+        if state == FRESH:
+            return result
+        if state == STALE:
+            self._flight.start(app_id, lambda: self._fetch(app_id, dessly_token))
+            return result
+        return await self._flight.do(app_id, lambda: self._fetch(app_id, dessly_token))
+
+    def invalidate(self, app_id: Optional[str] = None):
+        if app_id is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(app_id.strip())
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._cache.stats(),
+            "negative_ttl": self.negative_ttl,
+            "fetches": self.fetches,
+            "negative": self.negative,
+            "errors": self.errors,
+            "singleflight": self._flight.stats(),
+        }
+
+
+games_catalog = GamesCatalog(
+    ttl=settings.GAMES_CACHE_TTL,
+    stale_ttl=settings.GAMES_STALE_TTL,
+    peek=settings.GAMES_PASSTHROUGH_PEEK,
+)
+game_details = GameDetailsCache(
+    maxsize=settings.GAME_CACHE_SIZE,
+    ttl=settings.GAME_CACHE_TTL,
+    negative_ttl=settings.GAME_NEGATIVE_TTL,
+    stale_ttl=settings.GAME_STALE_TTL,
+)
@@ -47,6 +47,103 @@ class Settings:
     OWNER = os.getenv("OWNER")
     REPO = os.getenv("REPO")
 
+    # Строка подключения к БД (по умолчанию — боевой MySQL из database.py)
+    DATABASE_URL = os.getenv("DATABASE_URL")
+
+    # Кэш API-токенов (секунды / количество записей)
+    TOKEN_CACHE_TTL = float(os.getenv("TOKEN_CACHE_TTL", 60))
+    TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+
+    # Период пересборки in-memory индекса whitelist (0 — только при изменениях)
+    WHITELIST_REFRESH_SECONDS = float(os.getenv("WHITELIST_REFRESH_SECONDS", 60))
+
+    # Фоновая запись аудита пачками
+    AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", 50000))
+    AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", 500))
+    AUDIT_FLUSH_INTERVAL = float(os.getenv("AUDIT_FLUSH_INTERVAL", 1.0))
+
+    # Dessly API
+    DESSLY_BASE_URL = os.getenv("DESSLY_BASE_URL", "https://desslyhub.com/api/v1")
+
+    # Общий пул HTTP-соединений к Dessly
+    HTTP_POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", 200))
+    HTTP_POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", 100))
+    HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 3))
+
+    # Кэш курсов валют Dessly: свежие / устаревшие, но ещё отдаваемые (секунды)
+    RATES_CACHE_TTL = float(os.getenv("RATES_CACHE_TTL", 60))
+    RATES_STALE_TTL = float(os.getenv("RATES_STALE_TTL", 600))
+
+    # Кэш каталога игр Steam Gift (секунды)
+    GAMES_CACHE_TTL = float(os.getenv("GAMES_CACHE_TTL", 300))
+    GAMES_STALE_TTL = float(os.getenv("GAMES_STALE_TTL", 3600))
+    # Каталог потоком из Dessly без разбора и кэша (true/false) и сколько байт начала ответа проверять на ошибку
+    GAMES_PASSTHROUGH = os.getenv("GAMES_PASSTHROUGH", "false").lower() in ("1", "true", "yes")
+    GAMES_PASSTHROUGH_PEEK = int(os.getenv("GAMES_PASSTHROUGH_PEEK", 4096))
+    # Каталог потоком: общего таймаута нет (тело дочитывается со скоростью клиента), только пауза между кусками (секунды)
+    GAMES_PASSTHROUGH_READ_TIMEOUT = float(os.getenv("GAMES_PASSTHROUGH_READ_TIMEOUT", 30))
+
+    # LRU-кэш данных игр по app_id (секунды / количество записей)
+    GAME_CACHE_SIZE = int(os.getenv("GAME_CACHE_SIZE", 5000))
+    GAME_CACHE_TTL = float(os.getenv("GAME_CACHE_TTL", 600))
+    GAME_NEGATIVE_TTL = float(os.getenv("GAME_NEGATIVE_TTL", 60))
+    GAME_STALE_TTL = float(os.getenv("GAME_STALE_TTL", 3600))
+
+    # Проверка Dessly-токена для общих кэшей: принятый / отклонённый / принятый при недоступном Dessly (секунды)
+    DESSLY_TOKEN_TTL = float(os.getenv("DESSLY_TOKEN_TTL", 300))
+    DESSLY_TOKEN_REJECT_TTL = float(os.getenv("DESSLY_TOKEN_REJECT_TTL", 30))
+    DESSLY_TOKEN_STALE_TTL = float(os.getenv("DESSLY_TOKEN_STALE_TTL", 3600))
+    DESSLY_TOKEN_CACHE_SIZE = int(os.getenv("DESSLY_TOKEN_CACHE_SIZE", 10000))
+
+    # Кэш баланса Dessly по токену (секунды, 0 — только объединение запросов)
+    BALANCE_CACHE_TTL = float(os.getenv("BALANCE_CACHE_TTL", 1.0))
+    BALANCE_CACHE_SIZE = int(os.getenv("BALANCE_CACHE_SIZE", 10000))
+
+    # Адаптивный лимит параллельных запросов к Dessly (AIMD)
+    UPSTREAM_LIMIT_INITIAL = float(os.getenv("UPSTREAM_LIMIT_INITIAL", 20))
+    UPSTREAM_LIMIT_MIN = float(os.getenv("UPSTREAM_LIMIT_MIN", 2))
+    UPSTREAM_LIMIT_MAX = float(os.getenv("UPSTREAM_LIMIT_MAX", 200))
+    UPSTREAM_LIMIT_BACKOFF = float(os.getenv("UPSTREAM_LIMIT_BACKOFF", 0.7))
+    UPSTREAM_LATENCY_TARGET = float(os.getenv("UPSTREAM_LATENCY_TARGET", 1.0))
+    UPSTREAM_QUEUE_SIZE = int(os.getenv("UPSTREAM_QUEUE_SIZE", 1000))
+    UPSTREAM_QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", 2.0))
+
+    # Circuit breaker для Dessly
+    BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", 50))
+    BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", 20))
+    BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", 0.5))
+    BREAKER_SLOW_RATE = float(os.getenv("BREAKER_SLOW_RATE", 0.8))
+    BREAKER_SLOW_CALL_SECONDS = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", 5.0))
+    BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", 10.0))
+    BREAKER_HALF_OPEN_PROBES = int(os.getenv("BREAKER_HALF_OPEN_PROBES", 3))
+
+    # Пакетная проверка логинов Steam: одновременных запросов к Dessly / логинов в пакете
+    CHECK_LOGIN_CONCURRENCY = int(os.getenv("CHECK_LOGIN_CONCURRENCY", 10))
+    CHECK_LOGIN_BATCH_MAX = int(os.getenv("CHECK_LOGIN_BATCH_MAX", 100))
+
+    # Асинхронные пополнения: воркеров (одновременных запросов) / длина очереди / хранение результата (секунды)
+    TOPUP_WORKERS = int(os.getenv("TOPUP_WORKERS", 8))
+    TOPUP_QUEUE_SIZE = int(os.getenv("TOPUP_QUEUE_SIZE", 1000))
+    TOPUP_JOB_TTL = float(os.getenv("TOPUP_JOB_TTL", 3600))
+    # Сколько секунд при остановке ждать, пока очередь пополнений опустеет
+    TOPUP_DRAIN_TIMEOUT = float(os.getenv("TOPUP_DRAIN_TIMEOUT", 30))
+
+    # Индекс недавних reference пополнений в памяти (количество / секунды)
+    LEDGER_INDEX_SIZE = int(os.getenv("LEDGER_INDEX_SIZE", 50000))
+    LEDGER_INDEX_TTL = float(os.getenv("LEDGER_INDEX_TTL", 86400))
+
+    # WebSocket: сколько сообщений с request_id одно соединение выполняет одновременно
+    WS_MAX_INFLIGHT = int(os.getenv("WS_MAX_INFLIGHT", 16))
+    # WebSocket: размер очереди исходящих кадров соединения
+    WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", 256))
+    # Медленный клиент: drop_oldest / coalesce / disconnect, код закрытия и таймауты (секунды)
+    WS_SLOW_POLICY = os.getenv("WS_SLOW_POLICY", "drop_oldest")
+    WS_SLOW_CLOSE_CODE = int(os.getenv("WS_SLOW_CLOSE_CODE", 4008))
+    WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", 10))
+    WS_WRITE_TIMEOUT = float(os.getenv("WS_WRITE_TIMEOUT", 10))
+    # Сколько последних изменений config.json хранится для догоняющих клиентов WS
+    CONFIG_HISTORY_SIZE = int(os.getenv("CONFIG_HISTORY_SIZE", 100))
+
 settings = Settings()
 
 
@@ -0,0 +1,122 @@
+"""
+Версии config.json для WebSocket-клиентов.
+
+При подключении клиент получает config_full — снимок конфига с номером версии.
+Каждое изменение через POST /config или /update/* увеличивает версию, и подписчики
+темы config получают config_delta только с изменёнными ключами:
+    {"type": "config_delta", "epoch", "from", "version", "set": {...}, "removed": [...]}
+Клиент применяет дельту, если from совпадает с его версией; иначе (или после
+переподключения) он просит изменения с своей версии: параметры подключения
+?config_epoch=..&config_version=.. или сообщение config/sync. Сервер отвечает
+одной объединённой дельтой, если последние CONFIG_HISTORY_SIZE изменений её
+покрывают, иначе — снимком.
+
+epoch меняется при каждом запуске процесса: версии разных процессов несравнимы.
+"""
+
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+import msgpack
+from app import config as app_config
+from app.config import settings
+from app.ws_manager import ws_manager
+from cl import logger
+
+
+class ConfigFeed:
+    def __init__(self, history_size: int = 100):
+        self.epoch = uuid.uuid4().hex[:12]
+        self.version = 1
+        self.snapshot: Dict[str, Any] = dict(app_config.config_cache)
+        # (версия после изменения, set, removed)
+        self.history: Deque[Tuple[int, Dict[str, Any], List[str]]] = deque(maxlen=history_size)
+        self._full_frame: Optional[bytes] = None
+
+    def full_frame(self) -> bytes:
+        """Упакованный снимок текущей версии (упаковывается один раз на версию)"""
+        if self._full_frame is None:
+            self._full_frame = msgpack.packb(
+                {
+                    "type": "config_full",
+                    "epoch": self.epoch,
+                    "version": self.version,
+                    "data": self.snapshot
+                },
+                use_bin_type=True
+            )
+        return self._full_frame
+
+    def _delta(self, from_version: int, changed: Dict[str, Any], removed: List[str]) -> dict:
+        return {
+            "type": "config_delta",
+            "epoch": self.epoch,
+            "from": from_version,
+            "version": self.version,
+            "set": changed,
+            "removed": removed
+        }
+
+    def since(self, epoch: Any, version: Any) -> Optional[dict]:
+        """Объединённая дельта от version до текущей; None — нужен снимок"""
+        if epoch != self.epoch or not isinstance(version, int) or version > self.version:
+            return None
+        if version == self.version:
+            return self._delta(version, {}, [])
+        if not self.history or self.history[0][0] > version + 1:
+            return None
+
+        changed: Dict[str, Any] = {}
+        removed: Dict[str, None] = {}
+        for entry_version, entry_set, entry_removed in self.history:
+            if entry_version <= version:
+                continue
+            for key, value in entry_set.items():
+                changed[key] = value
+                removed.pop(key, None)
+            for key in entry_removed:
+                changed.pop(key, None)
+                removed[key] = None
+        return self._delta(version, changed, list(removed))
+
+    def sync_frame(self, epoch: Any = None, version: Any = None) -> bytes:
+        """Ответ клиенту с известной ему версией: дельта, если возможно, иначе снимок"""
+        if version is not None:
+            delta = self.since(epoch, version)
+            if delta is not None:
+                return msgpack.packb(delta, use_bin_type=True)
+        return self.full_frame()
+
+    async def refresh(self) -> Optional[dict]:
+        """
+        Сравнивает кэш конфига (после load_config) с последней версией и,
+        если ключи изменились, публикует дельту подписчикам темы config.
+        """
+        current = dict(app_config.config_cache)
+        changed = {k: v for k, v in current.items() if k not in self.snapshot or self.snapshot[k] != v}
+        removed = [k for k in self.snapshot if k not in current]
+        if not changed and not removed:
+            return None
+
+        from_version = self.version
+        self.version += 1
+        self.snapshot = current
+        self.history.append((self.version, changed, removed))
+        self._full_frame = None
+
+        delta = self._delta(from_version, changed, removed)
+        await ws_manager.publish("config", delta)
+        logger.info(f"Config version {self.version}: {len(changed)} changed, {len(removed)} removed")
+        return delta
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "epoch": self.epoch,
+            "version": self.version,
+            "keys": len(self.snapshot),
+            "history": len(self.history),
+            "oldest": self.history[0][0] if self.history else None,
+        }
+
+
+config_feed = ConfigFeed(history_size=settings.CONFIG_HISTORY_SIZE)
@@ -0,0 +1,305 @@
+"""
+Клиент Dessly API — единственное место, где строятся запросы к Dessly.
+
+- базовый URL из настроек (DESSLY_BASE_URL), apikey в заголовке;
+- общий пул соединений (app/http_client.py) и защита dessly_guard (app/upstream.py);
+- ответы декодируются orjson (если установлен, иначе stdlib json) из байтов тела
+  в типизированные результаты;
+- коды ошибок Dessly разбираются по одной таблице DESSLY_ERRORS;
+- каждый запрос замеряется в upstream_metrics (app/upstream_metrics.py).
+
+Кэши (курсы, каталог, баланс), журнал пополнений и обработчики HTTP/WS
+ходят в Dessly только через dessly_client.
+"""
+
+import asyncio
+from contextlib import asynccontextmanager, AsyncExitStack
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import aiohttp
+from app.config import settings
+from app.http_client import get_http_session, dessly_timeout
+from app.upstream import dessly_guard
+from app.upstream_metrics import upstream_metrics, UpstreamCall
+from cl import logger
+
+try:
+    import orjson
+
+    def json_loads(data: bytes) -> Any:
+        return orjson.loads(data)
+
+    def json_dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+except ImportError:  # pragma: no cover - orjson необязателен
+    import json
+
+    def json_loads(data: bytes) -> Any:
+        return json.loads(data)
+
+    def json_dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+# ==============================
+# Коды ошибок Dessly
+# ==============================
+
+@dataclass(frozen=True, slots=True)
+class DesslyError:
+    code: Any
+    error: str      # код для ответа клиенту
+    message: str    # текст для лога
+    known: bool = True
+
+    def log(self, context: str = ""):
+        text = f"{self.message}: {context}" if context else self.message
+        if self.known:
+            logger.warning(text)
+        else:
+            logger.error(text)
+
+
+DESSLY_ERRORS: Dict[int, DesslyError] = {
+    -1: DesslyError(-1, "server_error", "Сервер не ответил"),
+    -2: DesslyError(-2, "insufficient_funds", "Недостаточно средств на балансе"),
+    -5: DesslyError(-5, "access_denied", "Доступ запрещен"),
+    -7: DesslyError(-7, "transaction_failed", "Пополнение не удалось: ошибка транзакции"),
+    -100: DesslyError(-100, "invalid_steam_username", "Неверное имя пользователя Steam"),
+}
+
+
+def dessly_error(code: Any) -> DesslyError:
+    error = DESSLY_ERRORS.get(code)
+    if error is None:
+        error = DesslyError(code, f"unknown_error_{code}", f"Неизвестная ошибка: {code}", known=False)
+    return error
+
+
+# ==============================
+# Типизированные ответы
+# ==============================
+
+@dataclass(frozen=True, slots=True)
+class BalanceResult:
+    http_status: int
+    balance: Any = None
+    error_code: Any = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error_code is None
+
+
+@dataclass(frozen=True, slots=True)
+class RatesResult:
+    http_status: int
+    rates: Optional[Dict[str, Any]] = None
+    error_code: Any = None
+
+    @property
+    def ok(self) -> bool:
+        return self.http_status == 200 and isinstance(self.rates, dict)
+
+
+@dataclass(frozen=True, slots=True)
+class CheckLoginResult:
+    http_status: int
+    can_refill: Any = None
+    error_code: Any = None
+
+    @property
+    def ok(self) -> bool:
+        return self.can_refill == True or self.error_code == 0
+
+
+@dataclass(frozen=True, slots=True)
+class TopupResult:
+    http_status: int
+    status: Any = None
+    transaction_id: Any = None
+    error_code: Any = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "pending" or self.error_code == 0 or self.transaction_id is not None
+
+
+@dataclass(frozen=True, slots=True)
+class GamesResult:
+    http_status: int
+    games: Optional[List[Any]] = None
+    error_code: Any = None
+
+    @property
+    def ok(self) -> bool:
+        return self.http_status == 200 and self.games is not None
+
+
+@dataclass(frozen=True, slots=True)
+class GameResult:
+    http_status: int
+    game: Any = None
+    error_code: Any = None
+
+    @property
+    def ok(self) -> bool:
+        return self.http_status == 200 and self.game is not None
+
+    @property
+    def not_found(self) -> bool:
+        """Ответ «такой игры нет», а не временная ошибка"""
+        return self.http_status == 404 or (
+            self.http_status == 200 and self.game is None and self.error_code not in (-1, -5)
+        )
+
+
+class DesslyStream:
+    """
+    Открытый ответ Dessly, тело которого читается кусками без разбора.
+    Слот dessly_guard занят до release() (или выхода из контекста): вызывающий код
+    освобождает его, когда проверил начало ответа, чтобы медленный клиент,
+    дочитывающий тело, не держал слот и не попадал в задержку Dessly.
+    """
+
+    def __init__(self, response: aiohttp.ClientResponse, metrics: UpstreamCall, slot: AsyncExitStack):
+        self.status = response.status
+        self._response = response
+        self._metrics = metrics
+        self._slot = slot
+
+    async def release(self):
+        await self._slot.aclose()
+
+    async def chunks(self, chunk_size: int = 65536) -> AsyncIterator[bytes]:
+        async for chunk in self._response.content.iter_chunked(chunk_size):
+            self._metrics.bytes_received += len(chunk)
+            yield chunk
+
+    def set_error_code(self, error_code: Any):
+        self._metrics.error_code = error_code
+
+
+# ==============================
+# Клиент
+# ==============================
+
+class DesslyClient:
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        endpoint: str,
+        apikey: str,
+        body: Optional[dict] = None,
+    ) -> Tuple[int, Dict[str, Any]]:
+        """
+        (HTTP-статус, JSON-объект ответа; {} для 404 и не-объектов).
+        Ответы 5xx/429 и неразбираемое тело учитываются dessly_guard как ошибки апстрима.
+        Бросает UpstreamUnavailable без запроса, если Dessly сейчас недоступен.
+        """
+        headers = {
+            "Content-Type": "application/json",
+            "apikey": apikey,
+        }
+        data = json_dumps(body) if body is not None else None
+
+        async with upstream_metrics.track("dessly", endpoint) as metrics, dessly_guard.slot() as call:
+            metrics.bytes_sent = len(data) if data else 0
+            session = get_http_session()
+            async with session.request(
+                method, self.base_url + path, headers=headers, data=data, timeout=dessly_timeout(endpoint)
+            ) as response:
+                status = metrics.status = response.status
+                if status >= 500 or status == 429:
+                    call["ok"] = False
+                if status == 404:
+                    return status, {}
+                raw = await response.read()
+            metrics.bytes_received = len(raw)
+            payload = json_loads(raw) if raw else {}
+            if not isinstance(payload, dict):
+                payload = {}
+            metrics.error_code = payload.get("error_code")
+
+        return status, payload
+
+    @asynccontextmanager
+    async def _stream(
+        self,
+        method: str,
+        path: str,
+        endpoint: str,
+        apikey: str,
+        timeout: aiohttp.ClientTimeout,
+    ) -> AsyncIterator[DesslyStream]:
+        """
+        Как _request, но тело не читается: слот dessly_guard занят до
+        DesslyStream.release() или выхода из контекста.
+        timeout — отдельный от endpoint: тело дочитывается со скоростью клиента.
+        Закрытие потока клиентом (GeneratorExit, отмена) ошибкой Dessly не считается.
+        """
+        headers = {"apikey": apikey}
+        async with upstream_metrics.track("dessly", endpoint) as metrics:
+            slot = AsyncExitStack()
+            call = await slot.enter_async_context(dessly_guard.slot())
+            try:
+                session = get_http_session()
+                async with session.request(
+                    method, self.base_url + path, headers=headers, timeout=timeout
+                ) as response:
+                    metrics.status = response.status
+                    if response.status >= 500 or response.status == 429:
+                        call["ok"] = False
+                    yield DesslyStream(response, metrics, slot)
+            except (GeneratorExit, asyncio.CancelledError):
+                if call["ok"]:
+                    call["ok"] = None
+                raise
+            except BaseException:
+                call["ok"] = False
+                raise
+            finally:
+                # Исход уже записан в call: исключение в слот не передаём
+                await slot.aclose()
+
+    async def balance(self, apikey: str) -> BalanceResult:
+        status, data = await self._request("GET", "/merchants/balance", "balance", apikey)
+        return BalanceResult(status, data.get("balance"), data.get("error_code"))
+
+    async def exchange_rates(self, apikey: str) -> RatesResult:
+        status, data = await self._request("GET", "/exchange_rates/steam", "rates", apikey)
+        return RatesResult(status, data.get("exchange_rates"), data.get("error_code"))
+
+    async def check_login(self, apikey: str, username: str, amount: Any) -> CheckLoginResult:
+        status, data = await self._request(
+            "POST", "/service/steamtopup/check_login", "check_login", apikey,
+            {"username": username, "amount": amount},
+        )
+        return CheckLoginResult(status, data.get("can_refill"), data.get("error_code"))
+
+    async def topup(self, apikey: str, username: str, amount: Any, reference: Optional[str] = None) -> TopupResult:
+        status, data = await self._request(
+            "POST", "/service/steamtopup/topup", "topup", apikey,
+            {"username": username, "amount": amount, "reference": reference},
+        )
+        return TopupResult(status, data.get("status"), data.get("transaction_id"), data.get("error_code"))
+
+    async def games(self, apikey: str) -> GamesResult:
+        status, data = await self._request("GET", "/service/steamgift/games", "games", apikey)
+        return GamesResult(status, data.get("games"), data.get("error_code"))
+
+    def games_stream(self, apikey: str):
+        """Каталог игр без разбора JSON: async with dessly_client.games_stream(key) as stream"""
+        return self._stream("GET", "/service/steamgift/games", "games", apikey, dessly_timeout("games_stream"))
+
+    async def game(self, apikey: str, app_id: str) -> GameResult:
+        status, data = await self._request("GET", f"/service/steamgift/games/{app_id}", "game", apikey)
+        return GameResult(status, data.get("game"), data.get("error_code"))
+
+
+dessly_client = DesslyClient(settings.DESSLY_BASE_URL)
@@ -0,0 +1,111 @@
+"""
+Проверка Dessly-токена для общих кэшей (курсы, каталог, данные игр).
+
+Кэши общие для всех токенов, поэтому без проверки токен, который Dessly
+отклонил бы (неверный или отозванный ключ мерчанта), получал бы данные из кэша.
+Токен проверяется запросом баланса (merchants/balance) и результат запоминается:
+принятый — на DESSLY_TOKEN_TTL, отклонённый — на DESSLY_TOKEN_REJECT_TTL.
+Успешная загрузка кэша с этим токеном тоже считается проверкой.
+
+Если Dessly недоступен, ранее принятый токен пропускается ещё
+DESSLY_TOKEN_STALE_TTL секунд (как устаревшие данные самих кэшей),
+а непроверенный получает ошибку.
+"""
+
+from typing import Any, Dict, Optional
+from app.cache import SingleFlight, TTLCache, FRESH, STALE
+from app.config import settings
+from app.dessly_client import dessly_client, dessly_error
+from app.upstream import UpstreamUnavailable
+from cl import logger
+
+
+class DesslyTokenError(Exception):
+    """
+    Токен не подтверждён: rejected — Dessly его отклонил (error — код ошибки Dessly),
+    иначе проверить не удалось (upstream_unavailable, connection_error, ...).
+    """
+
+    def __init__(self, error: str, rejected: bool):
+        super().__init__(error)
+        self.error = error
+        self.rejected = rejected
+
+
+class DesslyTokenCache:
+    def __init__(self, ttl: float = 300.0, reject_ttl: float = 30.0, stale_ttl: float = 3600.0, maxsize: int = 10000):
+        self.reject_ttl = reject_ttl
+        # токен -> None (принят) или код ошибки Dessly (отклонён)
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl, stale_ttl=stale_ttl)
+        self._flight = SingleFlight()
+
+        self.checks = 0
+        self.rejected = 0
+        self.errors = 0
+
+    def accept(self, dessly_token: str):
+        """Dessly только что ответил на запрос с этим токеном"""
+        self._cache.set(dessly_token, None)
+
+    async def _check(self, dessly_token: str) -> Optional[str]:
+        """None — принят, код ошибки — отклонён; DesslyTokenError — проверить не удалось"""
+        self.checks += 1
+        try:
+            result = await dessly_client.balance(dessly_token)
+        except UpstreamUnavailable as e:
+            self.errors += 1
+            logger.warning(f"Проверка Dessly-токена: {e}")
+            raise DesslyTokenError("upstream_unavailable", rejected=False) from e
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Ошибка проверки Dessly-токена: {e}")
+            raise DesslyTokenError("connection_error", rejected=False) from e
+
+        if result.http_status == 200 and result.ok:
+            self.accept(dessly_token)
+            return None
+
+        if result.http_status in (401, 403):
+            error = dessly_error(-5)
+        else:
+            error = dessly_error(result.error_code)
+        if not error.known or error.code == -1:
+            # Ответ ничего не говорит о токене — не запоминаем
+            self.errors += 1
+            logger.warning(f"Проверка Dessly-токена: неожиданный ответ {result}")
+            raise DesslyTokenError("connection_error", rejected=False)
+
+        self.rejected += 1
+        error.log("проверка токена")
+        self._cache.set(dessly_token, error.error, ttl=self.reject_ttl, stale_ttl=0)
+        return error.error
+
+    async def check(self, dessly_token: str):
+        """Пропускает токен, принятый Dessly; иначе бросает DesslyTokenError"""
+        error, state = self._cache.lookup(dessly_token)
+        if state == STALE:
+            # Ранее принятый токен: пропускаем, пока в фоне идёт перепроверка
+            self._flight.start(dessly_token, lambda: self._check(dessly_token))
+            return
+        if state != FRESH:
+            error = await self._flight.do(dessly_token, lambda: self._check(dessly_token))
+        if error is not None:
+            raise DesslyTokenError(error, rejected=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._cache.stats(),
+            "reject_ttl": self.reject_ttl,
+            "checks": self.checks,
+            "rejected": self.rejected,
+            "errors": self.errors,
+            "singleflight": self._flight.stats(),
+        }
+
+
+dessly_tokens = DesslyTokenCache(
+    ttl=settings.DESSLY_TOKEN_TTL,
+    reject_ttl=settings.DESSLY_TOKEN_REJECT_TTL,
+    stale_ttl=settings.DESSLY_TOKEN_STALE_TTL,
+    maxsize=settings.DESSLY_TOKEN_CACHE_SIZE,
+)
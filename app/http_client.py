@@ -0,0 +1,76 @@
+"""
+Общий HTTP-клиент (aiohttp) для запросов к Dessly.
+Одна ClientSession на процесс: keep-alive соединения, DNS-кэш и лимиты пула
+переиспользуются между запросами вместо нового TCP/TLS handshake на каждый вызов.
+Сессия создаётся в lifespan приложения (start_http_client) и закрывается при остановке.
+"""
+
+from typing import Optional
+import aiohttp
+from app.config import settings
+from cl import logger
+
+
+# Таймауты по эндпоинтам Dessly (секунды)
+DESSLY_TIMEOUTS = {
+    "default": aiohttp.ClientTimeout(total=10, connect=settings.HTTP_CONNECT_TIMEOUT),
+    "balance": aiohttp.ClientTimeout(total=5, connect=settings.HTTP_CONNECT_TIMEOUT),
+    "rates": aiohttp.ClientTimeout(total=5, connect=settings.HTTP_CONNECT_TIMEOUT),
+    "check_login": aiohttp.ClientTimeout(total=10, connect=settings.HTTP_CONNECT_TIMEOUT),
+    "topup": aiohttp.ClientTimeout(total=10, connect=settings.HTTP_CONNECT_TIMEOUT),
+    "games": aiohttp.ClientTimeout(total=15, connect=settings.HTTP_CONNECT_TIMEOUT),
+    "game": aiohttp.ClientTimeout(total=10, connect=settings.HTTP_CONNECT_TIMEOUT),
+    # Каталог потоком: тело читается со скоростью клиента, поэтому общего таймаута нет
+    "games_stream": aiohttp.ClientTimeout(
+        total=None,
+        connect=settings.HTTP_CONNECT_TIMEOUT,
+        sock_read=settings.GAMES_PASSTHROUGH_READ_TIMEOUT,
+    ),
+}
+
+_session: Optional[aiohttp.ClientSession] = None
+
+
+def dessly_timeout(endpoint: str) -> aiohttp.ClientTimeout:
+    return DESSLY_TIMEOUTS.get(endpoint, DESSLY_TIMEOUTS["default"])
+
+
+def _create_session() -> aiohttp.ClientSession:
+    connector = aiohttp.TCPConnector(
+        limit=settings.HTTP_POOL_LIMIT,
+        limit_per_host=settings.HTTP_POOL_LIMIT_PER_HOST,
+        ttl_dns_cache=300,
+        keepalive_timeout=30,
+        enable_cleanup_closed=True,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=DESSLY_TIMEOUTS["default"],
+        headers={"Content-Type": "application/json"},
+    )
+
+
+async def start_http_client():
+    global _session
+    if _session is None or _session.closed:
+        _session = _create_session()
+        logger.info(
+            f"HTTP client started (limit={settings.HTTP_POOL_LIMIT}, "
+            f"per_host={settings.HTTP_POOL_LIMIT_PER_HOST})"
+        )
+
+
+async def close_http_client():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+        logger.info("HTTP client closed")
+    _session = None
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Общая сессия. Если lifespan не запускался (скрипты, тесты) — создаётся лениво."""
+    global _session
+    if _session is None or _session.closed:
+        _session = _create_session()
+    return _session
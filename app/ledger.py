@@ -0,0 +1,210 @@
+"""
+Журнал пополнений Steam (таблица topup_ledger).
+Каждое пополнение, дошедшее до Dessly, записывается с reference, токеном,
+логином, суммой, transaction_id, статусом и временем ответа.
+
+Повторный reference того же пользователя возвращает сохранённый результат
+без запроса к Dessly: сначала ищется в индексе недавних reference в памяти,
+затем в таблице (уникальный ключ user_id + reference).
+
+Статусы: success, failed (Dessly ответил ошибкой — деньги не списаны) и
+unknown (таймаут, обрыв, 5xx, неизвестный код — пополнение могло пройти).
+unknown не считается окончательным: повтор с тем же reference снова уходит
+в Dessly (он тоже получает reference), а запись обновляется его результатом.
+
+reference привязан к логину и сумме первого запроса: повтор с другими
+параметрами получает ошибку reference_conflict, а не чужой результат.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, Optional, Tuple
+from sqlalchemy import select, func, case
+from sqlalchemy.exc import IntegrityError
+from app.cache import TTLCache
+from app.config import settings
+from app.database import AsyncSessionLocal, TopupLedger
+from cl import logger
+
+
+SUCCESS = "success"
+FAILED = "failed"
+UNKNOWN = "unknown"
+
+# Сумма пополнения строго меньше: колонка amount — Numeric(12, 2)
+AMOUNT_LIMIT = 10 ** 10
+
+
+def valid_amount(amount: Any) -> bool:
+    """Сумма пополнения помещается в журнал: число в (0, AMOUNT_LIMIT)"""
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)):
+        return False
+    return 0 < amount < AMOUNT_LIMIT
+
+
+def request_fields(username: str, amount: Any) -> Tuple[str, Decimal]:
+    """Логин и сумма так, как они хранятся в журнале (для сравнения повторов)"""
+    return username[:100], Decimal(str(amount)).quantize(Decimal("0.01"))
+
+
+@dataclass(frozen=True, slots=True)
+class ReferenceRecord:
+    """Записанное пополнение с reference: статус, результат в формате ответа topup() и параметры запроса"""
+
+    status: str
+    result: Dict[str, Any]
+    username: str
+    amount: Decimal
+
+    @property
+    def final(self) -> bool:
+        return self.status != UNKNOWN
+
+    def matches(self, username: str, amount: Any) -> bool:
+        return (self.username, self.amount) == request_fields(username, amount)
+
+
+# (user_id, reference) -> ReferenceRecord
+recent_references = TTLCache(maxsize=settings.LEDGER_INDEX_SIZE, ttl=settings.LEDGER_INDEX_TTL)
+
+
+def result_from_entry(entry: TopupLedger) -> Dict[str, Any]:
+    if entry.status == SUCCESS:
+        return {"status": True, "error": None, "transaction_id": entry.transaction_id}
+    return {"status": False, "error": entry.error}
+
+
+async def find_reference(user_id: int, reference: str) -> Optional[ReferenceRecord]:
+    """Записанное пополнение с этим reference или None"""
+    key = (user_id, reference)
+    record = recent_references.get(key)
+    if record is not None:
+        return record
+
+    async with AsyncSessionLocal() as session:
+        stmt = select(TopupLedger).where(
+            TopupLedger.user_id == user_id,
+            TopupLedger.reference == reference,
+        )
+        entry = (await session.execute(stmt)).scalar_one_or_none()
+
+    if entry is None:
+        return None
+
+    record = ReferenceRecord(entry.status, result_from_entry(entry), *request_fields(entry.username, entry.amount))
+    recent_references.set(key, record)
+    return record
+
+
+async def record_topup(
+    user_id: int,
+    api_token_id: Optional[int],
+    reference: Optional[str],
+    username: str,
+    amount: float,
+    result: Dict[str, Any],
+    status: str,
+    latency: float,
+):
+    """
+    Записывает пополнение в журнал и индекс reference.
+    Запись со статусом unknown с тем же reference перезаписывается (повтор после таймаута).
+    """
+    transaction_id = result.get("transaction_id")
+    stored_username, stored_amount = request_fields(username, amount)
+    fields = dict(
+        api_token_id=api_token_id,
+        username=stored_username,
+        amount=stored_amount,
+        status=status,
+        error=result.get("error"),
+        transaction_id=str(transaction_id) if transaction_id is not None else None,
+        latency_ms=int(latency * 1000),
+    )
+
+    if reference is not None:
+        recent_references.set(
+            (user_id, reference),
+            ReferenceRecord(status, dict(result), stored_username, stored_amount),
+        )
+
+    try:
+        async with AsyncSessionLocal() as session:
+            existing = None
+            if reference is not None:
+                stmt = select(TopupLedger).where(
+                    TopupLedger.user_id == user_id,
+                    TopupLedger.reference == reference,
+                )
+                existing = (await session.execute(stmt)).scalar_one_or_none()
+
+            if existing is None:
+                session.add(TopupLedger(user_id=user_id, reference=reference, **fields))
+            elif existing.status == UNKNOWN:
+                for name, value in fields.items():
+                    setattr(existing, name, value)
+            else:
+                logger.warning(f"Topup ledger: reference {reference!r} for user_id={user_id} already final ({existing.status})")
+                return
+            await session.commit()
+    except IntegrityError:
+        # Тот же reference уже записан другим процессом
+        logger.warning(f"Topup ledger: duplicate reference {reference!r} for user_id={user_id}")
+    except Exception as e:
+        logger.error(f"Topup ledger write failed (reference={reference!r}, result={result}): {e}")
+
+
+async def spend_summary(
+    db,
+    user_id: int,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """Сводка пополнений пользователя за период (индекс user_id + created_at)"""
+    conditions = [TopupLedger.user_id == user_id]
+    if since is not None:
+        conditions.append(TopupLedger.created_at >= since)
+    if until is not None:
+        conditions.append(TopupLedger.created_at < until)
+
+    success = TopupLedger.status == SUCCESS
+    unknown = TopupLedger.status == UNKNOWN
+    day = func.date(TopupLedger.created_at)
+
+    totals = (await db.execute(
+        select(
+            func.count(TopupLedger.id),
+            func.sum(case((success, 1), else_=0)),
+            func.sum(case((success, TopupLedger.amount), else_=0)),
+            func.sum(case((unknown, 1), else_=0)),
+        ).where(*conditions)
+    )).one()
+
+    by_day = (await db.execute(
+        select(
+            day,
+            func.count(TopupLedger.id),
+            func.sum(case((success, TopupLedger.amount), else_=0)),
+        )
+        .where(*conditions)
+        .group_by(day)
+        .order_by(day)
+    )).all()
+
+    topups, successful, spent, unknown_count = totals
+    return {
+        "topups": topups or 0,
+        "successful": int(successful or 0),
+        "failed": (topups or 0) - int(successful or 0) - int(unknown_count or 0),
+        "unknown": int(unknown_count or 0),
+        "total_amount": str(Decimal(str(spent or 0)).quantize(Decimal("0.01"))),
+        "by_day": [
+            {
+                "date": str(d),
+                "topups": count,
+                "total_amount": str(Decimal(str(amount or 0)).quantize(Decimal("0.01"))),
+            }
+            for d, count, amount in by_day
+        ],
+    }
@@ -5,7 +5,7 @@
 """
 
 from fastapi import FastAPI
-from fastapi import Depends, Header, Request
+from fastapi import Depends, Header, Request, HTTPException
 from typing import Optional
 
 from slowapi import Limiter, _rate_limit_exceeded_handler
@@ -19,20 +19,24 @@ from sqlalchemy.orm import Session
 from contextlib import asynccontextmanager
 from app.auth import (
     require_access_level, 
-    get_api_token_from_header, 
-    create_audit_record
+    get_current_user_or_api_token,
 )
 from app.database import init_db, close_db
+from app.whitelist_index import reload_whitelist, whitelist_refresh_loop
+from app.audit import audit_sink
+from app.http_client import start_http_client, close_http_client
+from app.topup import topup_queue
 from fastapi.staticfiles import StaticFiles
 from cl import logger
-import time, json
+import time, json, asyncio
 from app.config import CONFIG_PATH, load_config, config_cache
 import collections
 
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import text
 
-from app.ws_manager import WebSocketManager
+from app.ws_manager import ws_manager
+from app.config_feed import config_feed
 from app.ws.router import websocket_endpoint
 from fastapi import Header
 import msgpack
@@ -41,16 +45,25 @@ import msgpack
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_db()
+    await reload_whitelist()
+    whitelist_task = asyncio.create_task(whitelist_refresh_loop())
+    audit_sink.start()
+    await start_http_client()
+    topup_queue.start()
     yield
+    whitelist_task.cancel()
+    await topup_queue.stop()
+    await close_http_client()
+    await audit_sink.stop()
     await close_db()
 
 # Отключаем автогенерацию docs
-app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
+app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None, lifespan=lifespan)
 
 limiter = Limiter(key_func=get_remote_address)
 app.state.limiter = limiter
 
-app.mount("/static", StaticFiles(directory="app/static"), name="static")#, lifespan=lifespan)
+app.mount("/static", StaticFiles(directory="app/static"), name="static")
 logger.info("FastAPI application initialized (API-only mode)")
 
 def custom_openapi():
@@ -78,7 +91,6 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-ws_manager = WebSocketManager()
 
 def unpack(data: bytes) -> dict:
     return msgpack.unpackb(data, raw=False)
@@ -144,15 +156,15 @@ async def health_check(request: Request, db: AsyncSession = Depends(get_db)):
     description="Читает и возвращает текущий конфиг из config.json.",
     tags=["Config"])
 @limiter.limit("100/minute")
-async def get_config(authorization: Optional[str] = Header(None), request: Request = None, db: Session = Depends(get_db)):
+async def get_config(request: Request, auth_data=Depends(get_current_user_or_api_token)):
     """
     Читает и возвращает текущий конфиг из config.json.
     Доступ: уровень 2+
     """
 
-    token = get_api_token_from_header(authorization, db)
-    require_access_level(token, min_level=2)
-    create_audit_record(db, request, token)
+    if auth_data["type"] != "api_token":
+        raise HTTPException(status_code=400, detail="Use API token for this endpoint")
+    require_access_level(auth_data["token_obj"], min_level=2)
 
     load_config()  # Обновляем кэш перед чтением
     return config_cache
@@ -163,15 +175,15 @@ async def get_config(authorization: Optional[str] = Header(None), request: Reque
     description="Обновляет настройку в config.json по ключу и значению. Принимает JSON: {\"key\": \"whitelist_enabled\", \"value\": false}.",
     tags=["Config"])
 @limiter.limit("100/minute")
-async def update_config(data: dict, authorization: Optional[str] = Header(None), request: Request = None, db: Session = Depends(get_db)):
+async def update_config(data: dict, request: Request, auth_data=Depends(get_current_user_or_api_token)):
     """
     Обновляет настройку в config.json по ключу и значению.
     Доступ: уровень 2+
     """
 
-    token = get_api_token_from_header(authorization, db)
-    require_access_level(token, min_level=2)
-    create_audit_record(db, request, token)
+    if auth_data["type"] != "api_token":
+        raise HTTPException(status_code=400, detail="Use API token for this endpoint")
+    require_access_level(auth_data["token_obj"], min_level=2)
 
     if "key" not in data or "value" not in data:
         return {"error": "Required fields: key and value"}
@@ -190,6 +202,7 @@ async def update_config(data: dict, authorization: Optional[str] = Header(None),
         
         load_config()  # Обновляем кэш после записи
         logger.info(f"Config updated: {key} = {value}")
+        await config_feed.refresh()
         return {"message": f"Updated {key} to {value}", "config": config_cache}
     except FileNotFoundError:
         logger.warning("config.json not found, creating new")
@@ -197,6 +210,7 @@ async def update_config(data: dict, authorization: Optional[str] = Header(None),
         with open(CONFIG_PATH, "w", encoding="utf-8") as f:
             json.dump(config, f, indent=4, ensure_ascii=False)
         load_config()
+        await config_feed.refresh()
         return {"message": f"Created config with {key} = {value}", "config": config_cache}
     except json.JSONDecodeError:
         logger.error("Invalid JSON in config.json")
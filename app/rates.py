@@ -0,0 +1,291 @@
+"""
+Кэш курсов валют Dessly (exchange_rates/steam) и конвертация по ним.
+Курсы меняются редко, поэтому таблица хранится в памяти:
+- моложе RATES_CACHE_TTL — отдаётся сразу;
+- моложе RATES_CACHE_TTL + RATES_STALE_TTL — отдаётся сразу, а в фоне запускается обновление;
+- старше или пусто — запрос ждёт загрузку.
+Одновременные загрузки схлопываются в один запрос к Dessly (SingleFlight).
+
+При загрузке строится RatesTable: все валюты, которые вернул Dessly, с курсом
+в виде точной дроби целых чисел. Валюта задаётся кодом ISO (по id валют Steam)
+или самим id. convert() считает только в целых числах, без запросов к Dessly
+и без новых Decimal на каждый вызов, поэтому пакет конвертаций стоит одно
+чтение таблицы.
+
+Если курсы после загрузки изменились, они публикуются подписчикам WS-темы rates.
+Таблица общая для всех токенов, поэтому токен запроса сначала проверяется
+(app/dessly_tokens.py): отклонённый Dessly токен курсов не получает.
+"""
+
+import time
+from dataclasses import dataclass
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Optional
+from app.cache import SingleFlight
+from app.config import settings
+from app.dessly_client import dessly_client
+from app.dessly_tokens import dessly_tokens, DesslyTokenError
+from app.upstream import UpstreamUnavailable
+from app.ws_manager import ws_manager
+from cl import logger
+
+
+# Код валюты -> id валюты Steam (ключи таблицы курсов Dessly)
+STEAM_CURRENCIES = {
+    "USD": 1, "GBP": 2, "EUR": 3, "CHF": 4, "RUB": 5, "PLN": 6, "BRL": 7, "JPY": 8,
+    "NOK": 9, "IDR": 10, "MYR": 11, "PHP": 12, "SGD": 13, "THB": 14, "VND": 15, "KRW": 16,
+    "TRY": 17, "UAH": 18, "MXN": 19, "CAD": 20, "AUD": 21, "NZD": 22, "CNY": 23, "INR": 24,
+    "CLP": 25, "PEN": 26, "COP": 27, "ZAR": 28, "HKD": 29, "TWD": 30, "SAR": 31, "AED": 32,
+    "ARS": 34, "ILS": 35, "KZT": 37, "KWD": 38, "QAR": 39, "CRC": 40, "UYU": 41,
+}
+
+# Исторические привязки, которые клиенты уже используют: USD всегда считался по курсу id 5
+LEGACY_CURRENCIES = {
+    "USD": 5,
+}
+
+# Предел порядка суммы (Decimal.adjusted): дальше — не деньги, а числа,
+# которые не переводятся в строку и раздувают целочисленный расчёт
+AMOUNT_MAX_EXPONENT = 30
+
+class RatesUnavailable(Exception):
+    """Не удалось получить курсы от Dessly, а кэш пуст или слишком старый"""
+
+    def __init__(self, message: str, status_code: int = 502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ConversionError(Exception):
+    """Конвертация невозможна (code — машинный код, message — текст для HTTP-ответа)"""
+
+    def __init__(self, code: str, message: str):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+@dataclass(frozen=True, slots=True)
+class Rate:
+    """Курс валюты как точная дробь numerator / denominator"""
+
+    currency_id: str
+    numerator: int
+    denominator: int
+
+
+class RatesTable:
+    """Курсы одной загрузки: по id валюты и по коду (ISO, затем прежние привязки)"""
+
+    def __init__(self, rates: Dict[str, Rate]):
+        self.by_id = rates
+        self.by_code: Dict[str, Rate] = {}
+        for code, currency_id in STEAM_CURRENCIES.items():
+            rate = rates.get(str(currency_id))
+            if rate is not None:
+                self.by_code[code] = rate
+        for code, currency_id in LEGACY_CURRENCIES.items():
+            rate = rates.get(str(currency_id))
+            if rate is not None:
+                self.by_code[code] = rate
+            else:
+                self.by_code.pop(code, None)
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def get(self, currency: Any) -> Rate:
+        rate = self.by_code.get(currency)
+        if rate is not None:
+            return rate
+        if currency in STEAM_CURRENCIES or currency in LEGACY_CURRENCIES:
+            raise ConversionError("rate_missing", "Currency ID not found in rates.")
+        rate = self.by_id.get(str(currency)) if isinstance(currency, (str, int)) else None
+        if rate is None:
+            raise ConversionError("unsupported_currency", "Unsupported currency.")
+        return rate
+
+    def currencies(self) -> Dict[str, str]:
+        """Код (или id, если кода нет) -> id валюты"""
+        known = {rate.currency_id for rate in self.by_code.values()}
+        result = {code: rate.currency_id for code, rate in self.by_code.items()}
+        for currency_id in self.by_id:
+            if currency_id not in known:
+                result[currency_id] = currency_id
+        return result
+
+
+def parse_rate(currency_id: str, value: Any) -> Optional[Rate]:
+    """Курс из ответа Dessly в точную дробь; None, если курс некорректен"""
+    try:
+        rate = Decimal(str(value))
+    except InvalidOperation:
+        return None
+    if not rate.is_finite() or rate <= 0:
+        return None
+    numerator, denominator = rate.as_integer_ratio()
+    return Rate(currency_id, numerator, denominator)
+
+
+def _div_down(numerator: int, denominator: int) -> int:
+    """Деление с отбрасыванием дробной части (к нулю), denominator > 0"""
+    if numerator >= 0:
+        return numerator // denominator
+    return -(-numerator // denominator)
+
+
+def format_cents(cents: int) -> str:
+    sign = "-" if cents < 0 else ""
+    units, rest = divmod(abs(cents), 100)
+    return f"{sign}{units}.{rest:02d}"
+
+
+def convert(rates: RatesTable, amount: Decimal, currency: Any, convert_to_rub: bool = False) -> Dict[str, Any]:
+    """
+    Конвертация суммы по таблице курсов (в целых числах, с точностью до копеек/центов).
+    В USD: amount / rate, обрезка до двух знаков и +0.01.
+    convert_to_rub: amount считается в USD и умножается на курс RUB (обрезка до двух знаков).
+    """
+    rate = rates.get(currency)
+
+    if not amount.is_finite():
+        raise ConversionError("invalid_input", "Invalid amount.")
+    if amount and abs(amount.adjusted()) > AMOUNT_MAX_EXPONENT:
+        raise ConversionError("invalid_input", "Invalid amount.")
+    amount_num, amount_den = amount.as_integer_ratio()
+
+    if convert_to_rub:
+        rub_rate = rates.by_code.get("RUB")
+        if rub_rate is None:
+            raise ConversionError("rub_rate_missing", "RUB rate missing.")
+
+        # USD → RUB: умножаем
+        cents = _div_down(100 * amount_num * rub_rate.numerator, amount_den * rub_rate.denominator)
+        return {
+            "original_amount_usd": str(amount),
+            "converted_amount_rub": format_cents(cents),
+        }
+
+    # Обрезаем до двух знаков без округления и добавляем 0.01
+    cents = _div_down(100 * amount_num * rate.denominator, amount_den * rate.numerator) + 1
+    return {
+        "original_amount": str(amount),
+        "original_currency": currency,
+        "converted_amount_usd": format_cents(cents),
+    }
+
+
+class RatesCache:
+    """Таблица курсов одна на все токены: курсы Steam у Dessly общие"""
+
+    def __init__(self, ttl: float = 60.0, stale_ttl: float = 600.0):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+
+        self._rates: Optional[RatesTable] = None
+        self._raw: Dict[str, str] = {}
+        self._fetched_at = 0.0
+        self._flight = SingleFlight()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.fetches = 0
+        self.errors = 0
+
+    def _age(self) -> float:
+        return time.monotonic() - self._fetched_at
+
+    async def _fetch(self, dessly_token: str) -> RatesTable:
+        self.fetches += 1
+        try:
+            result = await dessly_client.exchange_rates(dessly_token)
+        except UpstreamUnavailable as e:
+            self.errors += 1
+            raise RatesUnavailable("Dessly API temporarily unavailable", 503) from e
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Dessly exchange rates error: {e}")
+            raise RatesUnavailable("Error fetching exchange rates from Dessly API") from e
+
+        if result.http_status != 200:
+            self.errors += 1
+            raise RatesUnavailable("Error fetching exchange rates from Dessly API", result.http_status)
+
+        if not result.ok:
+            self.errors += 1
+            logger.warning(f"Unexpected exchange rates response: {result}")
+            raise RatesUnavailable("Invalid exchange rates response from Dessly API")
+
+        parsed: Dict[str, Rate] = {}
+        raw: Dict[str, str] = {}
+        for currency_id, value in result.rates.items():
+            rate = parse_rate(str(currency_id), value)
+            if rate is None:
+                logger.warning(f"Invalid exchange rate skipped: {currency_id}={value}")
+                continue
+            parsed[rate.currency_id] = rate
+            raw[rate.currency_id] = str(value)
+
+        table = RatesTable(parsed)
+        dessly_tokens.accept(dessly_token)
+        changed = raw != self._raw
+        self._rates = table
+        self._raw = raw
+        self._fetched_at = time.monotonic()
+        logger.info(f"Dessly exchange rates refreshed: {len(table)} currencies")
+
+        if changed:
+            await ws_manager.publish("rates", {
+                "type": "rates",
+                "rates": raw,
+                "currencies": table.currencies()
+            })
+        return table
+
+    async def get(self, dessly_token: str) -> RatesTable:
+        """Таблица курсов последней загрузки"""
+        try:
+            await dessly_tokens.check(dessly_token)
+        except DesslyTokenError as e:
+            if e.rejected:
+                raise RatesUnavailable(f"Dessly token rejected: {e.error}", 403) from e
+            if e.error == "upstream_unavailable":
+                raise RatesUnavailable("Dessly API temporarily unavailable", 503) from e
+            raise RatesUnavailable("Error fetching exchange rates from Dessly API") from e
+
+        if self._rates is not None:
+            age = self._age()
+            if age < self.ttl:
+                self.hits += 1
+                return self._rates
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._flight.start("rates", lambda: self._fetch(dessly_token))
+                return self._rates
+
+        self.misses += 1
+        return await self._flight.do("rates", lambda: self._fetch(dessly_token))
+
+    def invalidate(self):
+        self._rates = None
+        self._raw = {}
+        self._fetched_at = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "cached": self._rates is not None,
+            "currencies": len(self._rates) if self._rates is not None else 0,
+            "age": round(self._age(), 3) if self._rates is not None else None,
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "fetches": self.fetches,
+            "errors": self.errors,
+            "singleflight": self._flight.stats(),
+        }
+
+
+rates_cache = RatesCache(ttl=settings.RATES_CACHE_TTL, stale_ttl=settings.RATES_STALE_TTL)
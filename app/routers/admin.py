@@ -173,6 +173,7 @@ from fastapi.responses import RedirectResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
+from sqlalchemy.orm import joinedload
 from app.dependencies import get_db
 from app.database import APIToken
 from cl import logger
@@ -198,7 +199,7 @@ async def admin_login(
     """Проверка API-токена и вход"""
     
     # Ищем токен ASYNC
-    stmt = select(APIToken).where(APIToken.key == token)
+    stmt = select(APIToken).options(joinedload(APIToken.user)).where(APIToken.key == token)
     result = await db.execute(stmt)
     token_obj = result.scalar_one_or_none()
 
@@ -229,7 +230,7 @@ async def admin_index(request: Request, db: AsyncSession = Depends(get_db)):
     if not token:
         return RedirectResponse("/admin/login")
 
-    stmt = select(APIToken).where(APIToken.key == token)
+    stmt = select(APIToken).options(joinedload(APIToken.user)).where(APIToken.key == token)
     result = await db.execute(stmt)
     token_obj = result.scalar_one_or_none()
     
@@ -254,7 +255,7 @@ async def admin_tokens(request: Request, db: AsyncSession = Depends(get_db)):
     if not token:
         return RedirectResponse("/admin/login")
 
-    stmt = select(APIToken).where(APIToken.key == token)
+    stmt = select(APIToken).options(joinedload(APIToken.user)).where(APIToken.key == token)
     result = await db.execute(stmt)
     token_obj = result.scalar_one_or_none()
     
@@ -279,7 +280,7 @@ async def admin_news(request: Request, db: AsyncSession = Depends(get_db)):
     if not token:
         return RedirectResponse("/admin/login")
 
-    stmt = select(APIToken).where(APIToken.key == token)
+    stmt = select(APIToken).options(joinedload(APIToken.user)).where(APIToken.key == token)
     result = await db.execute(stmt)
     token_obj = result.scalar_one_or_none()
     
@@ -304,7 +305,7 @@ async def admin_update(request: Request, db: AsyncSession = Depends(get_db)):
     if not token:
         return RedirectResponse("/admin/login")
 
-    stmt = select(APIToken).where(APIToken.key == token)
+    stmt = select(APIToken).options(joinedload(APIToken.user)).where(APIToken.key == token)
     result = await db.execute(stmt)
     token_obj = result.scalar_one_or_none()
     
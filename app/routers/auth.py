@@ -483,14 +483,24 @@
 Роутер авторизации (ASYNC версия)
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Header, Request, Query
+from fastapi import APIRouter, Depends, HTTPException, Request, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import select, update
+from sqlalchemy.orm import selectinload
 from pydantic import BaseModel
 from typing import Optional, List
 from cl import logger
-from app.auth import get_current_user_or_api_token, generate_api_token, require_access_level, create_audit_record
-from app.database import APIToken, User
+from app.auth import (
+    get_current_user_or_api_token,
+    generate_api_token,
+    require_access_level,
+    invalidate_token,
+    invalidate_user_tokens,
+    token_cache,
+)
+from app.audit import audit_sink
+from app.upstream import dessly_guard
+from app.database import APIToken, User, RequestAudit, TopupLedger
 from app.dependencies import search_users as search_users_query, get_db
 
 
@@ -557,22 +567,18 @@ class UserUpdateRequest(BaseModel):
 @router.get("/check", response_model=TokenInfoResponse)
 async def check_token(
     request: Request,
-    authorization: Optional[str] = Header(None),
+    auth_data=Depends(get_current_user_or_api_token),
     db: AsyncSession = Depends(get_db)
 ):
     """Проверка валидности токена"""
 
-    auth_data = await get_current_user_or_api_token(request, db)
-    
     if auth_data["type"] == "admin":
         raise HTTPException(status_code=400, detail="Use API token for this endpoint")
     
     token = auth_data["token_obj"]
     
-    await create_audit_record(db, request, token)
-    
     return TokenInfoResponse(
-        username=token.user.username,
+        username=token.username,
         token_name=token.name,
         access_level=token.access_level,
         description=token.description,
@@ -583,16 +589,14 @@ async def check_token(
 async def register_user(
     request_data: UserRegisterRequest,
     request: Request,
-    authorization: Optional[str] = Header(None),
+    auth_data=Depends(get_current_user_or_api_token),
     db: AsyncSession = Depends(get_db)
 ):
     """Регистрация нового пользователя"""
-    auth_data = await get_current_user_or_api_token(request, db)
     if auth_data["type"] == "admin":
         raise HTTPException(status_code=400, detail="Use API token for this endpoint")
     token = auth_data["token_obj"]
     require_access_level(token, 1)
-    await create_audit_record(db, request, token)
 
     stmt = select(User).where(User.username == request_data.username)
     result = await db.execute(stmt)
@@ -605,7 +609,7 @@ async def register_user(
     db.add(new_user)
     await db.commit()
     await db.refresh(new_user)
-    logger.info(f"{token.user.username} создал пользователя: {new_user.username}")
+    logger.info(f"{token.username} создал пользователя: {new_user.username}")
 
     return UserRegisterResponse(username=new_user.username, uuid=new_user.uuid)
 
@@ -613,16 +617,14 @@ async def register_user(
 @router.get("/levels", response_model=list)
 async def list_access_levels(
     request: Request, 
-    authorization: Optional[str] = Header(None), 
+    auth_data=Depends(get_current_user_or_api_token),
     db: AsyncSession = Depends(get_db)
 ):
     """Описание уровней доступа"""
-    auth_data = await get_current_user_or_api_token(request, db)
     if auth_data["type"] == "admin":
         raise HTTPException(status_code=400, detail="Use API token for this endpoint")
     token = auth_data["token_obj"]
     require_access_level(token, 2)
-    await create_audit_record(db, request, token)
 
     return [
         {"access_level": 0, "description": "Только чтение (с whitelist)"},
@@ -636,16 +638,14 @@ async def list_users(
     request: Request,
     offset: int = Query(0, ge=0),
     limit: int = Query(1000, le=1000),
-    authorization: Optional[str] = Header(None),
+    auth_data=Depends(get_current_user_or_api_token),
     db: AsyncSession = Depends(get_db)
 ):
     """Список пользователей"""
-    auth_data = await get_current_user_or_api_token(request, db)
     if auth_data["type"] == "admin":
         raise HTTPException(status_code=400, detail="Use API token for this endpoint")
     token = auth_data["token_obj"]
     require_access_level(token, 1)
-    await create_audit_record(db, request, token)
 
     stmt = select(User).offset(offset).limit(limit)
     result = await db.execute(stmt)
@@ -658,18 +658,20 @@ async def list_users(
 async def get_user_by_uuid(
     request: Request,
     user_uuid: str,
-    authorization: Optional[str] = Header(None),
+    auth_data=Depends(get_current_user_or_api_token),
     db: AsyncSession = Depends(get_db)
 ):
     """Информация о пользователе"""
-    auth_data = await get_current_user_or_api_token(request, db)
     if auth_data["type"] == "admin":
         raise HTTPException(status_code=400, detail="Use API token for this endpoint")
     token = auth_data["token_obj"]
     require_access_level(token, 1)
-    await create_audit_record(db, request, token)
 
-    stmt = select(User).where(User.uuid == user_uuid)
+    stmt = (
+        select(User)
+        .options(selectinload(User.api_tokens))
+        .where(User.uuid == user_uuid)
+    )
     result = await db.execute(stmt)
     user = result.scalar_one_or_none()
     
@@ -700,16 +702,14 @@ async def get_user_by_uuid(
 async def search_users(
     request: Request,
     q: str,
-    authorization: Optional[str] = Header(None),
+    auth_data=Depends(get_current_user_or_api_token),
     db: AsyncSession = Depends(get_db)
 ):
     """Поиск пользователя"""
-    auth_data = await get_current_user_or_api_token(request, db)
     if auth_data["type"] == "admin":
         raise HTTPException(status_code=400, detail="Use API token for this endpoint")
     token = auth_data["token_obj"]
     require_access_level(token, 1)
-    await create_audit_record(db, request, token)
 
     if len(q.strip()) < 2:
         return []
@@ -727,16 +727,14 @@ async def create_token_for_user(
     request: Request,
     user_uuid: str,
     token_data: APITokenCreateRequest,
-    authorization: Optional[str] = Header(None),
+    auth_data=Depends(get_current_user_or_api_token),
     db: AsyncSession = Depends(get_db)
 ):
     """Создание токена"""
-    auth_data = await get_current_user_or_api_token(request, db)
     if auth_data["type"] == "admin":
         raise HTTPException(status_code=400, detail="Use API token for this endpoint")
     token = auth_data["token_obj"]
     require_access_level(token, 1)
-    await create_audit_record(db, request, token)
 
     stmt = select(User).where(User.uuid == user_uuid)
     result = await db.execute(stmt)
@@ -757,9 +755,10 @@ async def create_token_for_user(
         user_id=user.id,
         access_level=access_level
     )
+    invalidate_token(new_token_info["token"])
 
     logger.info(
-        f"{token.user.username} создал токен '{token_data.name}' "
+        f"{token.username} создал токен '{token_data.name}' "
         f"для {user.username} с уровнем {access_level}"
     )
 
@@ -776,16 +775,14 @@ async def create_token_for_user(
 async def get_token_data(
     request: Request,
     token_uuid: str,
-    authorization: Optional[str] = Header(None),
+    auth_data=Depends(get_current_user_or_api_token),
     db: AsyncSession = Depends(get_db)
 ):
     """Информация о токене"""
-    auth_data = await get_current_user_or_api_token(request, db)
     if auth_data["type"] == "admin":
         raise HTTPException(status_code=400, detail="Use API token for this endpoint")
     requester_token = auth_data["token_obj"]
     require_access_level(requester_token, 1)
-    await create_audit_record(db, request, requester_token)
 
     stmt = select(APIToken).where(APIToken.uuid == token_uuid)
     result = await db.execute(stmt)
@@ -810,11 +807,10 @@ async def get_token_data(
 async def delete_token(
     request: Request,
     token_uuid: str,
-    authorization: Optional[str] = Header(None),
+    auth_data=Depends(get_current_user_or_api_token),
     db: AsyncSession = Depends(get_db)
 ):
     """Удаление токена"""
-    auth_data = await get_current_user_or_api_token(request, db)
     if auth_data["type"] == "admin":
         raise HTTPException(status_code=400, detail="Use API token for this endpoint")
     
@@ -832,11 +828,25 @@ async def delete_token(
     
     require_access_level(requester_token, 1)
 
-    logger.info(f"{requester_token.user.username} удаляет токен: {token_uuid}")
+    logger.info(f"{requester_token.username} удаляет токен: {token_uuid}")
 
+    # Отвязываем историю аудита одним UPDATE, не загружая её в память.
+    # Сначала дописываем буфер аудита, чтобы не осталось записей на удалённый токен.
+    await audit_sink.flush()
+    await db.execute(
+        update(RequestAudit)
+        .where(RequestAudit.api_token_id == token_to_delete.id)
+        .values(api_token_id=None)
+    )
+    await db.execute(
+        update(TopupLedger)
+        .where(TopupLedger.api_token_id == token_to_delete.id)
+        .values(api_token_id=None)
+    )
     await db.delete(token_to_delete)
     await db.commit()
-    logger.info(f"{requester_token.user.username} удалил токен '{token_to_delete.name}'")
+    invalidate_token(token_to_delete.key)
+    logger.info(f"{requester_token.username} удалил токен '{token_to_delete.name}'")
     return
 
 
@@ -845,18 +855,15 @@ async def update_token(
     request: Request,
     token_uuid: str,
     token_data: APITokenUpdateRequest,
-    authorization: Optional[str] = Header(None),
+    auth_data=Depends(get_current_user_or_api_token),
     db: AsyncSession = Depends(get_db)
 ):
     """Редактирование токена"""
-    auth_data = await get_current_user_or_api_token(request, db)
-
     if auth_data["type"] == "admin":
         raise HTTPException(status_code=400, detail="Use API token for this endpoint")
     
     requester_token = auth_data["token_obj"]
     require_access_level(requester_token, 2)
-    await create_audit_record(db, request, requester_token)
 
     stmt = select(APIToken).where(APIToken.uuid == token_uuid)
     result = await db.execute(stmt)
@@ -877,7 +884,8 @@ async def update_token(
 
     await db.commit()
     await db.refresh(api_token)
-    logger.info(f"{requester_token.user.username} обновил токен '{api_token.name}'")
+    invalidate_token(api_token.key)
+    logger.info(f"{requester_token.username} обновил токен '{api_token.name}'")
     return APITokenListItem(
         name=api_token.name,
         uuid=api_token.uuid,
@@ -892,16 +900,14 @@ async def update_user(
     request: Request,
     user_uuid: str,
     user_data: UserUpdateRequest,
-    authorization: Optional[str] = Header(None),
+    auth_data=Depends(get_current_user_or_api_token),
     db: AsyncSession = Depends(get_db)
 ):
     """Редактирование username"""
-    auth_data = await get_current_user_or_api_token(request, db)
     if auth_data["type"] == "admin":
         raise HTTPException(status_code=400, detail="Use API token for this endpoint")
     requester_token = auth_data["token_obj"]
     require_access_level(requester_token, 2)
-    await create_audit_record(db, request, requester_token)
 
     stmt = select(User).where(User.uuid == user_uuid)
     result = await db.execute(stmt)
@@ -920,5 +926,51 @@ async def update_user(
     user.username = user_data.username
     await db.commit()
     await db.refresh(user)
-    logger.info(f"{requester_token.user.username} обновил username '{user.username}'")
-    return UserRegisterResponse(username=user.username, uuid=user.uuid)
\ No newline at end of file
+    invalidate_user_tokens(user.id)
+    logger.info(f"{requester_token.username} обновил username '{user.username}'")
+    return UserRegisterResponse(username=user.username, uuid=user.uuid)
+
+
+@router.get("/cache/stats")
+async def token_cache_stats(
+    request: Request,
+    auth_data=Depends(get_current_user_or_api_token),
+    db: AsyncSession = Depends(get_db)
+):
+    """Статистика кэша API токенов (hit/miss)"""
+    if auth_data["type"] == "admin":
+        raise HTTPException(status_code=400, detail="Use API token for this endpoint")
+    token = auth_data["token_obj"]
+    require_access_level(token, 2)
+
+    return token_cache.stats()
+
+
+@router.get("/audit/stats")
+async def audit_stats(
+    request: Request,
+    auth_data=Depends(get_current_user_or_api_token),
+    db: AsyncSession = Depends(get_db)
+):
+    """Состояние фоновой очереди аудита (в т.ч. счётчик отброшенных записей)"""
+    if auth_data["type"] == "admin":
+        raise HTTPException(status_code=400, detail="Use API token for this endpoint")
+    token = auth_data["token_obj"]
+    require_access_level(token, 2)
+
+    return audit_sink.stats()
+
+
+@router.get("/upstream/stats")
+async def upstream_stats(
+    request: Request,
+    auth_data=Depends(get_current_user_or_api_token),
+    db: AsyncSession = Depends(get_db)
+):
+    """Состояние защиты Dessly: circuit breaker и адаптивный лимит"""
+    if auth_data["type"] == "admin":
+        raise HTTPException(status_code=400, detail="Use API token for this endpoint")
+    token = auth_data["token_obj"]
+    require_access_level(token, 2)
+
+    return {"dessly": dessly_guard.stats()}
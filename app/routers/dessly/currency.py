@@ -8,15 +8,17 @@ from app.auth import get_current_user_or_api_token
 from app.database import get_db
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from pydantic import BaseModel
-from typing import Optional
-from decimal import Decimal, ROUND_DOWN
+from pydantic import BaseModel, Field
+from typing import Optional, List
+from decimal import Decimal
 from cl import logger
-import aiohttp
+from app.rates import rates_cache, convert, RatesUnavailable, ConversionError
 
 
 router = APIRouter(prefix="/currency", tags=["currency"])
-dessly_base_url = "https://desslyhub.com/api/v1/exchange_rates/steam"
+
+# Максимум позиций в одном пакетном запросе
+MAX_BATCH_ITEMS = 1000
 
 
 # ==============================
@@ -33,6 +35,30 @@ class currency(BaseModel):
     dessly_token: str
     convert_to_rub: bool = False
 
+class currency_item(BaseModel):
+    """
+    Позиция пакетной конвертации
+    """
+
+    amount: Decimal
+    currency: str
+    convert_to_rub: bool = False
+
+class currency_list(BaseModel):
+    """
+    Список валют, доступных для конвертации
+    """
+
+    dessly_token: str
+
+class currency_batch(BaseModel):
+    """
+    Пакетная конвертация валюты
+    """
+
+    dessly_token: str
+    items: List[currency_item] = Field(..., max_length=MAX_BATCH_ITEMS)
+
 
 # ==============================
 # Проверка логина
@@ -55,63 +81,80 @@ async def currency_conversion(
     if not payload.dessly_token:
         raise HTTPException(status_code=400, detail="Error dessly token")
 
-    headers = {
-        "content-type": "application/json",
-        "apikey": payload.dessly_token
-    }
-    
-    async with aiohttp.ClientSession() as session:
-        async with session.get(dessly_base_url, headers=headers) as resp:
-            if resp.status != 200:
-                raise HTTPException(status_code=resp.status, detail="Error fetching exchange rates from Dessly API")
-            data = await resp.json()
-        
-    currency_key = {
-        "code": {
-            "KZT": 37,
-            "UAH": 18,
-            "RUB": 5,
-            "USD": 5
-        }
-    }
-
-    logger.warning(str(data))
-
-    input_currency = payload.currency
-    amount = payload.amount
-
-    if input_currency in currency_key["code"]:
-        currency_id = currency_key["code"][input_currency]
-        if str(currency_id) in data["exchange_rates"]:
-            rate = Decimal(str(data["exchange_rates"][str(currency_id)]))
-            converted = amount / rate
-
-            # Обрезаем до двух знаков без округления
-            truncated = converted.quantize(Decimal("0.00"), rounding=ROUND_DOWN)
-            # Добавляем 0.01
-            final_amount = truncated + Decimal("0.01")
-
-            if payload.convert_to_rub:
-                rub_id = currency_key["code"]["RUB"]
-
-                if str(rub_id) not in data["exchange_rates"]:
-                    raise HTTPException(status_code=400, detail="RUB rate missing.")
-
-                rub_rate = Decimal(str(data["exchange_rates"][str(rub_id)]))
-                # USD → RUB: умножаем
-                rub_amount = amount * rub_rate
-
-                return {
-                    "original_amount_usd": str(amount),
-                    "converted_amount_rub": str(rub_amount.quantize(Decimal("0.00"), rounding=ROUND_DOWN))
-                }
-
-            return {
-                "original_amount": str(amount),
-                "original_currency": input_currency,
-                "converted_amount_usd": str(final_amount)
-            }
-        else:
-            raise HTTPException(status_code=400, detail="Currency ID not found in rates.")
-    else:
-        raise HTTPException(status_code=400, detail="Unsupported currency.")
\ No newline at end of file
+    try:
+        rates = await rates_cache.get(payload.dessly_token)
+    except RatesUnavailable as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    try:
+        return convert(rates, payload.amount, payload.currency, payload.convert_to_rub)
+    except ConversionError as e:
+        raise HTTPException(status_code=400, detail=e.message)
+
+
+# ==============================
+# Пакетная конвертация
+# ==============================
+
+@router.post("/conversion/batch")
+async def currency_conversion_batch(
+    request: Request,
+    payload: currency_batch,
+    auth_data=Depends(get_current_user_or_api_token),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Конвертация списка сумм за один запрос: курсы читаются один раз,
+    ошибка отдельной позиции не прерывает остальные.
+    """
+
+    if auth_data["type"] == "admin":
+        raise HTTPException(status_code=400, detail="Use API token for this endpoint")
+
+    if not payload.dessly_token:
+        raise HTTPException(status_code=400, detail="Error dessly token")
+
+    try:
+        rates = await rates_cache.get(payload.dessly_token)
+    except RatesUnavailable as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    results = []
+    for item in payload.items:
+        try:
+            results.append({**convert(rates, item.amount, item.currency, item.convert_to_rub), "error": None})
+        except ConversionError as e:
+            results.append({"original_amount": str(item.amount), "original_currency": item.currency, "error": e.code})
+        except (ArithmeticError, ValueError):
+            results.append({"original_amount": str(item.amount), "original_currency": item.currency, "error": "invalid_input"})
+
+    return {"results": results}
+
+
+# ==============================
+# Доступные валюты
+# ==============================
+
+@router.post("/list")
+async def currency_list_route(
+    request: Request,
+    payload: currency_list,
+    auth_data=Depends(get_current_user_or_api_token),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Валюты из текущей таблицы курсов Dessly: код (или id, если кода нет) -> id валюты Steam
+    """
+
+    if auth_data["type"] == "admin":
+        raise HTTPException(status_code=400, detail="Use API token for this endpoint")
+
+    if not payload.dessly_token:
+        raise HTTPException(status_code=400, detail="Error dessly token")
+
+    try:
+        rates = await rates_cache.get(payload.dessly_token)
+    except RatesUnavailable as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    return {"currencies": rates.currencies()}
@@ -3,20 +3,25 @@
 Функции пополнения Steam
 """
 
-from fastapi import APIRouter, Depends, Request, HTTPException
-from app.auth import get_current_user_or_api_token
-from app.database import get_db
+from fastapi import APIRouter, Depends, Request, HTTPException, Response
+from app.auth import get_current_user_or_api_token, require_access_level
+from app.database import get_db, User
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from pydantic import BaseModel
-from typing import Optional
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Optional, List
+from datetime import datetime
+import json
 from cl import logger
-import aiohttp
+from app.config import settings
+from app.topup import topup, topup_queue, TopupQueueFull
+from app.ledger import spend_summary, AMOUNT_LIMIT
+from app.steam_login import check_login as check_steam_login, check_logins
+from app.catalog import games_catalog, game_details, CatalogError, etag_matches
 
 
 router = APIRouter(prefix="/dessly/steam", tags=["steam"])
-dessly_base_url_topup = "https://desslyhub.com/api/v1/service/steamtopup"
-dessly_base_url_gift = "https://desslyhub.com/api/v1/service/steamgift"
 
 
 # ==============================
@@ -32,6 +37,22 @@ class check_login(BaseModel):
     dessly_token: str
     amount: float
 
+class check_login_item(BaseModel):
+    """
+    Логин в пакетной проверке
+    """
+
+    username: str
+    amount: float
+
+class check_login_batch(BaseModel):
+    """
+    Пакетная проверка логинов Steam
+    """
+
+    dessly_token: str
+    items: List[check_login_item] = Field(..., max_length=settings.CHECK_LOGIN_BATCH_MAX)
+
 class topup_steam(BaseModel):
     """
     Пополнение Steam через dessly API
@@ -39,7 +60,7 @@ class topup_steam(BaseModel):
 
     username: str
     dessly_token: str
-    amount: float
+    amount: float = Field(..., gt=0, lt=AMOUNT_LIMIT)
     reference: Optional[str] = None
 
 class get_all_games(BaseModel):
@@ -51,7 +72,7 @@ class get_all_games(BaseModel):
 
 class get_data_game(BaseModel):
     """
-    Получение данных игры
+    Получение данных игры (из LRU-кэша по app_id)
     """
 
     dessly_token: str
@@ -86,48 +107,33 @@ async def check_login_route(
     if auth_data["type"] == "admin":
         raise HTTPException(status_code=400, detail="Use API token for this endpoint")
     
-    url = f"{dessly_base_url_topup}/check_login"
-    headers = {
-        "Content-Type": "application/json",
-        "apikey": payload.dessly_token,
-    }
-    payload = {
-        "username": payload.username,
-        "amount": payload.amount,
-    }
+    return await check_steam_login(payload.dessly_token, payload.username, payload.amount)
 
-    try:
-        timeout = aiohttp.ClientTimeout(total=10)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.post(url, json=payload, headers=headers) as response:
-                response_data = await response.json()
-
-        error_code = response_data.get("error_code")
-        can_refill = response_data.get("can_refill")
-        
-        if can_refill == True or error_code == 0:
-            logger.info(f"Проверка логина Steam успешно выполнена: {response_data}")
-            return {"status": True, "error": None}
-
-        elif error_code == -100:
-            logger.warning(f"Неверное имя пользователя Steam: {payload['username']}")
-            return {"status": False, "error": "invalid_steam_username"}
-
-        elif error_code == -2:
-            logger.warning("Недостаточно средств на балансе")
-            return {"status": False, "error": "insufficient_funds"}
-
-        elif error_code == -5:
-            logger.warning("Доступ запрещен")
-            return {"status": False, "error": "access_denied"}
-
-        else:
-            logger.error(f"Неизвестная ошибка: {error_code}")
-            return {"status": False, "error": f"unknown_error_{error_code}"}
-            
-    except Exception as e:
-        logger.error(f"Ошибка при проверке логина Steam: {e}")
-        return {"status": False}
+
+@router.post("/check_login/batch")
+async def check_login_batch_route(
+    request: Request,
+    payload: check_login_batch,
+    auth_data=Depends(get_current_user_or_api_token),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Пакетная проверка логинов Steam.
+    Ответ — NDJSON: по строке на логин в порядке готовности
+    ({"index", "username", "status", "error"}), запросы к Dessly идут параллельно.
+    """
+
+    if auth_data["type"] == "admin":
+        raise HTTPException(status_code=400, detail="Use API token for this endpoint")
+
+    items = [(item.username, item.amount) for item in payload.items]
+
+    async def stream():
+        async for index, result in check_logins(payload.dessly_token, items, settings.CHECK_LOGIN_CONCURRENCY):
+            line = {"index": index, "username": items[index][0], **result}
+            yield json.dumps(line, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 
 # ==============================
@@ -149,61 +155,97 @@ async def topup_steam_route(
     if auth_data["type"] == "admin":
         raise HTTPException(status_code=400, detail="Use API token for this endpoint")
 
-    url = f"{dessly_base_url_topup}/topup"
-    headers = {
-        "Content-Type": "application/json",
-        "apikey": payload.dessly_token,
-    }
-    data = {
-        "username": payload.username,
-        "amount": payload.amount,
-        "reference": payload.reference,
-    }
+    token = auth_data["token_obj"]
+    result = await topup(
+        payload.dessly_token, payload.username, payload.amount, payload.reference,
+        user_id=token.user_id, api_token_id=token.id,
+    )
+    if result.get("error") == "reference_conflict":
+        raise HTTPException(status_code=409, detail="Reference already used with a different username or amount")
+    return result
+
+
+@router.post("/topup/jobs", status_code=202)
+async def topup_job_create_route(
+    request: Request,
+    payload: topup_steam,
+    auth_data=Depends(get_current_user_or_api_token),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Ставит пополнение в очередь и сразу возвращает id задания (202).
+    Результат — GET /dessly/steam/topup/jobs/{job_id}.
+    """
+
+    if auth_data["type"] == "admin":
+        raise HTTPException(status_code=400, detail="Use API token for this endpoint")
+    token = auth_data["token_obj"]
 
     try:
-        timeout = aiohttp.ClientTimeout(total=10)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.post(url, json=data, headers=headers) as response:
-                response_data = await response.json()
-        
-        error_code = response_data.get("error_code")
-        status = response_data.get("status")
-        transaction_id = response_data.get("transaction_id")
-
-        logger.warning("Error code received from Dessly API topup: %s", error_code)
-        
-        if status == "pending" or error_code == 0 or transaction_id is not None:
-            logger.info(f"Пополнение Steam успешно выполнено: {response_data}")
-            return {
-                "status": True,
-                "error": None,
-                "transaction_id": response_data.get("transaction_id")
-            }
-
-        elif error_code == -100:
-            logger.warning(f"Неверное имя пользователя Steam: {data['username']}")
-            return {"status": False, "error": "invalid_steam_username"}
-
-        elif error_code == -2:
-            logger.warning("Недостаточно средств на балансе")
-            return {"status": False, "error": "insufficient_funds"}
-
-        elif error_code == -5:
-            logger.warning("Доступ запрещен")
-            return {"status": False, "error": "access_denied"}
-
-        elif error_code == -7:
-            logger.warning("Пополнение не удалось: ошибка транзакции")
-            return {"status": False, "error": "transaction_failed"}
-
-        else:
-            logger.error(f"Неизвестная ошибка при пополнении: {error_code}")
-            return {"status": False, "error": f"unknown_error_{error_code}"}
-
-    except Exception as e:
-        logger.error(f"Ошибка при запросе к API Dessly (topup): {e}")
-        return {"status": False, "error": "connection_error"}
-    
+        job = topup_queue.submit(
+            user_id=token.user_id,
+            api_token_id=token.id,
+            dessly_token=payload.dessly_token,
+            username=payload.username,
+            amount=payload.amount,
+            reference=payload.reference,
+        )
+    except TopupQueueFull:
+        raise HTTPException(status_code=503, detail="Topup queue is full")
+
+    return {"job_id": job.id, "status": job.status}
+
+
+@router.get("/topup/jobs/{job_id}")
+async def topup_job_status_route(
+    job_id: str,
+    request: Request,
+    auth_data=Depends(get_current_user_or_api_token),
+    db: AsyncSession = Depends(get_db),
+):
+    """Статус и результат задания пополнения (только своего пользователя)"""
+
+    if auth_data["type"] == "admin":
+        raise HTTPException(status_code=400, detail="Use API token for this endpoint")
+    token = auth_data["token_obj"]
+
+    job = topup_queue.get(job_id, user_id=token.user_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return job.to_dict()
+
+
+@router.get("/topup/summary")
+async def topup_summary_route(
+    request: Request,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    user_uuid: Optional[str] = None,
+    auth_data=Depends(get_current_user_or_api_token),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Сводка пополнений из журнала за период [since, until): количество, сумма, по дням.
+    По умолчанию — свой пользователь; user_uuid другого пользователя — уровень 2.
+    """
+
+    if auth_data["type"] == "admin":
+        raise HTTPException(status_code=400, detail="Use API token for this endpoint")
+    token = auth_data["token_obj"]
+
+    user_id, username = token.user_id, token.username
+    if user_uuid is not None:
+        require_access_level(token, 2)
+        result = await db.execute(select(User.id, User.username).where(User.uuid == user_uuid))
+        row = result.one_or_none()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Пользователь не найден")
+        user_id, username = row
+
+    summary = await spend_summary(db, user_id, since=since, until=until)
+    return {"username": username, "since": since, "until": until, **summary}
+
 
 # ==============================
 # Получение списка игр
@@ -217,48 +259,43 @@ async def games_gift(
     db: AsyncSession = Depends(get_db)
 ):
     """
-    Получение списка игр
+    Получение списка игр.
+    Отдаётся из кэша готовым телом (gzip, если клиент поддерживает);
+    с If-None-Match и совпавшим ETag — 304 без тела.
+    В режиме GAMES_PASSTHROUGH — потоком из Dessly, без кэша и ETag.
     """
 
     if auth_data["type"] == "admin":
         raise HTTPException(status_code=400, detail="Use API token for this endpoint")
-    
-    url = f"{dessly_base_url_gift}/games"
-    headers = {
-        "Content-Type": "application/json",
-        "apikey": payload.dessly_token,
-    }
 
+    if settings.GAMES_PASSTHROUGH:
+        return StreamingResponse(
+            games_catalog.stream(payload.dessly_token),
+            media_type="application/json",
+            headers={"Cache-Control": "no-store"},
+        )
+    
     try:
-        timeout = aiohttp.ClientTimeout(total=10)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(url, headers=headers) as response:
-                response.raise_for_status()
-                response_data = await response.json()
-
-        # Если пришли игры → успех
-        if "games" in response_data:
-            logger.info("Список игр успешно получен")
-            return {"status": True, "error": None, "games": response_data["games"]}
+        snapshot = await games_catalog.get(payload.dessly_token)
+    except CatalogError as e:
+        if e.error is None:
+            return {"status": False}
+        return {"status": False, "error": e.error, "games": None}
 
-        # Если пришла ошибка → обрабатываем
-        error_code = response_data.get("error_code")
-
-        if error_code == -1:
-            logger.warning("Сервер не ответил")
-            return {"status": False, "error": "server_error", "games": None}
+    headers = {
+        "ETag": snapshot.etag,
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+    }
 
-        if error_code == -5:
-            logger.warning("Доступ запрещен")
-            return {"status": False, "error": "access_denied", "games": None}
+    if etag_matches(request.headers.get("if-none-match"), snapshot.etag):
+        return Response(status_code=304, headers=headers)
 
-        # Неизвестный error_code (если появятся новые)
-        logger.error(f"Неизвестная ошибка: {error_code}")
-        return {"status": False, "error": f"unknown_error_{error_code}", "games": None}
+    if "gzip" in request.headers.get("accept-encoding", "").lower():
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=snapshot.gzip_body, media_type="application/json", headers=headers)
 
-    except Exception as e:
-        logger.error(f"Ошибка при получении списка игр Steam: {e}")
-        return {"status": False}
+    return Response(content=snapshot.body, media_type="application/json", headers=headers)
 
 
 # ==============================
@@ -273,45 +310,10 @@ async def data_game_gift(
     db: AsyncSession = Depends(get_db)
 ):
     """
-    Получение данных игры
+    Получение данных игры (из LRU-кэша по app_id)
     """
 
     if auth_data["type"] == "admin":
         raise HTTPException(status_code=400, detail="Use API token for this endpoint")
     
-    url = f"{dessly_base_url_gift}/games/{payload.app_id}"
-    headers = {
-        "Content-Type": "application/json",
-        "apikey": payload.dessly_token,
-    }
-
-    try:
-        timeout = aiohttp.ClientTimeout(total=10)
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(url, headers=headers) as response:
-                response.raise_for_status()
-                response_data = await response.json()
-
-        # Если пришли игры → успех
-        if "game" in response_data:
-            logger.info("Данные игры успешно получены")
-            return {"status": True, "error": None, "game": response_data["game"]}
-
-        # Если пришла ошибка → обрабатываем
-        error_code = response_data.get("error_code")
-
-        if error_code == -1:
-            logger.warning("Сервер не ответил")
-            return {"status": False, "error": "server_error", "games": None}
-
-        if error_code == -5:
-            logger.warning("Доступ запрещен")
-            return {"status": False, "error": "access_denied", "games": None}
-
-        # Неизвестный error_code (если появятся новые)
-        logger.error(f"Неизвестная ошибка: {error_code}")
-        return {"status": False, "error": f"unknown_error_{error_code}", "games": None}
-
-    except Exception as e:
-        logger.error(f"Ошибка при получении данных игры Steam: {e}")
-        return {"status": False}
\ No newline at end of file
+    return await game_details.get(payload.app_id, payload.dessly_token)
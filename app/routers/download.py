@@ -3,13 +3,10 @@
 """
 
 from app.auth import require_access_level, get_current_user_or_api_token
-from fastapi import APIRouter, HTTPException, Header, Request, Depends
+from fastapi import APIRouter, HTTPException, Request, Depends
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import FileResponse
 from app.config import get_config_value
-from app.database import get_db
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 from cl import logger
 import os
 
@@ -54,15 +51,11 @@ async def download_update(request: Request):
 
 
 @router.get("/download_file")
-async def download_file(request: Request, platform_file: str, authorization: str = Header(None), db: AsyncSession = Depends(get_db)):
+async def download_file(request: Request, platform_file: str, auth_data=Depends(get_current_user_or_api_token)):
     """
     Отдаёт файл плагина по платформе/типу файла, если токен валидный.
     """
     logger.info(f"Запрос на скачивание файла: {platform_file}")
-    logger.info(f"Заголовок Authorization: {authorization}")
-
-    # Получаем данные пользователя или токена
-    auth_data = await get_current_user_or_api_token(request, db)
     logger.info(f"Тип авторизации: {auth_data['type']}")
 
     # Проверка токена на admin
@@ -74,16 +67,6 @@ async def download_file(request: Request, platform_file: str, authorization: str
     require_access_level(requester_token, 0)
     logger.info(f"Токен прошёл проверку уровня доступа: {requester_token.id}")
 
-    # Разбор токена из заголовка
-    if not authorization or " " not in authorization:
-        logger.error("Некорректный заголовок Authorization")
-        raise HTTPException(status_code=400, detail="Authorization header is missing or malformed")
-    token = authorization.split(" ")[1]
-    logger.info(f"Токен из заголовка: {token[:6]}... (скрыто)")
-
-    # Проверяем токен
-    require_access_level(requester_token, 0)
-
     # Получаем актуальную версию из конфигурации
     version = get_config_value("version_update", default=None)
     logger.info(f"Актуальная версия: {version}")
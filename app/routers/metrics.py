@@ -3,9 +3,12 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from pydantic import BaseModel
 from datetime import datetime, timedelta
-from app.auth import get_current_user_or_api_token, require_access_level
+from app.auth import get_current_user_or_api_token, require_access_level, TokenPrincipal
 from app.database import PluginMetrics, PluginImportantLog, APIToken, User
 from app.database import get_db
+from app.upstream_metrics import upstream_metrics
+from app.ws_manager import ws_manager
+from app.config_feed import config_feed
 
 
 router = APIRouter(prefix="/metrics", tags=["metrics"])
@@ -52,7 +55,7 @@ async def push_metrics(
     if auth_data["type"] != "api_token":
         raise HTTPException(status_code=403, detail="Use API token")
 
-    token: APIToken = auth_data["token_obj"]
+    token: TokenPrincipal = auth_data["token_obj"]
     require_access_level(token, 0)
 
     metrics = (
@@ -99,7 +102,7 @@ async def push_important_logs(
     if auth_data["type"] != "api_token":
         raise HTTPException(status_code=403, detail="Use API token")
 
-    token: APIToken = auth_data["token_obj"]
+    token: TokenPrincipal = auth_data["token_obj"]
     require_access_level(token, 0)
 
     saved = 0
@@ -132,7 +135,7 @@ async def get_online(
     if auth_data["type"] != "api_token":
         raise HTTPException(status_code=403, detail="Use API token")
 
-    token: APIToken = auth_data["token_obj"]
+    token: TokenPrincipal = auth_data["token_obj"]
     require_access_level(token, 2)
 
     threshold = datetime.utcnow() - timedelta(minutes=15)
@@ -153,6 +156,51 @@ async def get_online(
     }
 
 
+# -----------------------------
+# Исходящие запросы (Dessly, GitHub)
+# -----------------------------
+
+@router.get("/upstream")
+async def get_upstream_metrics(
+    reset: bool = False,
+    auth_data=Depends(get_current_user_or_api_token),
+):
+    """
+    Задержки, статусы, error_code, запросы в полёте и байты по эндпоинтам апстримов.
+    reset=true — обнулить после чтения.
+    """
+
+    if auth_data["type"] != "api_token":
+        raise HTTPException(status_code=403, detail="Use API token")
+
+    token: TokenPrincipal = auth_data["token_obj"]
+    require_access_level(token, 2)
+
+    snapshot = upstream_metrics.snapshot()
+    if reset:
+        upstream_metrics.reset()
+    return snapshot
+
+
+# -----------------------------
+# WebSocket-соединения
+# -----------------------------
+
+@router.get("/ws")
+async def get_ws_metrics(
+    auth_data=Depends(get_current_user_or_api_token),
+):
+    """Соединения, кадры в очередях, выброшенные и схлопнутые кадры, отключённые медленные клиенты, версия конфига"""
+
+    if auth_data["type"] != "api_token":
+        raise HTTPException(status_code=403, detail="Use API token")
+
+    token: TokenPrincipal = auth_data["token_obj"]
+    require_access_level(token, 2)
+
+    return {**ws_manager.stats(), "config": config_feed.stats()}
+
+
 # -----------------------------
 # Получение метрик
 # -----------------------------
@@ -8,9 +8,10 @@ from sqlalchemy import select
 from pydantic import BaseModel, Field
 from typing import Optional, List
 from cl import logger
-from app.auth import get_current_user_or_api_token, generate_api_token, require_access_level
+from app.auth import get_current_user_or_api_token, generate_api_token, require_access_level, TokenPrincipal
 from app.database import APIToken, User, UserNews, UserNewsRead
 from app.database import get_db
+from app.ws_manager import ws_manager
 from datetime import datetime
 
 
@@ -69,10 +70,9 @@ async def get_news(
     if auth_data["type"] != "api_token":
         raise HTTPException(status_code=400, detail="Use API token for this endpoint")
 
-    token: APIToken = auth_data["token_obj"]
-    user: User = token.user
+    token: TokenPrincipal = auth_data["token_obj"]
 
-    logger.info(f"Пользователь {user.username} ({user.id}) запрашивает новости")
+    logger.info(f"Пользователь {token.username} ({token.user_id}) запрашивает новости")
 
     # получаем активные новости
     news_list = db.query(UserNews).filter(UserNews.is_active == True).order_by(UserNews.timestamp.desc()).all()
@@ -80,7 +80,7 @@ async def get_news(
     # получаем id прочитанных новостей
     read_news_ids = {
         row.news_id for row in db.query(UserNewsRead.news_id)
-        .filter(UserNewsRead.user_id == user.id).all()
+        .filter(UserNewsRead.user_id == token.user_id).all()
     }
 
     # формируем результат
@@ -112,8 +112,7 @@ async def mark_news_as_read(
     if auth_data["type"] != "api_token":
         raise HTTPException(status_code=400, detail="Use API token for this endpoint")
 
-    token: APIToken = auth_data["token_obj"]
-    user: User = token.user
+    token: TokenPrincipal = auth_data["token_obj"]
 
     # проверяем, что новость существует
     news_item = db.query(UserNews).filter(UserNews.id == news_id, UserNews.is_active == True).first()
@@ -121,16 +120,16 @@ async def mark_news_as_read(
         raise HTTPException(status_code=404, detail="Новость не найдена")
 
     # проверяем, была ли уже прочитана
-    already = db.query(UserNewsRead).filter_by(user_id=user.id, news_id=news_id).first()
+    already = db.query(UserNewsRead).filter_by(user_id=token.user_id, news_id=news_id).first()
     if already:
-        logger.info(f"Пользователь {user.username} ({user.id}) уже читал новость {news_id}")
+        logger.info(f"Пользователь {token.username} ({token.user_id}) уже читал новость {news_id}")
         return {"status": "ok", "message": "Новость уже отмечена как прочитанная"}
 
     # добавляем запись о прочтении
-    new_read = UserNewsRead(user_id=user.id, news_id=news_id)
+    new_read = UserNewsRead(user_id=token.user_id, news_id=news_id)
     db.add(new_read)
     db.commit()
-    logger.info(f"Пользователь {user.username} ({user.id}) отметил новость {news_id} как прочитанную")
+    logger.info(f"Пользователь {token.username} ({token.user_id}) отметил новость {news_id} как прочитанную")
 
     return {"status": "ok", "message": "Новость отмечена как прочитанная"}
 
@@ -148,7 +147,7 @@ async def create_news(
     if auth_data["type"] != "api_token":
         raise HTTPException(status_code=400, detail="Use API token for this endpoint")
 
-    token: APIToken = auth_data["token_obj"]
+    token: TokenPrincipal = auth_data["token_obj"]
     require_access_level(token, 2)
 
     new_news = UserNews(
@@ -158,21 +157,31 @@ async def create_news(
     )
 
     db.add(new_news)
-    db.commit()
-    db.refresh(new_news)
+    await db.commit()
+    await db.refresh(new_news)
 
     logger.info(f"Создана новость {new_news.id}: {new_news.title}")
+
+    news = {
+        "id": new_news.id,
+        "uuid": new_news.uuid,
+        "title": new_news.title,
+        "content": new_news.content,
+        "is_active": new_news.is_active,
+        "timestamp": new_news.timestamp
+    }
+
+    # подписчикам WS — сразу, без опроса /news/get
+    if new_news.is_active:
+        await ws_manager.publish(
+            "news",
+            {"type": "news", "news": {**news, "timestamp": new_news.timestamp.isoformat()}}
+        )
+
     return {
         "status": "ok",
         "message": "Новость успешно создана",
-        "news": {
-            "id": new_news.id,
-            "uuid": new_news.uuid,
-            "title": new_news.title,
-            "content": new_news.content,
-            "is_active": new_news.is_active,
-            "timestamp": new_news.timestamp
-        }
+        "news": news
     }
 
 
@@ -185,7 +194,7 @@ async def delete_news(
     if auth_data["type"] != "api_token":
         raise HTTPException(status_code=400, detail="Use API token for this endpoint")
 
-    token: APIToken = auth_data["token_obj"]
+    token: TokenPrincipal = auth_data["token_obj"]
     require_access_level(token, 2)
 
     news_item = db.query(UserNews).filter(UserNews.id == news_id).first()
@@ -12,6 +12,9 @@ from app.database import get_db
 from app.database import UpdatePlugin
 from app.auth import get_current_user_or_api_token, require_access_level
 from app.config import get_config_value, CONFIG_PATH, load_config, settings
+from app.upstream_metrics import upstream_metrics
+from app.ws_manager import ws_manager
+from app.config_feed import config_feed
 import aiohttp, asyncio
 import shutil
 
@@ -146,8 +149,8 @@ async def new_update(
         new_version=version,
     )
     db.add(update_record)
-    db.commit()
-    db.refresh(update_record)
+    await db.commit()
+    await db.refresh(update_record)
     
     # await download_update(version=version)
 
@@ -162,6 +165,16 @@ async def new_update(
         logger.error(f"Ошибка обновления config.json: {e}")
         raise HTTPException(status_code=500, detail=f"Ошибка обновления config: {e}")
 
+    await config_feed.refresh()
+
+    await ws_manager.publish("version", {
+        "type": "version",
+        "current_version": version,
+        "active_version": config.get("version_update_active", "None"),
+        "name": name,
+        "description": description
+    })
+
     return {
         "message": "Обновление успешно применено",
         "update_id": update_record.id,
@@ -189,9 +202,9 @@ async def rollback_update(
     version_to_remove = data.version
 
     # Проверяем, что такая версия вообще есть в истории
-    update_entry = db.query(UpdatePlugin).filter(
-        UpdatePlugin.new_version == version_to_remove
-    ).first()
+    update_entry = (await db.execute(
+        select(UpdatePlugin).where(UpdatePlugin.new_version == version_to_remove)
+    )).scalars().first()
 
     if not update_entry:
         raise HTTPException(
@@ -210,8 +223,8 @@ async def rollback_update(
         )
 
     # Удаляем запись
-    db.delete(update_entry)
-    db.commit()
+    await db.delete(update_entry)
+    await db.commit()
 
     # Если удалили текущую — активируем активную
     current_version = get_config_value("version_update", default="0.0.0.0")
@@ -231,6 +244,14 @@ async def rollback_update(
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Ошибка обновления config.json: {e}")
 
+        await config_feed.refresh()
+        await ws_manager.publish("version", {
+            "type": "version",
+            "current_version": active_version,
+            "active_version": active_version,
+            "rolled_back": version_to_remove
+        })
+
         # Удаляем папку релиза
         release_folder = os.path.join(folder_update, version_to_remove)
         if os.path.exists(release_folder):
@@ -261,48 +282,57 @@ async def download_update(version: str):
 
     async with aiohttp.ClientSession() as session:
         # Получаем информацию о релизе
-        async with session.get(url, headers=headers) as resp:
-            logger.debug(f"Release info status: {resp.status}")
-            if resp.status != 200:
-                text = await resp.text()
-                logger.error(f"Ошибка {resp.status}: {text}")
-                return
-
-            release = await resp.json()
-            logger.info(f"Релиз: {release['name']}")
-            logger.debug("Ассеты:")
-
-            for asset in release['assets']:
-                name = asset['name']
-                asset_api_url = asset['url']
-                file_path = os.path.join(release_folder, name)
-
-                # Проверяем, есть ли файл и его размер > 0
-                if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
-                    logger.info(f"Файл '{name}' уже существует, пропускаем.")
-                    continue
-
-                logger.info(f"Скачиваю → {file_path}")
-                headers_asset = {
-                    "Authorization": f"token {token}",
-                    "Accept": "application/octet-stream"
-                }
-
-                try:
-                    async with session.get(asset_api_url, headers=headers_asset) as asset_resp:
-                        if asset_resp.status != 200:
-                            text = await asset_resp.text()
-                            logger.error(f"Ошибка {asset_resp.status} при скачивании {name}: {text}")
-                            continue
-
-                        with open(file_path, "wb") as f:
-                            async for chunk in asset_resp.content.iter_chunked(8192):
-                                f.write(chunk)
-
-                    logger.info(f"✅ Скачан: {name}")
-
-                except Exception as e:
-                    logger.error(f"Ошибка при скачивании {name}: {e}")
+        async with upstream_metrics.track("github", "release") as call:
+            async with session.get(url, headers=headers) as resp:
+                call.status = resp.status
+                logger.debug(f"Release info status: {resp.status}")
+                if resp.status != 200:
+                    text = await resp.text()
+                    call.bytes_received = len(text.encode())
+                    logger.error(f"Ошибка {resp.status}: {text}")
+                    return
+
+                body = await resp.read()
+                call.bytes_received = len(body)
+                release = json.loads(body)
+
+        logger.info(f"Релиз: {release['name']}")
+        logger.debug("Ассеты:")
+
+        for asset in release['assets']:
+            name = asset['name']
+            asset_api_url = asset['url']
+            file_path = os.path.join(release_folder, name)
+
+            # Проверяем, есть ли файл и его размер > 0
+            if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
+                logger.info(f"Файл '{name}' уже существует, пропускаем.")
+                continue
+
+            logger.info(f"Скачиваю → {file_path}")
+            headers_asset = {
+                "Authorization": f"token {token}",
+                "Accept": "application/octet-stream"
+            }
+
+            try:
+                async with upstream_metrics.track("github", "asset") as call, \
+                        session.get(asset_api_url, headers=headers_asset) as asset_resp:
+                    call.status = asset_resp.status
+                    if asset_resp.status != 200:
+                        text = await asset_resp.text()
+                        logger.error(f"Ошибка {asset_resp.status} при скачивании {name}: {text}")
+                        continue
+
+                    with open(file_path, "wb") as f:
+                        async for chunk in asset_resp.content.iter_chunked(8192):
+                            f.write(chunk)
+                            call.bytes_received += len(chunk)
+
+                logger.info(f"✅ Скачан: {name}")
+
+            except Exception as e:
+                logger.error(f"Ошибка при скачивании {name}: {e}")
 
     logger.info(f"🎉 Все файлы релиза '{version}' проверены и скачаны в: {release_folder}")
 
@@ -13,7 +13,8 @@ from sqlalchemy import select
 from cl import logger
 from app.database import WhitelistedEntry
 from app.database import get_db
-from app.auth import get_current_user_or_api_token, require_access_level, create_audit_record
+from app.auth import get_current_user_or_api_token, require_access_level
+from app.whitelist_index import reload_whitelist
 
 
 router = APIRouter(prefix="/whitelist", tags=["whitelist"])
@@ -52,11 +53,20 @@ def is_valid_domain(domain: str) -> bool:
 
 
 def validate_value(value: str) -> bool:
+    """IP, CIDR-диапазон (10.0.0.0/8), домен или маска поддоменов (*.example.com)"""
     value = value.strip()
+    if "/" in value:
+        try:
+            ipaddress.ip_network(value, strict=False)
+            return True
+        except ValueError:
+            return False
     try:
         ipaddress.ip_address(value)
         return True
     except ValueError:
+        if value.startswith("*."):
+            value = value[2:]
         return is_valid_domain(value)
 
 
@@ -80,7 +90,8 @@ async def list_white_domains(
     if auth_data["type"] == "api_token":
         token = auth_data["token_obj"]
         require_access_level(token, 1)
-        entries = db.query(WhitelistedEntry).all()
+        result = await db.execute(select(WhitelistedEntry))
+        entries = result.scalars().all()
     else:
         return HTTPException(
             status_code=403,
@@ -131,15 +142,16 @@ async def add_white_domain(
         raise HTTPException(status_code=400, detail="Неверный формат IP или домена")
 
     # Проверка exists per user (теперь matches с composite unique)
-    exists = db.query(WhitelistedEntry).filter(WhitelistedEntry.value == item.value).first()
+    result = await db.execute(select(WhitelistedEntry).where(WhitelistedEntry.value == item.value))
+    exists = result.scalar_one_or_none()
     if exists:
         raise HTTPException(status_code=400, detail="Этот IP или домен уже добавлен")
 
     new_entry = WhitelistedEntry(value=item.value, user_id=userid)
     db.add(new_entry)
-    db.commit()
-    db.refresh(new_entry)
-    await create_audit_record(db, request, token)  # Добавили аудит для consistency
+    await db.commit()
+    await db.refresh(new_entry)
+    await reload_whitelist(db)
     logger.info(f"{username} добавил домен/IP в whitelist: {item.value}")
     return WhiteDomainItem.from_orm(new_entry)
 
@@ -175,16 +187,16 @@ async def delete_white_domain(
 
     logger.info(f"{username} пытается удалить запись whitelist с UUID: {entry_uuid}")
 
-    entry = (
-        db.query(WhitelistedEntry)
-        .filter(WhitelistedEntry.uuid == entry_uuid)
-        .first()
+    result = await db.execute(
+        select(WhitelistedEntry).where(WhitelistedEntry.uuid == entry_uuid)
     )
+    entry = result.scalar_one_or_none()
 
     if not entry:
         raise HTTPException(status_code=404, detail="Запись не найдена")
 
-    db.delete(entry)
-    db.commit()
+    await db.delete(entry)
+    await db.commit()
+    await reload_whitelist(db)
     logger.info(f"{username} удалил домен/IP из whitelist: {entry.value}")
     return {"detail": "Запись успешно удалена"}
\ No newline at end of file
@@ -0,0 +1,60 @@
+"""
+Проверка логинов Steam через Dessly (steamtopup/check_login).
+check_login — одна проверка; check_logins — пакет: запросы к Dessly идут
+параллельно (не больше concurrency одновременно) через общий пул соединений,
+результаты отдаются по мере готовности.
+"""
+
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Tuple
+from app.dessly_client import dessly_client, dessly_error
+from app.upstream import UpstreamUnavailable
+from cl import logger
+
+
+async def check_login(dessly_token: str, username: str, amount: float) -> Dict[str, Any]:
+    """Результат в формате ответа /dessly/steam/check_login"""
+    try:
+        result = await dessly_client.check_login(dessly_token, username, amount)
+    except UpstreamUnavailable as e:
+        logger.warning(f"Проверка логина Steam: {e}")
+        return {"status": False, "error": "upstream_unavailable"}
+    except Exception as e:
+        logger.error(f"Ошибка при проверке логина Steam: {e}")
+        return {"status": False}
+
+    if result.ok:
+        logger.info(f"Проверка логина Steam успешно выполнена: {result}")
+        return {"status": True, "error": None}
+
+    error = dessly_error(result.error_code)
+    error.log(username if result.error_code == -100 else "")
+    return {"status": False, "error": error.error}
+
+
+async def check_logins(
+    dessly_token: str,
+    items: List[Tuple[str, float]],
+    concurrency: int,
+) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Пакетная проверка [(username, amount), ...].
+    Отдаёт (индекс позиции, результат) в порядке завершения.
+    Если потребитель ушёл (генератор закрыт), незавершённые проверки отменяются.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def one(index: int, username: str, amount: float):
+        async with semaphore:
+            return index, await check_login(dessly_token, username, amount)
+
+    tasks = [
+        asyncio.ensure_future(one(index, username, amount))
+        for index, (username, amount) in enumerate(items)
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
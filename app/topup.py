@@ -0,0 +1,328 @@
+"""
+Пополнение Steam через Dessly (steamtopup/topup).
+
+topup() — запрос к Dessly и разбор ответа с записью в журнал (app/ledger.py);
+повтор reference пользователя отдаёт сохранённый результат без запроса к Dessly,
+одновременные повторы ждут первый запрос. Исход, после которого неизвестно,
+прошло ли пополнение (таймаут, 5xx, неизвестный код), записывается как unknown,
+и повтор с тем же reference снова уходит в Dessly. Повтор reference с другим
+логином или суммой получает ошибку reference_conflict.
+TopupQueue — асинхронный режим: задание ставится в очередь и сразу получает id,
+запросы к Dessly выполняет пул из TOPUP_WORKERS воркеров. Результат забирается
+по id или приходит пушем в WebSocket-соединение, поставившее задание.
+Завершённые задания хранятся TOPUP_JOB_TTL секунд.
+При остановке новые задания не принимаются, очередь дорабатывается не дольше
+TOPUP_DRAIN_TIMEOUT секунд; начатое пополнение всегда доводится до записи в журнал.
+"""
+
+import asyncio
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from app.balance import balance_cache
+from app.cache import SingleFlight, TTLCache
+from app.config import settings
+from app.ledger import find_reference, record_topup, request_fields, SUCCESS, FAILED, UNKNOWN
+from app.dessly_client import dessly_client, dessly_error
+from app.upstream import UpstreamUnavailable
+from cl import logger
+
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+
+
+async def _topup_upstream(dessly_token: str, username: str, amount: float, reference: Optional[str]) -> Dict[str, Any]:
+    try:
+        result = await dessly_client.topup(dessly_token, username, amount, reference)
+    except UpstreamUnavailable as e:
+        # Запрос в Dessly не отправлялся — пополнение точно не выполнено
+        logger.warning(f"Пополнение Steam: {e}")
+        return {"status": False, "error": "upstream_unavailable"}
+    except Exception as e:
+        logger.error(f"Ошибка при запросе к API Dessly (topup): {e}")
+        return {"status": False, "error": "connection_error"}
+
+    if result.ok:
+        logger.info(f"Пополнение Steam успешно выполнено: {result}")
+        balance_cache.invalidate(dessly_token)
+        return {
+            "status": True,
+            "error": None,
+            "transaction_id": result.transaction_id
+        }
+
+    error = dessly_error(result.error_code)
+    error.log(username if result.error_code == -100 else "")
+    return {"status": False, "error": error.error}
+
+
+# Запрос в Dessly не отправлялся — в журнал не пишем, повтор с тем же reference допустим
+NOT_SENT_ERRORS = {"upstream_unavailable"}
+
+# Dessly ответил, что пополнение не выполнено — окончательный отказ
+FAILED_ERRORS = {"insufficient_funds", "access_denied", "transaction_failed", "invalid_steam_username"}
+
+
+def topup_status(result: Dict[str, Any]) -> str:
+    """Статус для журнала; остальные ошибки (обрыв, таймаут, 5xx, неизвестный код) — unknown"""
+    if result.get("status"):
+        return SUCCESS
+    if result.get("error") in FAILED_ERRORS:
+        return FAILED
+    return UNKNOWN
+
+_reference_flight = SingleFlight()
+
+
+def reference_conflict() -> Dict[str, Any]:
+    return {"status": False, "error": "reference_conflict"}
+
+
+async def _topup_recorded(
+    dessly_token: str,
+    username: str,
+    amount: float,
+    reference: Optional[str],
+    user_id: int,
+    api_token_id: Optional[int],
+) -> Dict[str, Any]:
+    if reference is not None:
+        stored = await find_reference(user_id, reference)
+        if stored is not None and not stored.matches(username, amount):
+            logger.warning(f"Topup reference {reference!r} reused with different username/amount")
+            return reference_conflict()
+        if stored is not None and stored.final:
+            logger.info(f"Topup reference {reference!r} already processed, returning stored result")
+            return {**stored.result, "duplicate": True}
+        if stored is not None:
+            logger.info(f"Topup reference {reference!r} has unknown outcome, retrying in Dessly")
+
+    started = time.monotonic()
+    result = await _topup_upstream(dessly_token, username, amount, reference)
+    if result.get("error") not in NOT_SENT_ERRORS:
+        await record_topup(
+            user_id, api_token_id, reference, username, amount,
+            result, topup_status(result), time.monotonic() - started,
+        )
+    return result
+
+
+async def topup(
+    dessly_token: str,
+    username: str,
+    amount: float,
+    reference: Optional[str] = None,
+    user_id: Optional[int] = None,
+    api_token_id: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Результат в формате ответа /dessly/steam/topup.
+    Без user_id — только запрос к Dessly, без журнала и проверки reference.
+    """
+    if user_id is None:
+        return await _topup_upstream(dessly_token, username, amount, reference)
+
+    if reference is None:
+        return await _topup_recorded(dessly_token, username, amount, None, user_id, api_token_id)
+
+    # Одновременные повторы ждут первый запрос; если он был с другими параметрами — конфликт
+    fields = request_fields(username, amount)
+
+    async def first() -> Tuple[Tuple[str, Any], Dict[str, Any]]:
+        return fields, await _topup_recorded(dessly_token, username, amount, reference, user_id, api_token_id)
+
+    first_fields, result = await _reference_flight.do((user_id, reference), first)
+    if first_fields != fields:
+        return reference_conflict()
+    return result
+
+
+class TopupQueueFull(Exception):
+    """Очередь заданий переполнена"""
+
+
+class TopupQueueStopped(TopupQueueFull):
+    """Очередь останавливается и новые задания не принимает"""
+
+
+@dataclass(slots=True)
+class TopupJob:
+    id: str
+    user_id: int
+    api_token_id: Optional[int]
+    username: str
+    amount: float
+    reference: Optional[str]
+    dessly_token: Optional[str] = field(default=None, repr=False)
+    status: str = QUEUED
+    result: Optional[Dict[str, Any]] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+    # Пуш результата в соединение, поставившее задание
+    notify: Optional[Callable[["TopupJob"], Awaitable[None]]] = field(default=None, repr=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "username": self.username,
+            "amount": self.amount,
+            "reference": self.reference,
+            "result": self.result,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class TopupQueue:
+    def __init__(
+        self,
+        workers: int = 8,
+        max_queue: int = 1000,
+        job_ttl: float = 3600.0,
+        max_jobs: int = 100000,
+        drain_timeout: float = 30.0,
+    ):
+        self.workers = workers
+        self.drain_timeout = drain_timeout
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._jobs = TTLCache(maxsize=max_jobs, ttl=job_ttl)
+        self._tasks: List[asyncio.Task] = []
+        # Выполняемые задания: отмена воркера их не прерывает
+        self._running: Set[asyncio.Task] = set()
+        self._accepting = True
+
+        self.submitted = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def submit(
+        self,
+        user_id: int,
+        api_token_id: Optional[int],
+        dessly_token: str,
+        username: str,
+        amount: float,
+        reference: Optional[str] = None,
+        notify: Optional[Callable[[TopupJob], Awaitable[None]]] = None,
+    ) -> TopupJob:
+        if not self._accepting:
+            self.rejected += 1
+            raise TopupQueueStopped()
+
+        job = TopupJob(
+            id=uuid.uuid4().hex,
+            user_id=user_id,
+            api_token_id=api_token_id,
+            username=username,
+            amount=amount,
+            reference=reference,
+            dessly_token=dessly_token,
+            notify=notify,
+        )
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise TopupQueueFull()
+
+        self._jobs.set(job.id, job)
+        self.submitted += 1
+        return job
+
+    def get(self, job_id: str, user_id: Optional[int] = None) -> Optional[TopupJob]:
+        """Задание по id; с user_id — только если оно принадлежит этому пользователю"""
+        job = self._jobs.get(job_id)
+        if job is None or (user_id is not None and job.user_id != user_id):
+            return None
+        return job
+
+    async def _run(self, job: TopupJob):
+        job.status = RUNNING
+        try:
+            job.result = await topup(
+                job.dessly_token, job.username, job.amount, job.reference,
+                user_id=job.user_id, api_token_id=job.api_token_id,
+            )
+        except Exception as e:
+            logger.error(f"Topup job {job.id} failed: {e}")
+            job.result = {"status": False, "error": "internal_error"}
+
+        job.status = DONE
+        job.finished_at = time.time()
+        job.dessly_token = None
+        # TTL хранения отсчитывается от завершения
+        self._jobs.set(job.id, job)
+        self.completed += 1
+
+        notify, job.notify = job.notify, None
+        if notify is not None:
+            try:
+                await notify(job)
+            except Exception as e:
+                logger.debug(f"Topup job {job.id} push failed: {e}")
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            run = asyncio.ensure_future(self._run(job))
+            self._running.add(run)
+            run.add_done_callback(self._running.discard)
+            try:
+                # shield: при остановке начатое пополнение доходит до журнала
+                await asyncio.shield(run)
+            finally:
+                self._queue.task_done()
+
+    def start(self):
+        self._accepting = True
+        self._tasks = [t for t in self._tasks if not t.done()]
+        for _ in range(self.workers - len(self._tasks)):
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def stop(self, timeout: Optional[float] = None):
+        """
+        Перестаёт принимать задания и ждёт, пока очередь опустеет (не дольше timeout).
+        Потом воркеры отменяются, но уже начатые задания дожидаются.
+        """
+        self._accepting = False
+        timeout = self.drain_timeout if timeout is None else timeout
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Topup queue drain timed out after {timeout}s")
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._running, return_exceptions=True)
+        self._tasks = []
+
+        # Не начатые задания в Dessly не уходили: повтор с тем же reference безопасен
+        while not self._queue.empty():
+            job = self._queue.get_nowait()
+            self._queue.task_done()
+            logger.warning(f"Topup job {job.id} (reference={job.reference!r}) not started before shutdown")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": len(self._tasks),
+            "queued": self._queue.qsize(),
+            "running": len(self._running),
+            "accepting": self._accepting,
+            "max_queue": self._queue.maxsize,
+            "jobs": len(self._jobs),
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+topup_queue = TopupQueue(
+    workers=settings.TOPUP_WORKERS,
+    max_queue=settings.TOPUP_QUEUE_SIZE,
+    job_ttl=settings.TOPUP_JOB_TTL,
+    drain_timeout=settings.TOPUP_DRAIN_TIMEOUT,
+)
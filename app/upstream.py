@@ -0,0 +1,307 @@
+"""
+Защита от деградации Dessly: адаптивный лимит параллельных запросов (AIMD)
+и автоматический выключатель (circuit breaker).
+
+- AIMDLimiter: лимит растёт на 1/limit за каждый быстрый успешный ответ и
+  умножается на UPSTREAM_LIMIT_BACKOFF при ошибке или ответе медленнее
+  UPSTREAM_LATENCY_TARGET. Запросы сверх лимита ждут слот не дольше
+  UPSTREAM_QUEUE_TIMEOUT — дальше отказ, а не висящая корутина.
+- CircuitBreaker: по окну последних вызовов считает долю ошибок и медленных
+  ответов; при превышении порогов размыкается на BREAKER_OPEN_SECONDS и сразу
+  отказывает. Затем пропускает BREAKER_HALF_OPEN_PROBES пробных запросов:
+  все успешны — замыкается, любая ошибка — снова размыкается.
+
+Все вызовы Dessly идут через dessly_guard (app/dessly_client.py).
+"""
+
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, Optional, Tuple
+from app.config import settings
+from cl import logger
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class UpstreamUnavailable(Exception):
+    """Запрос к апстриму не отправлялся: выключатель разомкнут или нет свободного слота"""
+
+    def __init__(self, upstream: str, reason: str):
+        super().__init__(f"{upstream} unavailable: {reason}")
+        self.upstream = upstream
+        self.reason = reason
+
+
+class AIMDLimiter:
+    def __init__(
+        self,
+        initial: float = 20,
+        min_limit: float = 2,
+        max_limit: float = 200,
+        latency_target: float = 1.0,
+        backoff: float = 0.7,
+        max_waiters: int = 1000,
+    ):
+        self.limit = float(initial)
+        self.min_limit = float(min_limit)
+        self.max_limit = float(max_limit)
+        self.latency_target = latency_target
+        self.backoff = backoff
+        self.max_waiters = max_waiters
+
+        self.inflight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+
+        self.rejected = 0
+        self.increases = 0
+        self.decreases = 0
+
+    def _wake(self):
+        while self._waiters and self.inflight < int(self.limit):
+            fut = self._waiters.popleft()
+            if fut.done():
+                continue
+            self.inflight += 1
+            fut.set_result(True)
+
+    async def acquire(self, timeout: float, upstream: str):
+        if self.inflight < int(self.limit) and not self._waiters:
+            self.inflight += 1
+            return
+
+        if len(self._waiters) >= self.max_waiters:
+            self.rejected += 1
+            raise UpstreamUnavailable(upstream, "overloaded")
+
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await asyncio.wait_for(fut, timeout)
+        except BaseException as e:
+            if fut.done() and not fut.cancelled():
+                # Слот уже выдан, но ожидающий ушёл — возвращаем его
+                self.inflight -= 1
+                self._wake()
+            else:
+                try:
+                    self._waiters.remove(fut)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                self.rejected += 1
+                raise UpstreamUnavailable(upstream, "queue_timeout") from None
+            raise
+
+    def release(self, ok: Optional[bool], latency: float):
+        """ok=None — вызов отменён, на лимит не влияет"""
+        self.inflight -= 1
+
+        if ok is True and latency <= self.latency_target:
+            if self.limit < self.max_limit:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                self.increases += 1
+        elif ok is not None:
+            # Не чаще раза за latency_target: пачка одновременных ошибок — одно снижение
+            now = time.monotonic()
+            if now - self._last_decrease >= self.latency_target:
+                self._last_decrease = now
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self.decreases += 1
+
+        self._wake()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limit": round(self.limit, 2),
+            "min_limit": self.min_limit,
+            "max_limit": self.max_limit,
+            "inflight": self.inflight,
+            "waiting": len(self._waiters),
+            "rejected": self.rejected,
+            "increases": self.increases,
+            "decreases": self.decreases,
+        }
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        window: int = 50,
+        min_calls: int = 20,
+        error_rate: float = 0.5,
+        slow_rate: float = 0.8,
+        slow_call_seconds: float = 5.0,
+        open_seconds: float = 10.0,
+        half_open_probes: int = 3,
+    ):
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_rate = slow_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+
+        self.state = CLOSED
+        # (ok, slow) последних вызовов в замкнутом состоянии
+        self._window: Deque[Tuple[bool, bool]] = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probes_inflight = 0
+        self._probes_ok = 0
+
+        self.opened = 0
+        self.rejected = 0
+
+    def _open(self, upstream: str, reason: str):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._window.clear()
+        self.opened += 1
+        logger.warning(f"Circuit breaker for {upstream} opened: {reason}")
+
+    def allow(self, upstream: str) -> str:
+        """Пропускает вызов или бросает UpstreamUnavailable; возвращает состояние на момент допуска"""
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                self.rejected += 1
+                raise UpstreamUnavailable(upstream, "circuit_open")
+            self.state = HALF_OPEN
+            self._probes_inflight = 0
+            self._probes_ok = 0
+            logger.info(f"Circuit breaker for {upstream} half-open")
+
+        if self.state == HALF_OPEN:
+            if self._probes_inflight + self._probes_ok >= self.half_open_probes:
+                self.rejected += 1
+                raise UpstreamUnavailable(upstream, "circuit_half_open")
+            self._probes_inflight += 1
+
+        return self.state
+
+    def record(self, admitted: str, ok: Optional[bool], latency: float, upstream: str):
+        if admitted == HALF_OPEN:
+            if self.state != HALF_OPEN:
+                return
+            self._probes_inflight -= 1
+            if ok is None:
+                return
+            if ok and latency < self.slow_call_seconds:
+                self._probes_ok += 1
+                if self._probes_ok >= self.half_open_probes:
+                    self.state = CLOSED
+                    logger.info(f"Circuit breaker for {upstream} closed")
+            else:
+                self._open(upstream, "half-open probe failed")
+            return
+
+        if ok is None or self.state != CLOSED:
+            return
+
+        self._window.append((ok, latency >= self.slow_call_seconds))
+        calls = len(self._window)
+        if calls < self.min_calls:
+            return
+
+        errors = sum(1 for call_ok, _ in self._window if not call_ok)
+        slow = sum(1 for _, call_slow in self._window if call_slow)
+        if errors / calls >= self.error_rate:
+            self._open(upstream, f"error rate {errors}/{calls}")
+        elif slow / calls >= self.slow_rate:
+            self._open(upstream, f"slow calls {slow}/{calls}")
+
+    def stats(self) -> Dict[str, Any]:
+        calls = len(self._window)
+        errors = sum(1 for ok, _ in self._window if not ok)
+        slow = sum(1 for _, is_slow in self._window if is_slow)
+        return {
+            "state": self.state,
+            "window_calls": calls,
+            "window_errors": errors,
+            "window_slow": slow,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "retry_in": (
+                round(max(0.0, self.open_seconds - (time.monotonic() - self._opened_at)), 3)
+                if self.state == OPEN else None
+            ),
+        }
+
+
+class UpstreamGuard:
+    """Лимитер + выключатель для одного апстрима"""
+
+    def __init__(self, name: str, limiter: AIMDLimiter, breaker: CircuitBreaker, queue_timeout: float = 2.0):
+        self.name = name
+        self.limiter = limiter
+        self.breaker = breaker
+        self.queue_timeout = queue_timeout
+
+        self.calls = 0
+        self.failures = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        """
+        Оборачивает один вызов апстрима. Исключение внутри блока считается
+        ошибкой апстрима; ответ с плохим статусом — через выставление call["ok"] = False.
+        """
+        admitted = self.breaker.allow(self.name)
+        try:
+            await self.limiter.acquire(self.queue_timeout, self.name)
+        except BaseException:
+            self.breaker.record(admitted, None, 0.0, self.name)
+            raise
+
+        self.calls += 1
+        call = {"ok": True}
+        started = time.monotonic()
+        try:
+            yield call
+        except asyncio.CancelledError:
+            call["ok"] = None
+            raise
+        except BaseException:
+            call["ok"] = False
+            raise
+        finally:
+            latency = time.monotonic() - started
+            if call["ok"] is False:
+                self.failures += 1
+            self.limiter.release(call["ok"], latency)
+            self.breaker.record(admitted, call["ok"], latency, self.name)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "failures": self.failures,
+            "breaker": self.breaker.stats(),
+            "limiter": self.limiter.stats(),
+        }
+
+
+dessly_guard = UpstreamGuard(
+    "dessly",
+    limiter=AIMDLimiter(
+        initial=settings.UPSTREAM_LIMIT_INITIAL,
+        min_limit=settings.UPSTREAM_LIMIT_MIN,
+        max_limit=settings.UPSTREAM_LIMIT_MAX,
+        latency_target=settings.UPSTREAM_LATENCY_TARGET,
+        backoff=settings.UPSTREAM_LIMIT_BACKOFF,
+        max_waiters=settings.UPSTREAM_QUEUE_SIZE,
+    ),
+    breaker=CircuitBreaker(
+        window=settings.BREAKER_WINDOW,
+        min_calls=settings.BREAKER_MIN_CALLS,
+        error_rate=settings.BREAKER_ERROR_RATE,
+        slow_rate=settings.BREAKER_SLOW_RATE,
+        slow_call_seconds=settings.BREAKER_SLOW_CALL_SECONDS,
+        open_seconds=settings.BREAKER_OPEN_SECONDS,
+        half_open_probes=settings.BREAKER_HALF_OPEN_PROBES,
+    ),
+    queue_timeout=settings.UPSTREAM_QUEUE_TIMEOUT,
+)
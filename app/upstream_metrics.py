@@ -0,0 +1,185 @@
+"""
+Метрики исходящих запросов (Dessly, GitHub) по эндпоинтам:
+- гистограмма задержек (UPSTREAM_LATENCY_BUCKETS, мс) с оценкой p50/p90/p99;
+- счётчики HTTP-статусов и исключений (timeout, connection_error, rejected, error);
+- счётчики error_code из ответов Dessly;
+- текущее и максимальное число запросов в полёте;
+- переданные и полученные байты.
+
+Запросы, которые dessly_guard отклонил без отправки, считаются как rejected
+и в гистограмму не попадают. Отдаются через GET /metrics/upstream (уровень 2).
+"""
+
+import asyncio
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Tuple
+import aiohttp
+from app.upstream import UpstreamUnavailable
+
+
+# Верхние границы корзин гистограммы, мс (последняя корзина — +Inf)
+UPSTREAM_LATENCY_BUCKETS: Tuple[float, ...] = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class LatencyHistogram:
+    def __init__(self, bounds: Tuple[float, ...] = UPSTREAM_LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.counts: List[int] = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value_ms: float):
+        self.counts[bisect_left(self.bounds, value_ms)] += 1
+        self.count += 1
+        self.sum += value_ms
+        if value_ms > self.max:
+            self.max = value_ms
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Верхняя граница корзины, в которую попадает квантиль q (не больше максимума)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank and n:
+                bound = self.bounds[i] if i < len(self.bounds) else self.max
+                return round(min(bound, self.max), 3)
+        return round(self.max, 3)
+
+    def snapshot(self) -> Dict[str, Any]:
+        buckets = {str(bound): n for bound, n in zip(self.bounds, self.counts)}
+        buckets["+Inf"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 3),
+            "avg": round(self.sum / self.count, 3) if self.count else None,
+            "max": round(self.max, 3),
+            "p50": self.quantile(0.50),
+            "p90": self.quantile(0.90),
+            "p99": self.quantile(0.99),
+            "buckets": buckets,
+        }
+
+
+class UpstreamCall:
+    """Заполняется вызывающим кодом внутри upstream_metrics.track()"""
+
+    __slots__ = ("status", "error_code", "bytes_sent", "bytes_received")
+
+    def __init__(self):
+        self.status: Optional[int] = None
+        self.error_code: Any = None
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+
+class EndpointMetrics:
+    def __init__(self):
+        # Загрузка обновлений GitHub идёт в отдельном потоке (BackgroundTasks + asyncio.run)
+        self._lock = threading.Lock()
+        self.latency = LatencyHistogram()
+        self.outcomes: Counter = Counter()
+        self.error_codes: Counter = Counter()
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def started(self):
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            if self.in_flight > self.max_in_flight:
+                self.max_in_flight = self.in_flight
+
+    def finished(self, call: UpstreamCall, outcome: str, latency_ms: Optional[float]):
+        with self._lock:
+            self.in_flight -= 1
+            self.outcomes[outcome] += 1
+            if call.error_code is not None:
+                self.error_codes[str(call.error_code)] += 1
+            self.bytes_sent += call.bytes_sent
+            self.bytes_received += call.bytes_received
+            if latency_ms is not None:
+                self.latency.observe(latency_ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight,
+                "outcomes": dict(self.outcomes),
+                "error_codes": dict(self.error_codes),
+                "bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received,
+                "latency_ms": self.latency.snapshot(),
+            }
+
+
+def _outcome(exc: BaseException) -> str:
+    if isinstance(exc, UpstreamUnavailable):
+        return "rejected"
+    if isinstance(exc, asyncio.TimeoutError):
+        return "timeout"
+    if isinstance(exc, aiohttp.ClientError):
+        return "connection_error"
+    if isinstance(exc, (asyncio.CancelledError, GeneratorExit)):
+        return "cancelled"
+    return "error"
+
+
+class UpstreamMetrics:
+    def __init__(self):
+        self._endpoints: Dict[Tuple[str, str], EndpointMetrics] = {}
+        self._lock = threading.Lock()
+
+    def endpoint(self, upstream: str, name: str) -> EndpointMetrics:
+        key = (upstream, name)
+        metrics = self._endpoints.get(key)
+        if metrics is None:
+            with self._lock:
+                metrics = self._endpoints.setdefault(key, EndpointMetrics())
+        return metrics
+
+    @asynccontextmanager
+    async def track(self, upstream: str, name: str):
+        """
+        Замер одного запроса. Статус, error_code и байты заполняет вызывающий код
+        в полученном UpstreamCall; исключение записывается как исход и пробрасывается.
+        """
+        metrics = self.endpoint(upstream, name)
+        call = UpstreamCall()
+        metrics.started()
+        started = time.perf_counter()
+        try:
+            yield call
+        except BaseException as e:
+            outcome = _outcome(e)
+            latency = None if outcome == "rejected" else (time.perf_counter() - started) * 1000
+            metrics.finished(call, outcome, latency)
+            raise
+        metrics.finished(call, str(call.status), (time.perf_counter() - started) * 1000)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            items = sorted(self._endpoints.items())
+        result: Dict[str, Dict[str, Any]] = {}
+        for (upstream, name), metrics in items:
+            result.setdefault(upstream, {})[name] = metrics.snapshot()
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._endpoints = {}
+
+
+upstream_metrics = UpstreamMetrics()
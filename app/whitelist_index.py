@@ -0,0 +1,180 @@
+"""
+Скомпилированный in-memory индекс белого списка (IP, CIDR-диапазоны, домены).
+Загружается из таблицы whitelisted_entries при старте и пересобирается целиком
+при изменениях — проверка whitelist не делает запросов в БД.
+
+Поддерживаемые форматы записей:
+- 1.2.3.4 / 2001:db8::1      — точный IP
+- 10.0.0.0/8 / 2001:db8::/32 — диапазон CIDR
+- example.com                — точный домен
+- *.example.com              — любой поддомен example.com
+"""
+
+import asyncio
+import ipaddress
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import select
+from app.database import AsyncSessionLocal, WhitelistedEntry
+from app.config import settings
+from cl import logger
+
+
+class _DomainNode:
+    """Узел trie доменов: дочерние метки и флаги отдельно, любая метка — просто ключ"""
+
+    __slots__ = ("children", "exact", "wildcard")
+
+    def __init__(self):
+        self.children: Dict[str, "_DomainNode"] = {}
+        self.exact = False
+        self.wildcard = False
+
+
+def normalize_domain(domain: str) -> str:
+    """Приводит домен/host из Origin к виду для сравнения (без порта и регистра)"""
+    domain = domain.strip().lower().rstrip(".")
+    if domain.startswith("["):
+        return domain
+    return domain.split(":", 1)[0]
+
+
+class WhitelistIndex:
+    """Неизменяемый индекс: после сборки только читается"""
+
+    def __init__(self, values: Iterable[str] = ()):
+        # Точные IP: хэш-множество по (версия, int)
+        self.ips: Set[Tuple[int, int]] = set()
+        # CIDR: версия -> [(prefixlen, mask, {network_int})], от длинного префикса к короткому
+        self.networks: Dict[int, List[Tuple[int, int, Set[int]]]] = {4: [], 6: []}
+        # Домены: trie по меткам в обратном порядке (com -> example -> api)
+        self.domains = _DomainNode()
+        self.size = 0
+
+        prefixes: Dict[int, Dict[int, Set[int]]] = {4: {}, 6: {}}
+
+        for raw in values:
+            value = (raw or "").strip()
+            if not value:
+                continue
+            self.size += 1
+
+            if "/" in value:
+                try:
+                    net = ipaddress.ip_network(value, strict=False)
+                except ValueError:
+                    logger.warning(f"Whitelist: invalid network skipped: {value}")
+                    continue
+                prefixes[net.version].setdefault(net.prefixlen, set()).add(int(net.network_address))
+                continue
+
+            try:
+                ip = ipaddress.ip_address(value)
+                self.ips.add((ip.version, int(ip)))
+                continue
+            except ValueError:
+                pass
+
+            self._add_domain(normalize_domain(value))
+
+        for version, by_len in prefixes.items():
+            bits = 32 if version == 4 else 128
+            full = (1 << bits) - 1
+            self.networks[version] = [
+                (plen, full ^ ((1 << (bits - plen)) - 1), nets)
+                for plen, nets in sorted(by_len.items(), reverse=True)
+            ]
+
+    def _add_domain(self, domain: str):
+        wildcard = domain.startswith("*.")
+        if wildcard:
+            domain = domain[2:]
+
+        node = self.domains
+        for label in reversed(domain.split(".")):
+            child = node.children.get(label)
+            if child is None:
+                child = node.children[label] = _DomainNode()
+            node = child
+        if wildcard:
+            node.wildcard = True
+        else:
+            node.exact = True
+
+    def allows_ip(self, client_ip: Optional[str]) -> bool:
+        if not client_ip:
+            return False
+        try:
+            ip = ipaddress.ip_address(client_ip)
+        except ValueError:
+            return False
+
+        if ip.version == 6 and ip.ipv4_mapped is not None:
+            ip = ip.ipv4_mapped
+
+        value = int(ip)
+        if (ip.version, value) in self.ips:
+            return True
+
+        for _plen, mask, nets in self.networks[ip.version]:
+            if value & mask in nets:
+                return True
+        return False
+
+    def allows_domain(self, domain: Optional[str]) -> bool:
+        if not domain:
+            return False
+
+        labels = normalize_domain(domain).split(".")
+        node = self.domains
+        for i, label in enumerate(reversed(labels)):
+            node = node.children.get(label)
+            if node is None:
+                return False
+            # *.example.com совпадает только если осталась хотя бы одна метка
+            if node.wildcard and i < len(labels) - 1:
+                return True
+        return node.exact
+
+    def is_allowed(self, client_ip: Optional[str], domain: Optional[str]) -> bool:
+        return self.allows_ip(client_ip) or self.allows_domain(domain)
+
+
+# Текущий индекс. Подменяется целиком (атомарно для event loop) при пересборке.
+whitelist_index = WhitelistIndex()
+
+
+def get_whitelist_index() -> WhitelistIndex:
+    return whitelist_index
+
+
+async def reload_whitelist(db=None) -> WhitelistIndex:
+    """Пересобирает индекс из БД и атомарно подменяет текущий"""
+    global whitelist_index
+
+    if db is None:
+        async with AsyncSessionLocal() as session:
+            return await reload_whitelist(session)
+
+    result = await db.execute(select(WhitelistedEntry.value))
+    new_index = WhitelistIndex(result.scalars().all())
+    whitelist_index = new_index
+
+    logger.info(f"Whitelist index rebuilt: {new_index.size} entries")
+    return new_index
+
+
+async def whitelist_refresh_loop():
+    """
+    Периодическая пересборка индекса: подхватывает изменения,
+    сделанные другими воркерами/процессами.
+    """
+    interval = settings.WHITELIST_REFRESH_SECONDS
+    if interval <= 0:
+        return
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await reload_whitelist()
+        except Exception as e:
+            logger.error(f"Whitelist refresh failed: {e}")
@@ -1,5 +1,18 @@
-from typing import Dict, Callable
+"""
+Диспетчер WebSocket-сообщений.
+
+Сообщение с request_id выполняется отдельной задачей: ответы обработчика
+получают тот же request_id и могут приходить не в порядке запросов.
+Одновременно на соединение выполняется не больше WS_MAX_INFLIGHT таких
+сообщений — дальше чтение сокета ждёт освобождения слота.
+Сообщения без request_id, как и раньше, выполняются по очереди.
+"""
+
+import asyncio
+from typing import Any, Dict, Callable, Set
 import msgpack
+from app.ws_manager import ConnectionClosed
+from cl import logger
 
 handlers: Dict[str, Callable] = {}
 
@@ -26,3 +39,97 @@ async def dispatch(ws, msg: dict):
         return
 
     await handler(ws, msg)
+
+
+def with_request_id(data: bytes, suffix: bytes) -> bytes:
+    """
+    Добавляет в упакованный msgpack-словарь пару request_id (suffix — уже упакованные
+    ключ и значение), не распаковывая его: увеличивается только счётчик в заголовке.
+    """
+    first = data[0] if data else 0
+    if 0x80 <= first <= 0x8e:
+        return bytes((first + 1,)) + data[1:] + suffix
+    if first == 0x8f:
+        return b"\xde\x00\x10" + data[1:] + suffix
+    if first == 0xde:
+        count = int.from_bytes(data[1:3], "big") + 1
+        header = b"\xde" + count.to_bytes(2, "big") if count <= 0xFFFF else b"\xdf" + count.to_bytes(4, "big")
+        return header + data[3:] + suffix
+    if first == 0xdf:
+        return b"\xdf" + (int.from_bytes(data[1:5], "big") + 1).to_bytes(4, "big") + data[5:] + suffix
+    return data
+
+
+class RequestSocket:
+    """
+    Сокет, который видит обработчик сообщения с request_id:
+    всё, что он отправляет, помечается этим request_id. Остальное — как у ws.
+    """
+
+    __slots__ = ("ws", "request_id", "_suffix")
+
+    def __init__(self, ws, request_id: Any):
+        self.ws = ws
+        self.request_id = request_id
+        self._suffix = msgpack.packb("request_id") + msgpack.packb(request_id, use_bin_type=True)
+
+    async def send_bytes(self, data: bytes):
+        await self.ws.send_bytes(with_request_id(data, self._suffix))
+
+    def __getattr__(self, name: str):
+        return getattr(self.ws, name)
+
+
+class ConnectionDispatcher:
+    """Выполнение сообщений одного соединения"""
+
+    def __init__(self, ws, max_inflight: int = 16):
+        self.ws = ws
+        self._slots = asyncio.Semaphore(max(1, max_inflight))
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def _run(self, target, msg: dict):
+        try:
+            await dispatch(target, msg)
+        except asyncio.CancelledError:
+            raise
+        except ConnectionClosed:
+            # соединение закрыто (клиент ушёл или отключён как медленный)
+            pass
+        except Exception as e:
+            logger.error(f"WS handler {msg.get('type')!r} failed: {e}")
+            try:
+                await target.send_bytes(
+                    msgpack.packb({"type": "error", "error": "internal_error"}, use_bin_type=True)
+                )
+            except Exception:
+                pass
+
+    async def _run_task(self, target, msg: dict):
+        try:
+            await self._run(target, msg)
+        finally:
+            self._slots.release()
+
+    async def submit(self, msg: dict):
+        request_id = msg.get("request_id")
+        if request_id is None:
+            await self._run(self.ws, msg)
+            return
+
+        await self._slots.acquire()
+        task = asyncio.create_task(self._run_task(RequestSocket(self.ws, request_id), msg))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    @property
+    def inflight(self) -> int:
+        return len(self._tasks)
+
+    async def close(self):
+        """Отменяет незавершённые обработчики (соединение закрыто)"""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
@@ -1,2 +1,2 @@
-from . import ping
-from .dessly import account
\ No newline at end of file
+from . import ping, subscribe, config
+from .dessly import account, currency, steam
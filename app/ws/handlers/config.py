@@ -0,0 +1,13 @@
+from app.ws.dispatcher import register_handler
+from app.config_feed import config_feed
+
+
+@register_handler("config/sync")
+async def handle_config_sync(ws, msg):
+    """
+    Изменения конфига с версии клиента: {"type": "config/sync", "epoch": ..., "version": N}.
+    Ответ — config_delta от N до текущей версии или config_full, если догнать нельзя
+    (другой epoch, версия слишком старая или не указана).
+    """
+
+    await ws.send_bytes(config_feed.sync_frame(msg.get("epoch"), msg.get("version")))
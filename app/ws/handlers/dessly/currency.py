@@ -1,25 +1,32 @@
 from app.ws.dispatcher import register_handler
 from cl import logger
-import aiohttp
+from app.rates import rates_cache, convert, RatesUnavailable, ConversionError
 import msgpack
-from decimal import Decimal, ROUND_DOWN
+from decimal import Decimal
 
-dessly_rates_url = "https://desslyhub.com/api/v1/exchange_rates/steam"
+# Максимум позиций в пакетном запросе
+MAX_BATCH_ITEMS = 1000
 
-currency_key = {
-    "KZT": 37,
-    "UAH": 18,
-    "RUB": 5,
-    "USD": 5,
+# Тексты ошибок одиночной конвертации (как раньше отдавал WS)
+conversion_errors = {
+    "unsupported_currency": "Unsupported currency",
+    "rate_missing": "Currency rate missing",
+    "rub_rate_missing": "RUB rate missing",
+    "invalid_input": "Invalid input data",
 }
 
 
 @register_handler("dessly/conversion")
 async def handle_dessly_conversion(ws, msg):
     """
-    Конвертация валюты через Dessly (WebSocket)
+    Конвертация валюты через Dessly (WebSocket).
+    Если в сообщении есть items — пакетная конвертация (см. handle_conversion_batch).
     """
 
+    if "items" in msg:
+        await handle_conversion_batch(ws, msg)
+        return
+
     # -------- 1. Валидация входных данных --------
     try:
         dessly_token = msg.get("dessly_token")
@@ -50,110 +57,114 @@ async def handle_dessly_conversion(ws, msg):
         )
         return
 
-    if currency not in currency_key:
+    # -------- 2. Курсы (из кэша) --------
+    try:
+        rates = await rates_cache.get(dessly_token)
+    except RatesUnavailable:
         await ws.send_bytes(
             msgpack.packb(
                 {
                     "type": "dessly/conversion",
-                    "error": "Unsupported currency"
+                    "error": "Error fetching exchange rates"
                 },
                 use_bin_type=True
             )
         )
         return
 
-    # -------- 2. Запрос курсов --------
-    headers = {
-        "Content-Type": "application/json",
-        "apikey": dessly_token,
-    }
-
+    # -------- 3. Конвертация --------
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(dessly_rates_url, headers=headers) as resp:
-                if resp.status != 200:
-                    raise RuntimeError("Dessly API error")
-
-                data = await resp.json()
-
-    except Exception as e:
-        logger.error(f"Dessly exchange rates error: {e}")
+        result = convert(rates, amount, currency, convert_to_rub)
+    except ConversionError as e:
         await ws.send_bytes(
             msgpack.packb(
                 {
                     "type": "dessly/conversion",
-                    "error": "Error fetching exchange rates"
+                    "error": conversion_errors[e.code]
                 },
                 use_bin_type=True
             )
         )
         return
 
-    logger.warning(f"Dessly rates: {data}")
+    # -------- 4. Ответ --------
+    await ws.send_bytes(
+        msgpack.packb(
+            {
+                "type": "dessly/conversion",
+                **result,
+                "error": None
+            },
+            use_bin_type=True
+        )
+    )
 
-    # -------- 3. Конвертация --------
-    currency_id = currency_key[currency]
 
-    if str(currency_id) not in data.get("exchange_rates", {}):
+async def handle_conversion_batch(ws, msg):
+    """
+    Пакетная конвертация: {"items": [{"amount", "currency", "convert_to_rub"}, ...]}.
+    Курсы читаются один раз; ответ — results в том же порядке,
+    у каждой позиции своё поле error.
+    """
+
+    dessly_token = msg.get("dessly_token")
+    items = msg.get("items")
+
+    if not dessly_token:
+        error = "Dessly token missing"
+    elif not isinstance(items, list) or len(items) > MAX_BATCH_ITEMS:
+        error = "Invalid input data"
+    else:
+        error = None
+
+    if error is not None:
         await ws.send_bytes(
             msgpack.packb(
                 {
                     "type": "dessly/conversion",
-                    "error": "Currency rate missing"
+                    "error": error
                 },
                 use_bin_type=True
             )
         )
         return
 
-    rate = Decimal(str(data["exchange_rates"][str(currency_id)]))
-    converted = amount / rate
-
-    truncated = converted.quantize(Decimal("0.00"), rounding=ROUND_DOWN)
-    final_amount = truncated + Decimal("0.01")
-
-    # -------- 4. Конвертация в RUB (если нужно) --------
-    if convert_to_rub:
-        rub_id = currency_key["RUB"]
-
-        if str(rub_id) not in data["exchange_rates"]:
-            await ws.send_bytes(
-                msgpack.packb(
-                    {
-                        "type": "dessly/conversion",
-                        "error": "RUB rate missing"
-                    },
-                    use_bin_type=True
-                )
-            )
-            return
-
-        rub_rate = Decimal(str(data["exchange_rates"][str(rub_id)]))
-        rub_amount = amount * rub_rate
-
+    try:
+        rates = await rates_cache.get(dessly_token)
+    except RatesUnavailable:
         await ws.send_bytes(
             msgpack.packb(
                 {
                     "type": "dessly/conversion",
-                    "original_amount_usd": str(amount),
-                    "converted_amount_rub": str(
-                        rub_amount.quantize(Decimal("0.00"), rounding=ROUND_DOWN)
-                    ),
-                    "error": None
+                    "error": "Error fetching exchange rates"
                 },
                 use_bin_type=True
             )
         )
         return
 
-    # -------- 5. Ответ --------
+    results = []
+    for item in items:
+        try:
+            amount = Decimal(str(item.get("amount")))
+            currency = item.get("currency")
+            convert_to_rub = bool(item.get("convert_to_rub", False))
+        except Exception:
+            results.append({"error": "invalid_input"})
+            continue
+
+        try:
+            results.append({**convert(rates, amount, currency, convert_to_rub), "error": None})
+        except ConversionError as e:
+            results.append({"original_amount": str(amount), "original_currency": currency, "error": e.code})
+        except (ArithmeticError, ValueError):
+            results.append({"original_amount": str(amount), "original_currency": currency, "error": "invalid_input"})
+
     await ws.send_bytes(
         msgpack.packb(
             {
                 "type": "dessly/conversion",
-                "original_amount": str(amount),
-                "original_currency": currency,
-                "converted_amount_usd": str(final_amount),
+                "results": results,
                 "error": None
             },
             use_bin_type=True
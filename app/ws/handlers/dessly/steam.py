@@ -0,0 +1,164 @@
+from app.ws.dispatcher import register_handler
+from app.config import settings
+from app.steam_login import check_login, check_logins
+from app.topup import topup_queue, TopupQueueFull
+from app.ledger import valid_amount
+from app.auth import get_auth_context
+import msgpack
+
+
+@register_handler("dessly/check_login")
+async def handle_dessly_check_login(ws, msg):
+    """
+    Проверка логина Steam через WebSocket.
+    С items — пакетная проверка: по кадру на логин по мере готовности
+    ({"index", "username", "status", "error"}), в конце кадр {"done": True}.
+    """
+
+    dessly_token = msg.get("dessly_token")
+    if not dessly_token:
+        await ws.send_bytes(
+            msgpack.packb(
+                {
+                    "type": "dessly/check_login",
+                    "error": "Dessly token missing"
+                },
+                use_bin_type=True
+            )
+        )
+        return
+
+    if "items" not in msg:
+        result = await check_login(dessly_token, msg.get("username"), msg.get("amount"))
+        await ws.send_bytes(
+            msgpack.packb(
+                {
+                    "type": "dessly/check_login",
+                    **result
+                },
+                use_bin_type=True
+            )
+        )
+        return
+
+    try:
+        items = [(item["username"], item["amount"]) for item in msg["items"]]
+        if len(items) > settings.CHECK_LOGIN_BATCH_MAX:
+            raise ValueError("too many items")
+    except Exception:
+        await ws.send_bytes(
+            msgpack.packb(
+                {
+                    "type": "dessly/check_login",
+                    "error": "Invalid input data"
+                },
+                use_bin_type=True
+            )
+        )
+        return
+
+    async for index, result in check_logins(dessly_token, items, settings.CHECK_LOGIN_CONCURRENCY):
+        await ws.send_bytes(
+            msgpack.packb(
+                {
+                    "type": "dessly/check_login",
+                    "index": index,
+                    "username": items[index][0],
+                    **result
+                },
+                use_bin_type=True
+            )
+        )
+
+    await ws.send_bytes(
+        msgpack.packb(
+            {
+                "type": "dessly/check_login",
+                "done": True,
+                "total": len(items),
+                "error": None
+            },
+            use_bin_type=True
+        )
+    )
+
+
+@register_handler("dessly/topup")
+async def handle_dessly_topup(ws, msg):
+    """
+    Асинхронное пополнение Steam через WebSocket.
+    {"username", "amount", "reference"} — задание ставится в очередь, сразу приходит
+    {"job_id", "status": "queued"}, по завершении — пуш {"job_id", "status": "done", "result"}.
+    {"job_id"} — текущий статус задания.
+    """
+
+    token = get_auth_context(ws)["token_obj"]
+
+    if "job_id" in msg:
+        job = topup_queue.get(str(msg.get("job_id")), user_id=token.user_id)
+        await ws.send_bytes(
+            msgpack.packb(
+                {"type": "dessly/topup", **job.to_dict(), "error": None}
+                if job is not None else
+                {"type": "dessly/topup", "job_id": msg.get("job_id"), "error": "Job not found"},
+                use_bin_type=True
+            )
+        )
+        return
+
+    dessly_token = msg.get("dessly_token")
+    username = msg.get("username")
+    amount = msg.get("amount")
+    if not dessly_token or not isinstance(username, str) or not username or not valid_amount(amount):
+        await ws.send_bytes(
+            msgpack.packb(
+                {
+                    "type": "dessly/topup",
+                    "error": "Invalid input data"
+                },
+                use_bin_type=True
+            )
+        )
+        return
+
+    async def push(job):
+        await ws.send_bytes(
+            msgpack.packb(
+                {"type": "dessly/topup", **job.to_dict(), "error": None},
+                use_bin_type=True
+            )
+        )
+
+    try:
+        job = topup_queue.submit(
+            user_id=token.user_id,
+            api_token_id=token.id,
+            dessly_token=dessly_token,
+            username=username,
+            amount=amount,
+            reference=msg.get("reference"),
+            notify=push,
+        )
+    except TopupQueueFull:
+        await ws.send_bytes(
+            msgpack.packb(
+                {
+                    "type": "dessly/topup",
+                    "error": "Topup queue is full"
+                },
+                use_bin_type=True
+            )
+        )
+        return
+
+    await ws.send_bytes(
+        msgpack.packb(
+            {
+                "type": "dessly/topup",
+                "job_id": job.id,
+                "status": job.status,
+                "error": None
+            },
+            use_bin_type=True
+        )
+    )
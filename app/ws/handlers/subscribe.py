@@ -0,0 +1,63 @@
+from app.ws.dispatcher import register_handler
+from app.ws_manager import ws_manager, TOPICS
+import msgpack
+
+
+def _topics(msg) -> list:
+    topics = msg.get("topics")
+    if isinstance(topics, str):
+        return [topics]
+    return topics if isinstance(topics, list) else []
+
+
+@register_handler("subscribe")
+async def handle_subscribe(ws, msg):
+    """
+    Подписка на темы: {"type": "subscribe", "topics": ["config", "news", ...]}.
+    После подписки изменения приходят сообщениями с type темы, опрашивать HTTP не нужно.
+    """
+
+    topics = _topics(msg)
+    unknown = [t for t in topics if t not in TOPICS]
+
+    if not topics or unknown:
+        await ws.send_bytes(
+            msgpack.packb(
+                {
+                    "type": "subscribe",
+                    "error": f"Unknown topics: {unknown}" if unknown else "Topics missing",
+                    "available": list(TOPICS)
+                },
+                use_bin_type=True
+            )
+        )
+        return
+
+    await ws.send_bytes(
+        msgpack.packb(
+            {
+                "type": "subscribe",
+                "topics": ws_manager.subscribe(ws.connection, topics),
+                "error": None
+            },
+            use_bin_type=True
+        )
+    )
+
+
+@register_handler("unsubscribe")
+async def handle_unsubscribe(ws, msg):
+    """Отписка от тем; без topics — от всех"""
+
+    topics = [t for t in _topics(msg) if t in TOPICS] if "topics" in msg else None
+
+    await ws.send_bytes(
+        msgpack.packb(
+            {
+                "type": "unsubscribe",
+                "topics": ws_manager.unsubscribe(ws.connection, topics),
+                "error": None
+            },
+            use_bin_type=True
+        )
+    )
@@ -1,9 +1,11 @@
 from fastapi import WebSocket, WebSocketDisconnect, Header, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.dependencies import get_db
-from app.auth import get_api_token_from_header
+from app.auth import get_current_user_or_api_token
 from app.ws_manager import ws_manager
-from app.ws.dispatcher import dispatch
+from app.ws.dispatcher import ConnectionDispatcher
+from app.config import settings
+from app.config_feed import config_feed
 from msgpack import unpackb
 import msgpack
 import app.ws.handlers
@@ -13,23 +15,34 @@ async def websocket_endpoint(
     authorization: str = Header(None),
     db: AsyncSession = Depends(get_db),
 ):
-    # авторизация
+    # авторизация: один поиск токена и одна запись аудита на всё соединение,
+    # обработчики берут контекст из ws.state.auth_context
     try:
-        await get_api_token_from_header(authorization, db)
+        auth_data = await get_current_user_or_api_token(ws, db)
     except Exception:
+        auth_data = None
+    finally:
+        # соединение с БД не держим на всё время жизни сокета
+        await db.close()
+
+    if not auth_data or auth_data["type"] != "api_token":
         await ws.close(code=1008)
         return
 
-    await ws_manager.connect(ws)
+    # ответы и рассылки идут через очередь соединения (app/ws_manager.py)
+    connection = await ws_manager.connect(ws)
+    dispatcher = ConnectionDispatcher(connection, max_inflight=settings.WS_MAX_INFLIGHT)
 
-    # отправка конфига при подключении (как у тебя и было)
-    # from app.config import config_cache
-    # await ws.send_bytes(
-    #     msgpack.packb({
-    #         "type": "config_full",
-    #         "data": config_cache
-    #     }, use_bin_type=True)
-    # )
+    # конфиг при подключении: снимок или, если клиент передал свою версию
+    # (?config_epoch=..&config_version=..), только изменения с неё; дальше — дельты
+    version = ws.query_params.get("config_version")
+    ws_manager.subscribe(connection, ["config"])
+    await connection.send_bytes(
+        config_feed.sync_frame(
+            ws.query_params.get("config_epoch"),
+            int(version) if version and version.isdigit() else None
+        )
+    )
 
     try:
         
@@ -37,11 +50,11 @@ async def websocket_endpoint(
             message = await ws.receive()
 
             if message["type"] == "websocket.disconnect":
-                return
+                break
 
             if "bytes" not in message or message["bytes"] is None:
                 # можно логировать или сразу закрывать
-                await ws.send_bytes(
+                await connection.send_bytes(
                     msgpack.packb(
                         {
                             "type": "error",
@@ -57,7 +70,10 @@ async def websocket_endpoint(
             if not isinstance(msg, dict):
                 continue
 
-            await dispatch(ws, msg)
+            await dispatcher.submit(msg)
 
     except WebSocketDisconnect:
+        pass
+    finally:
+        await dispatcher.close()
         await ws_manager.disconnect(ws)
@@ -1,37 +1,331 @@
+"""
+Реестр WebSocket-соединений и рассылка.
+
+У каждого соединения своя ограниченная очередь исходящих кадров
+(WS_SEND_QUEUE_SIZE) и задача-писатель: ответы обработчиков и рассылки
+идут через очередь, в сокет пишет только писатель.
+broadcast упаковывает сообщение один раз и раскладывает готовые байты по
+очередям без ожидания сокетов: медленный клиент не задерживает остальных.
+
+Медленный клиент (WS_SLOW_POLICY), когда его очередь полна при рассылке:
+- drop_oldest — выбрасывается самый старый кадр рассылки;
+- coalesce   — для типов COALESCIBLE_TYPES (важно только последнее значение)
+               ещё не отправленный кадр того же type заменяется новым;
+               news, config_delta и прочие не схлопываются — как drop_oldest;
+- disconnect — соединение закрывается с кодом WS_SLOW_CLOSE_CODE.
+Независимо от политики соединение закрывается с тем же кодом, если ответ
+обработчика ждёт места в очереди дольше WS_SEND_TIMEOUT или запись в сокет
+не завершается за WS_WRITE_TIMEOUT.
+
+Подписки: клиент подписывается на темы (TOPICS) сообщением subscribe,
+publish(topic, message) отправляет сообщение только подписчикам темы.
+"""
+
 from fastapi import WebSocket
-from typing import Set
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set, Tuple
 import asyncio
 import msgpack
+from app.config import settings
 from cl import logger
 
 
+DROP_OLDEST = "drop_oldest"
+COALESCE = "coalesce"
+DISCONNECT = "disconnect"
+SLOW_POLICIES = (DROP_OLDEST, COALESCE, DISCONNECT)
+
+# Темы, на которые можно подписаться
+TOPICS = ("config", "news", "version", "rates")
+
+# Типы сообщений, где новый кадр полностью заменяет старый (политика coalesce).
+# news и config_delta сюда не входят: каждый кадр несёт своё изменение.
+COALESCIBLE_TYPES = frozenset({"rates", "version", "config_full"})
+
+
 def pack(data: dict) -> bytes:
     return msgpack.packb(data, use_bin_type=True)
 
+
+class ConnectionClosed(Exception):
+    """Отправка в уже закрытое соединение"""
+
+
+class Connection:
+    """
+    WebSocket с очередью исходящих кадров.
+    Для обработчиков выглядит как сам WebSocket: send_bytes ставит кадр
+    в очередь, остальные атрибуты (state, client, ...) — от ws.
+    """
+
+    def __init__(
+        self,
+        ws: WebSocket,
+        max_queue: int = 256,
+        policy: str = DROP_OLDEST,
+        send_timeout: float = 10.0,
+        write_timeout: float = 10.0,
+        close_code: int = 4008,
+    ):
+        self.ws = ws
+        self.max_queue = max_queue
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.write_timeout = write_timeout
+        self.close_code = close_code
+
+        # (type кадра рассылки или None для ответа, байты)
+        self._frames: Deque[Tuple[Optional[str], bytes]] = deque()
+        self._ready = asyncio.Event()
+        self._space = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+        self.closed = False
+        self.topics: Set[str] = set()
+
+        self.dropped = 0
+        self.coalesced = 0
+        self.slow_closed = False
+
+    @property
+    def connection(self) -> "Connection":
+        """Само соединение (обработчик может получить сокет-обёртку над ним)"""
+        return self
+
+    def start(self):
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def qsize(self) -> int:
+        return len(self._frames)
+
+    async def _write_loop(self):
+        try:
+            while True:
+                while not self._frames and not self.closed:
+                    self._ready.clear()
+                    await self._ready.wait()
+                # wait_for до Python 3.12 может проглотить отмену, если запись
+                # завершилась одновременно с ней: выход — по флагу closed
+                if self.closed:
+                    return
+                _, data = self._frames.popleft()
+                self._space.set()
+                try:
+                    await asyncio.wait_for(self.ws.send_bytes(data), self.write_timeout)
+                except asyncio.TimeoutError:
+                    self._close_slow("write timeout")
+                    return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug(f"WS writer stopped: {e}")
+        finally:
+            self.closed = True
+            self._space.set()
+
+    def _append(self, key: Optional[str], data: bytes):
+        self._frames.append((key, data))
+        self._ready.set()
+
+    async def send_bytes(self, data: bytes):
+        """Кадр ответа: при полной очереди ждёт места не дольше send_timeout"""
+        if self.closed:
+            raise ConnectionClosed()
+        if len(self._frames) >= self.max_queue:
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.send_timeout
+            while len(self._frames) >= self.max_queue and not self.closed:
+                self._space.clear()
+                remaining = deadline - loop.time()
+                try:
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError()
+                    await asyncio.wait_for(self._space.wait(), remaining)
+                except asyncio.TimeoutError:
+                    self._close_slow("send queue full")
+                    raise ConnectionClosed()
+            if self.closed:
+                raise ConnectionClosed()
+        self._append(None, data)
+
+    def send_nowait(self, data: bytes, key: Optional[str] = None) -> bool:
+        """
+        Кадр рассылки (key — type сообщения; схлопывается только из COALESCIBLE_TYPES).
+        При полной очереди применяется политика; False — кадр не поставлен.
+        """
+        if self.closed:
+            return False
+
+        if self.policy == COALESCE and key in COALESCIBLE_TYPES:
+            for i, (pending_key, _) in enumerate(self._frames):
+                if pending_key == key:
+                    del self._frames[i]
+                    self.coalesced += 1
+                    self._append(key, data)
+                    return True
+
+        if len(self._frames) < self.max_queue:
+            self._append(key, data)
+            return True
+
+        if self.policy == DISCONNECT:
+            self.dropped += 1
+            self._close_slow("send queue full")
+            return False
+
+        # drop_oldest (и coalesce без кадра того же type): старейший кадр рассылки
+        for i, (pending_key, _) in enumerate(self._frames):
+            if pending_key is not None:
+                del self._frames[i]
+                self.dropped += 1
+                self._append(key, data)
+                return True
+
+        # В очереди только ответы — их не выбрасываем
+        self.dropped += 1
+        return False
+
+    def _close_slow(self, reason: str):
+        if self.closed:
+            return
+        self.closed = True
+        self.slow_closed = True
+        self._frames.clear()
+        self._space.set()
+        self._ready.set()
+        logger.warning(f"WS slow consumer closed ({reason}, policy={self.policy})")
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        asyncio.get_running_loop().create_task(self._close_socket())
+
+    async def _close_socket(self):
+        try:
+            await asyncio.wait_for(self.ws.close(code=self.close_code), self.write_timeout)
+        except Exception as e:
+            logger.debug(f"WS close failed: {e}")
+
+    async def close(self):
+        self.closed = True
+        self._ready.set()
+        if self._writer is not None:
+            self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
+        self._frames.clear()
+        # Освобождаем ждущих send_bytes
+        self._space.set()
+
+    def __getattr__(self, name: str):
+        return getattr(self.ws, name)
+
+
 class WebSocketManager:
-    def __init__(self):
-        self.connections: Set[WebSocket] = set()
-        self._lock = asyncio.Lock()
+    def __init__(
+        self,
+        max_queue: int = 256,
+        policy: str = DROP_OLDEST,
+        send_timeout: float = 10.0,
+        write_timeout: float = 10.0,
+        close_code: int = 4008,
+    ):
+        if policy not in SLOW_POLICIES:
+            logger.warning(f"Unknown WS_SLOW_POLICY {policy!r}, using {DROP_OLDEST}")
+            policy = DROP_OLDEST
+        self.max_queue = max_queue
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.write_timeout = write_timeout
+        self.close_code = close_code
+        # Изменения реестра синхронны (без await), поэтому блокировка не нужна
+        self.connections: Dict[WebSocket, Connection] = {}
+        # Тема -> подписанные соединения
+        self.subscribers: Dict[str, Set[Connection]] = {topic: set() for topic in TOPICS}
+
+        # Счётчики уже закрытых соединений
+        self.dropped = 0
+        self.coalesced = 0
+        self.slow_closed = 0
 
-    async def connect(self, ws: WebSocket):
+    async def connect(self, ws: WebSocket) -> Connection:
         await ws.accept()
-        async with self._lock:
-            self.connections.add(ws)
+        connection = Connection(
+            ws,
+            max_queue=self.max_queue,
+            policy=self.policy,
+            send_timeout=self.send_timeout,
+            write_timeout=self.write_timeout,
+            close_code=self.close_code,
+        )
+        connection.start()
+        self.connections[ws] = connection
         logger.info(f"WS connected ({len(self.connections)})")
+        return connection
 
     async def disconnect(self, ws: WebSocket):
-        async with self._lock:
-            self.connections.discard(ws)
+        connection = self.connections.pop(ws, None)
+        if connection is not None:
+            self.unsubscribe(connection)
+            self.dropped += connection.dropped
+            self.coalesced += connection.coalesced
+            self.slow_closed += connection.slow_closed
+            await connection.close()
         logger.info(f"WS disconnected ({len(self.connections)})")
 
-    async def broadcast(self, message: dict):
-        data = pack(message)
-        async with self._lock:
-            for ws in list(self.connections):
-                try:
-                    await ws.send_bytes(data)
-                except Exception:
-                    self.connections.discard(ws)
+    def broadcast_bytes(self, data: bytes, key: Optional[str] = None) -> int:
+        """Готовый кадр во все очереди; возвращает, скольким соединениям он поставлен"""
+        delivered = 0
+        for connection in list(self.connections.values()):
+            if connection.send_nowait(data, key):
+                delivered += 1
+        return delivered
+
+    async def broadcast(self, message: dict) -> int:
+        return self.broadcast_bytes(pack(message), message.get("type"))
+
+    def subscribe(self, connection: Connection, topics: Iterable[str]) -> List[str]:
+        """Подписывает соединение на темы; возвращает все его текущие темы"""
+        for topic in topics:
+            self.subscribers[topic].add(connection)
+            connection.topics.add(topic)
+        return sorted(connection.topics)
+
+    def unsubscribe(self, connection: Connection, topics: Optional[Iterable[str]] = None) -> List[str]:
+        """Отписывает от тем (None — от всех); возвращает оставшиеся темы"""
+        for topic in list(connection.topics if topics is None else topics):
+            self.subscribers[topic].discard(connection)
+            connection.topics.discard(topic)
+        return sorted(connection.topics)
+
+    def publish_bytes(self, topic: str, data: bytes, key: Optional[str] = None) -> int:
+        """Готовый кадр подписчикам темы; возвращает, скольким он поставлен"""
+        delivered = 0
+        for connection in list(self.subscribers[topic]):
+            if connection.send_nowait(data, key):
+                delivered += 1
+        return delivered
+
+    async def publish(self, topic: str, message: dict) -> int:
+        """Сообщение подписчикам темы (упаковывается один раз и только если они есть)"""
+        if not self.subscribers[topic]:
+            return 0
+        return self.publish_bytes(topic, pack(message), message.get("type"))
+
+    def stats(self) -> Dict[str, Any]:
+        connections = list(self.connections.values())
+        return {
+            "connections": len(connections),
+            "subscribers": {topic: len(members) for topic, members in self.subscribers.items()},
+            "queued": sum(c.qsize() for c in connections),
+            "max_queue": self.max_queue,
+            "policy": self.policy,
+            "dropped": self.dropped + sum(c.dropped for c in connections),
+            "coalesced": self.coalesced + sum(c.coalesced for c in connections),
+            "slow_closed": self.slow_closed + sum(c.slow_closed for c in connections),
+        }
 
 
-ws_manager = WebSocketManager()
\ No newline at end of file
+ws_manager = WebSocketManager(
+    max_queue=settings.WS_SEND_QUEUE_SIZE,
+    policy=settings.WS_SLOW_POLICY,
+    send_timeout=settings.WS_SEND_TIMEOUT,
+    write_timeout=settings.WS_WRITE_TIMEOUT,
+    close_code=settings.WS_SLOW_CLOSE_CODE,
+)
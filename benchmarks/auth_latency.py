@@ -0,0 +1,120 @@
+"""
+Бенчмарк латентности авторизации в зависимости от размера request_audit.
+
+Сравнивает:
+- legacy — загрузка APIToken целиком с прежними selectin-связями
+  (user -> api_tokens -> audits), как было до перевода связей на lazy="raise";
+- auth   — текущий путь get_api_token_from_header (промах кэша: выборка колонок).
+
+Временная база — SQLite через aiosqlite, он ставится из requirements-dev.txt:
+    pip install -r requirements-dev.txt
+
+Запуск (из корня проекта):
+    python benchmarks/auth_latency.py --steps 0 1000 10000 50000 --iterations 200
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+_db_path = os.path.join(tempfile.mkdtemp(prefix="auth_bench_"), "bench.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_db_path}")
+if not os.getenv("FERNET_KEY"):
+    from cryptography.fernet import Fernet
+    os.environ["FERNET_KEY"] = Fernet.generate_key().decode()
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import selectinload
+from app.database import AsyncSessionLocal, APIToken, RequestAudit, User, engine, init_db
+from app.auth import get_api_token_from_header, token_cache
+
+TOKENS_PER_USER = 5
+BATCH = 5000
+
+
+async def seed_tokens() -> str:
+    async with AsyncSessionLocal() as db:
+        user = User(username="bench")
+        db.add(user)
+        await db.flush()
+        for i in range(TOKENS_PER_USER):
+            db.add(APIToken(name=f"bench-{i}", key=f"bench-key-{i}", user_id=user.id, access_level=1))
+        await db.commit()
+    return "bench-key-0"
+
+
+async def add_audits(count: int):
+    """Добавляет count записей аудита, распределённых по токенам пользователя"""
+    async with AsyncSessionLocal() as db:
+        ids = (await db.execute(select(APIToken.id))).scalars().all()
+        for start in range(0, count, BATCH):
+            rows = [
+                {"path": "/account/balance", "method": "GET", "client_ip": "127.0.0.1", "api_token_id": ids[i % len(ids)]}
+                for i in range(start, min(start + BATCH, count))
+            ]
+            await db.execute(insert(RequestAudit).values(rows))
+        await db.commit()
+
+
+async def legacy_lookup(key: str):
+    async with AsyncSessionLocal() as db:
+        stmt = (
+            select(APIToken)
+            .options(
+                selectinload(APIToken.user).selectinload(User.api_tokens).selectinload(APIToken.audits),
+                selectinload(APIToken.audits),
+            )
+            .where(APIToken.key == key)
+        )
+        token = (await db.execute(stmt)).scalar_one()
+        return token.user.username
+
+
+async def auth_lookup(key: str):
+    token_cache.clear()  # меряем именно путь до БД
+    async with AsyncSessionLocal() as db:
+        principal = await get_api_token_from_header(f"Bearer {key}", db)
+        return principal.username
+
+
+async def measure(fn, key: str, iterations: int) -> float:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        await fn(key)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+async def main(steps, iterations: int):
+    await init_db()
+    key = await seed_tokens()
+
+    print(f"{'audit rows':>12} | {'legacy p50, ms':>15} | {'auth p50, ms':>13}")
+    print("-" * 47)
+
+    total = 0
+    for target in steps:
+        if target > total:
+            await add_audits(target - total)
+            total = target
+
+        legacy = await measure(legacy_lookup, key, max(1, iterations // 10))
+        current = await measure(auth_lookup, key, iterations)
+        print(f"{total:>12} | {legacy:>15.3f} | {current:>13.3f}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--steps", type=int, nargs="+", default=[0, 1000, 10000, 50000])
+    parser.add_argument("--iterations", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.steps, args.iterations))
@@ -0,0 +1,132 @@
+"""
+Локальная замена Dessly API для нагрузочных тестов.
+
+Отвечает на те же пути, что использует app/dessly_client.py:
+    GET  /api/v1/merchants/balance
+    GET  /api/v1/exchange_rates/steam
+    POST /api/v1/service/steamtopup/check_login
+    POST /api/v1/service/steamtopup/topup
+    GET  /api/v1/service/steamgift/games
+    GET  /api/v1/service/steamgift/games/{app_id}
+GET /stats — счётчики вызовов по эндпоинтам.
+
+Настройки:
+- --latency / --jitter — задержка ответа latency ± jitter (мс, равномерно);
+- --error-rate — доля ответов HTTP 500 (0..1);
+- --games / --game-size — число игр в каталоге и размер описания игры (байт).
+Логин, начинающийся с "bad", получает error_code -100.
+
+Запуск (из корня проекта):
+    python benchmarks/dessly_stub.py --port 18080 --latency 50 --jitter 10
+Приложение направляется на заглушку через DESSLY_BASE_URL=http://127.0.0.1:18080/api/v1
+"""
+
+import argparse
+import asyncio
+import random
+from collections import Counter
+from aiohttp import web
+
+
+class StubConfig:
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0,
+        error_rate: float = 0.0,
+        games: int = 1000,
+        game_size: int = 200,
+    ):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.games = games
+        self.game_size = game_size
+
+
+def create_app(config: StubConfig) -> web.Application:
+    calls: Counter = Counter()
+    transaction_ids = iter(range(1, 10 ** 12))
+    padding = "x" * config.game_size
+    catalog = [
+        {"app_id": app_id, "name": f"Game {app_id}", "description": padding}
+        for app_id in range(1, config.games + 1)
+    ]
+    rates = {"5": 93.5, "18": 41.2, "37": 505.1, "1": 1.0, "3": 0.92}
+
+    async def respond(name: str, payload: dict) -> web.Response:
+        calls[name] += 1
+        delay = config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        if config.error_rate and random.random() < config.error_rate:
+            calls["errors"] += 1
+            return web.json_response({"error_code": -1}, status=500)
+        return web.json_response(payload)
+
+    async def balance(request: web.Request):
+        return await respond("balance", {"balance": 1000.0})
+
+    async def exchange_rates(request: web.Request):
+        return await respond("rates", {"exchange_rates": rates})
+
+    async def check_login(request: web.Request):
+        body = await request.json()
+        if str(body.get("username", "")).startswith("bad"):
+            return await respond("check_login", {"error_code": -100})
+        return await respond("check_login", {"can_refill": True})
+
+    async def topup(request: web.Request):
+        body = await request.json()
+        if str(body.get("username", "")).startswith("bad"):
+            return await respond("topup", {"error_code": -100})
+        return await respond("topup", {"status": "pending", "transaction_id": next(transaction_ids)})
+
+    async def games(request: web.Request):
+        return await respond("games", {"games": catalog})
+
+    async def game(request: web.Request):
+        app_id = request.match_info["app_id"]
+        if not app_id.isdigit() or not 0 < int(app_id) <= config.games:
+            return await respond("game", {"error_code": -4})
+        return await respond("game", {"game": catalog[int(app_id) - 1]})
+
+    async def stats(request: web.Request):
+        return web.json_response(dict(calls))
+
+    app = web.Application()
+    app.router.add_get("/api/v1/merchants/balance", balance)
+    app.router.add_get("/api/v1/exchange_rates/steam", exchange_rates)
+    app.router.add_post("/api/v1/service/steamtopup/check_login", check_login)
+    app.router.add_post("/api/v1/service/steamtopup/topup", topup)
+    app.router.add_get("/api/v1/service/steamgift/games", games)
+    app.router.add_get("/api/v1/service/steamgift/games/{app_id}", game)
+    app.router.add_get("/stats", stats)
+    return app
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа, мс")
+    parser.add_argument("--jitter", type=float, default=0.0, help="разброс задержки ±, мс")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов HTTP 500 (0..1)")
+    parser.add_argument("--games", type=int, default=1000, help="число игр в каталоге")
+    parser.add_argument("--game-size", type=int, default=200, help="размер описания игры, байт")
+
+
+def config_from_args(args: argparse.Namespace) -> StubConfig:
+    return StubConfig(
+        latency_ms=args.latency,
+        jitter_ms=args.jitter,
+        error_rate=args.error_rate,
+        games=args.games,
+        game_size=args.game_size,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    add_arguments(parser)
+    args = parser.parse_args()
+    web.run_app(create_app(config_from_args(args)), host=args.host, port=args.port, access_log=None, print=None)
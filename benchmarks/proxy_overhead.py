@@ -0,0 +1,288 @@
+"""
+Бенчмарк накладных расходов прокси: приложение против локальной заглушки Dessly.
+
+Поднимает benchmarks/dessly_stub.py и приложение (uvicorn) отдельными процессами
+с временной SQLite-базой, в которую заранее записан пользователь с API-токеном
+уровня 1. Затем по очереди нагружает маршруты и для каждого печатает req/s,
+p50/p99 и число ошибок. Для маршрутов с вызовом Dessly тот же запрос отдельно
+отправляется прямо в заглушку: разница p50 — собственные расходы приложения
+(авторизация, аудит, журнал, сериализация; кэши могут сделать её отрицательной).
+
+Временная база — SQLite через aiosqlite, он ставится из requirements-dev.txt:
+    pip install -r requirements-dev.txt
+
+Запуск (из корня проекта):
+    python benchmarks/proxy_overhead.py --latency 50 --jitter 10 --concurrency 50 --duration 10
+    python benchmarks/proxy_overhead.py --routes balance topup --error-rate 0.05
+
+Кэши приложения настраиваются как обычно, через окружение
+(например BALANCE_CACHE_TTL=0 — каждый запрос баланса идёт в Dessly).
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.dessly_stub import add_arguments
+
+_db_path = os.path.join(tempfile.mkdtemp(prefix="proxy_bench_"), "bench.db")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_db_path}")
+if not os.getenv("FERNET_KEY"):
+    from cryptography.fernet import Fernet
+    os.environ["FERNET_KEY"] = Fernet.generate_key().decode()
+
+API_KEY = "bench-key"
+DESSLY_TOKEN = "bench-dessly-token"
+
+
+class Route:
+    """
+    Нагружаемый маршрут.
+    build(i) -> (json-тело или None) для i-го запроса; direct — тот же вызов в заглушку.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        method: str,
+        path: str,
+        build: Callable[[int], Optional[dict]] = lambda i: None,
+        headers: Optional[Dict[str, str]] = None,
+        direct: Optional[Tuple[str, Callable[[int], str], Callable[[int], Optional[dict]]]] = None,
+    ):
+        self.name = name
+        self.method = method
+        self.path = path
+        self.build = build
+        self.headers = headers or {}
+        self.direct = direct
+
+
+def _body(**extra) -> Callable[[int], dict]:
+    return lambda i: {"dessly_token": DESSLY_TOKEN, **extra}
+
+
+ROUTES: List[Route] = [
+    Route("ping", "GET", "/ping"),
+    Route(
+        "balance", "GET", "/account/balance",
+        headers={"Dessly-Token": DESSLY_TOKEN},
+        direct=("GET", lambda i: "/merchants/balance", lambda i: None),
+    ),
+    Route(
+        "conversion", "POST", "/currency/conversion",
+        build=_body(amount=1000, currency="KZT"),
+        direct=("GET", lambda i: "/exchange_rates/steam", lambda i: None),
+    ),
+    Route(
+        "check_login", "POST", "/dessly/steam/check_login",
+        build=_body(username="bench", amount=1),
+        direct=("POST", lambda i: "/service/steamtopup/check_login", lambda i: {"username": "bench", "amount": 1}),
+    ),
+    Route(
+        "topup", "POST", "/dessly/steam/topup",
+        build=lambda i: {"dessly_token": DESSLY_TOKEN, "username": "bench", "amount": 1, "reference": f"bench-{i}"},
+        direct=(
+            "POST", lambda i: "/service/steamtopup/topup",
+            lambda i: {"username": "bench", "amount": 1, "reference": f"direct-{i}"},
+        ),
+    ),
+    Route(
+        "games", "POST", "/dessly/steam/games",
+        build=_body(),
+        direct=("GET", lambda i: "/service/steamgift/games", lambda i: None),
+    ),
+    Route(
+        "game", "POST", "/dessly/steam/game",
+        build=lambda i: {"dessly_token": DESSLY_TOKEN, "app_id": str(i % 100 + 1)},
+        direct=("GET", lambda i: f"/service/steamgift/games/{i % 100 + 1}", lambda i: None),
+    ),
+]
+
+
+async def seed_db():
+    from app.database import AsyncSessionLocal, APIToken, User, engine, init_db
+
+    await init_db()
+    async with AsyncSessionLocal() as db:
+        user = User(username="bench")
+        db.add(user)
+        await db.flush()
+        db.add(APIToken(name="bench", key=API_KEY, user_id=user.id, access_level=1))
+        await db.commit()
+    await engine.dispose()
+
+
+def percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+# Номера запросов общие для всех прогонов (прогрев и замер): reference пополнений
+# не повторяются, иначе замер topup попадал бы в журнал дублей, а не в Dessly
+request_ids = itertools.count()
+
+
+async def load(
+    session: aiohttp.ClientSession,
+    method: str,
+    url: Callable[[int], str],
+    body: Callable[[int], Optional[dict]],
+    headers: Dict[str, str],
+    concurrency: int,
+    duration: float,
+) -> Dict[str, Any]:
+    """concurrency воркеров шлют запросы duration секунд; задержки в мс"""
+    samples: List[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            i = next(request_ids)
+            started = time.perf_counter()
+            try:
+                async with session.request(method, url(i), json=body(i), headers=headers) as response:
+                    await response.read()
+                    if response.status >= 400:
+                        errors += 1
+            except aiohttp.ClientError:
+                errors += 1
+            samples.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    samples.sort()
+    return {
+        "requests": len(samples),
+        "rps": len(samples) / elapsed if elapsed else 0.0,
+        "p50": percentile(samples, 0.50),
+        "p99": percentile(samples, 0.99),
+        "errors": errors,
+    }
+
+
+async def wait_ready(url: str, process: subprocess.Popen, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"Process exited with code {process.returncode}: {' '.join(process.args)}")
+            try:
+                async with session.get(url) as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} is not ready after {timeout}s")
+
+
+async def run(args: argparse.Namespace):
+    stub_base = f"http://127.0.0.1:{args.stub_port}/api/v1"
+    app_base = f"http://127.0.0.1:{args.port}"
+    env = {**os.environ, "DESSLY_BASE_URL": stub_base}
+
+    await seed_db()
+
+    stub_cmd = [
+        sys.executable, os.path.join(ROOT, "benchmarks", "dessly_stub.py"),
+        "--port", str(args.stub_port),
+        "--latency", str(args.latency), "--jitter", str(args.jitter),
+        "--error-rate", str(args.error_rate),
+        "--games", str(args.games), "--game-size", str(args.game_size),
+    ]
+    app_cmd = [
+        sys.executable, "-m", "uvicorn", "app.main:app",
+        "--host", "127.0.0.1", "--port", str(args.port),
+        "--log-level", "warning", "--no-access-log",
+    ]
+    # Логи приложения — в файл, чтобы не смешивались с таблицей
+    log_path = os.path.join(os.path.dirname(_db_path), "app.log")
+    log_file = open(log_path, "w")
+    stub = subprocess.Popen(stub_cmd, cwd=ROOT, env=env)
+    server = subprocess.Popen(app_cmd, cwd=ROOT, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+    try:
+        await wait_ready(f"http://127.0.0.1:{args.stub_port}/stats", stub)
+        await wait_ready(f"{app_base}/ping", server)
+
+        routes = [r for r in ROUTES if not args.routes or r.name in args.routes]
+        connector = aiohttp.TCPConnector(limit=0)
+        auth = {"Authorization": f"Bearer {API_KEY}"}
+
+        print(
+            f"stub: latency={args.latency}ms jitter=±{args.jitter}ms error_rate={args.error_rate} "
+            f"games={args.games}x{args.game_size}B | concurrency={args.concurrency} duration={args.duration}s"
+        )
+        header = (
+            f"{'route':<12} | {'req/s':>9} | {'p50, ms':>8} | {'p99, ms':>8} | {'errors':>6} | "
+            f"{'dessly p50':>10} | {'dessly p99':>10} | {'overhead p50':>12}"
+        )
+        print(header)
+        print("-" * len(header))
+
+        async with aiohttp.ClientSession(connector=connector) as session:
+            for route in routes:
+                headers = {**auth, **route.headers}
+                path_url = lambda i, path=route.path: app_base + path
+                # Прогрев: соединения, кэш токена, первые загрузки кэшей
+                await load(session, route.method, path_url, route.build, headers, args.concurrency, 0.5)
+                result = await load(
+                    session, route.method, path_url, route.build, headers, args.concurrency, args.duration
+                )
+
+                dessly = None
+                if route.direct is not None and not args.no_direct:
+                    method, path, body = route.direct
+                    dessly = await load(
+                        session, method, lambda i: stub_base + path(i), body, {"apikey": DESSLY_TOKEN},
+                        args.concurrency, args.duration,
+                    )
+
+                line = (
+                    f"{route.name:<12} | {result['rps']:>9.1f} | {result['p50']:>8.2f} | "
+                    f"{result['p99']:>8.2f} | {result['errors']:>6}"
+                )
+                if dessly is not None:
+                    line += (
+                        f" | {dessly['p50']:>10.2f} | {dessly['p99']:>10.2f} | "
+                        f"{result['p50'] - dessly['p50']:>12.2f}"
+                    )
+                print(line)
+    finally:
+        for process in (server, stub):
+            process.terminate()
+        for process in (server, stub):
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        log_file.close()
+        print(f"app log: {log_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=18000, help="порт приложения")
+    parser.add_argument("--stub-port", type=int, default=18080, help="порт заглушки Dessly")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=5.0, help="секунд нагрузки на маршрут")
+    parser.add_argument("--routes", nargs="+", choices=[r.name for r in ROUTES], help="только эти маршруты")
+    parser.add_argument("--no-direct", action="store_true", help="не мерить заглушку напрямую")
+    add_arguments(parser)
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,38 @@
+"""
+Общие фикстуры: временная SQLite-база (aiosqlite) вместо рабочей.
+FERNET_KEY генерируется, если не задан: без него не импортируются маршруты.
+"""
+
+import asyncio
+import os
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+
+if not os.getenv("FERNET_KEY"):
+    from cryptography.fernet import Fernet
+    os.environ["FERNET_KEY"] = Fernet.generate_key().decode()
+
+from app.database import Base
+
+
+@pytest.fixture
+def db_session(tmp_path):
+    """Фабрика сессий временной базы; NullPool — тесты открывают свой event loop на каждый asyncio.run"""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}", poolclass=NullPool)
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _foreign_keys(connection, _record):
+        cursor = connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+    async def create():
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+
+    asyncio.run(create())
+    yield async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False, autoflush=False)
+    asyncio.run(engine.dispose())
@@ -0,0 +1,106 @@
+"""
+AuditSink (app/audit.py): запись пачками, деление пачки при ошибке и дозапись при остановке.
+"""
+
+import asyncio
+
+import pytest
+from sqlalchemy import delete, func, select
+
+from app import audit
+from app.audit import AuditSink
+from app.database import APIToken, RequestAudit, User
+
+
+@pytest.fixture
+def session(db_session, monkeypatch):
+    monkeypatch.setattr(audit, "AsyncSessionLocal", db_session)
+
+    async def create_token():
+        async with db_session() as s:
+            user = User(username="admin")
+            s.add(user)
+            await s.flush()
+            token = APIToken(name="t", key="k", user_id=user.id, access_level=1)
+            s.add(token)
+            await s.commit()
+            return token.id
+
+    return db_session, asyncio.run(create_token())
+
+
+async def audit_rows(db_session):
+    async with db_session() as s:
+        return (await s.execute(select(RequestAudit.api_token_id))).scalars().all()
+
+
+def test_flush_writes_in_batches(session):
+    db_session, token_id = session
+    sink = AuditSink(batch_size=50)
+
+    async def main():
+        for i in range(120):
+            assert sink.enqueue(f"/p/{i}", "GET", "127.0.0.1", token_id)
+        assert sink._wakeup.is_set()
+        await sink.flush()
+        return await audit_rows(db_session)
+
+    rows = asyncio.run(main())
+    assert len(rows) == 120
+    assert sink.stats()["written"] == 120 and sink.stats()["queued"] == 0
+
+
+def test_bad_row_does_not_drop_batch(session):
+    db_session, token_id = session
+    sink = AuditSink(batch_size=100)
+
+    async def main():
+        for i in range(40):
+            # строка с несуществующим токеном нарушает внешний ключ
+            sink.enqueue("/p", "GET", "127.0.0.1", 999 if i == 17 else token_id)
+        await sink.flush()
+        return await audit_rows(db_session)
+
+    rows = asyncio.run(main())
+    assert len(rows) == 39 and 999 not in rows
+    assert (sink.written, sink.failed) == (39, 1)
+
+
+def test_stop_drains_buffer(session):
+    db_session, token_id = session
+    sink = AuditSink(batch_size=10, flush_interval=60)
+
+    async def main():
+        sink.start()
+        await asyncio.sleep(0)
+        for _ in range(25):
+            sink.enqueue("/p", "POST", "127.0.0.1", None)
+        await sink.stop()
+        return await audit_rows(db_session)
+
+    assert len(asyncio.run(main())) == 25
+    assert sink._task is None and sink.written == 25
+
+
+def test_overflow_is_dropped():
+    sink = AuditSink(max_queue=3)
+    results = [sink.enqueue("/p", "GET", "127.0.0.1", None) for _ in range(5)]
+    assert results == [True, True, True, False, False]
+    assert sink.stats()["dropped"] == 2
+
+
+def test_token_delete_keeps_audit_rows(session):
+    db_session, token_id = session
+
+    async def main():
+        sink = AuditSink()
+        sink.enqueue("/p", "GET", "127.0.0.1", token_id)
+        await sink.flush()
+        async with db_session() as s:
+            await s.execute(delete(APIToken).where(APIToken.id == token_id))
+            await s.commit()
+        async with db_session() as s:
+            return await audit_rows(db_session), (await s.execute(select(func.count(APIToken.id)))).scalar()
+
+    rows, tokens = asyncio.run(main())
+    assert rows == [None] and tokens == 0
@@ -0,0 +1,81 @@
+"""
+BalanceCache (app/balance.py): эпохи инвалидации по токенам.
+"""
+
+import asyncio
+
+import pytest
+
+from app import balance as balance_module
+from app.balance import BalanceCache
+from app.dessly_client import BalanceResult
+
+
+async def settle():
+    """Даёт запущенным задачам дойти до вызова Dessly"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Баланс из словаря; вызов ждёт gate, если он задан"""
+    state = {"balances": {}, "gate": None, "calls": 0}
+
+    async def fake_balance(dessly_token):
+        state["calls"] += 1
+        value = state["balances"][dessly_token]
+        if state["gate"] is not None:
+            await state["gate"].wait()
+        return BalanceResult(200, balance=value)
+
+    monkeypatch.setattr(balance_module.dessly_client, "balance", fake_balance)
+    return state
+
+
+def test_invalidate_during_fetch_skips_cache(upstream):
+    cache = BalanceCache(ttl=60)
+    upstream["balances"] = {"a": 10, "b": 20}
+
+    async def main():
+        upstream["gate"] = asyncio.Event()
+        first = asyncio.ensure_future(cache.get("a"))
+        other = asyncio.ensure_future(cache.get("b"))
+        await settle()
+        # пополнение "a", пока запрос баланса ещё в полёте
+        upstream["balances"]["a"] = 5
+        cache.invalidate("a")
+        assert cache._epochs == {"a": 1}
+        upstream["gate"].set()
+        assert await first == 10
+        assert await other == 20
+
+        upstream["gate"] = None
+        assert await cache.get("a") == 5
+        # пополнение "a" не сбросило кэш "b"
+        assert await cache.get("b") == 20
+
+    asyncio.run(main())
+    assert upstream["calls"] == 3
+
+
+def test_epochs_do_not_grow(upstream):
+    cache = BalanceCache(ttl=60)
+    upstream["balances"] = {f"t{i}": i for i in range(100)}
+
+    async def main():
+        for i in range(100):
+            await cache.get(f"t{i}")
+            cache.invalidate(f"t{i}")
+        upstream["gate"] = asyncio.Event()
+        pending = asyncio.ensure_future(cache.get("t1"))
+        await settle()
+        cache.invalidate("t1")
+        cache.invalidate("t1")
+        assert cache._epochs == {"t1": 2}
+        upstream["gate"].set()
+        await pending
+
+    asyncio.run(main())
+    assert cache._epochs == {} and cache._pending == {}
+    assert cache.stats()["epochs"] == 0
@@ -0,0 +1,70 @@
+"""
+ConfigFeed (app/config_feed.py): версии конфига и объединённые дельты для догоняющих клиентов.
+"""
+
+import asyncio
+
+import msgpack
+import pytest
+
+from app import config as app_config
+from app.config_feed import ConfigFeed
+
+
+@pytest.fixture
+def feed(monkeypatch):
+    monkeypatch.setattr(app_config, "config_cache", {"a": 1, "b": 2, "c": 3})
+    return ConfigFeed(history_size=3)
+
+
+def change(monkeypatch, feed, config):
+    monkeypatch.setattr(app_config, "config_cache", config)
+    return asyncio.run(feed.refresh())
+
+
+def test_refresh_publishes_only_changed_keys(monkeypatch, feed):
+    delta = change(monkeypatch, feed, {"a": 1, "b": 20, "d": 4})
+    assert (delta["from"], delta["version"]) == (1, 2)
+    assert delta["set"] == {"b": 20, "d": 4}
+    assert delta["removed"] == ["c"]
+    assert change(monkeypatch, feed, {"a": 1, "b": 20, "d": 4}) is None
+    assert feed.version == 2
+
+
+def test_since_merges_history(monkeypatch, feed):
+    change(monkeypatch, feed, {"a": 1, "b": 2})            # v2: -c
+    change(monkeypatch, feed, {"a": 1, "b": 2, "c": 30})   # v3: +c
+    change(monkeypatch, feed, {"a": 10, "c": 30})          # v4: a, -b
+
+    delta = feed.since(feed.epoch, 1)
+    assert (delta["from"], delta["version"]) == (1, 4)
+    assert delta["set"] == {"c": 30, "a": 10}
+    assert delta["removed"] == ["b"]
+
+    delta = feed.since(feed.epoch, 3)
+    assert delta["set"] == {"a": 10} and delta["removed"] == ["b"]
+
+    current = feed.since(feed.epoch, 4)
+    assert current["set"] == {} and current["removed"] == []
+
+
+def test_since_requires_snapshot(monkeypatch, feed):
+    for value in range(4):
+        change(monkeypatch, feed, {"a": value})
+    # история на 3 изменения: с версии 1 уже не догнать
+    assert feed.version == 5
+    assert feed.since(feed.epoch, 1) is None
+    assert feed.since(feed.epoch, 2) is not None
+    assert feed.since("other-epoch", 4) is None
+    assert feed.since(feed.epoch, 6) is None
+    assert feed.since(feed.epoch, "4") is None
+
+
+def test_sync_frame(monkeypatch, feed):
+    full = msgpack.unpackb(feed.sync_frame(), raw=False)
+    assert full == {"type": "config_full", "epoch": feed.epoch, "version": 1, "data": {"a": 1, "b": 2, "c": 3}}
+
+    change(monkeypatch, feed, {"a": 2, "b": 2, "c": 3})
+    delta = msgpack.unpackb(feed.sync_frame(feed.epoch, 1), raw=False)
+    assert delta["type"] == "config_delta" and delta["set"] == {"a": 2}
+    assert msgpack.unpackb(feed.sync_frame(feed.epoch, None), raw=False)["data"]["a"] == 2
@@ -0,0 +1,121 @@
+"""
+Целочисленная конвертация (app/rates.py) против прежней реализации на Decimal.
+"""
+
+import random
+from decimal import Decimal, ROUND_DOWN
+
+import pytest
+
+from app.rates import RatesTable, ConversionError, convert, parse_rate, format_cents
+
+
+RAW_RATES = {"5": "93.5", "18": "41.2", "37": "505.1", "1": "1", "3": "0.92", "2": "0.7891"}
+
+
+def table(raw=RAW_RATES) -> RatesTable:
+    return RatesTable({currency_id: parse_rate(currency_id, value) for currency_id, value in raw.items()})
+
+
+def decimal_convert(raw, amount: Decimal, currency_id: str, convert_to_rub: bool):
+    """Прежний расчёт на Decimal (до перехода на целые числа)"""
+    if convert_to_rub:
+        rub_amount = amount * Decimal(raw["5"])
+        return {
+            "original_amount_usd": str(amount),
+            "converted_amount_rub": str(rub_amount.quantize(Decimal("0.00"), rounding=ROUND_DOWN)),
+        }
+    converted = amount / Decimal(raw[currency_id])
+    final_amount = converted.quantize(Decimal("0.00"), rounding=ROUND_DOWN) + Decimal("0.01")
+    return {"original_amount": str(amount), "converted_amount_usd": str(final_amount)}
+
+
+def random_amount(rng: random.Random) -> Decimal:
+    places = rng.choice((0, 1, 2, 2, 3, 4))
+    value = Decimal(rng.randint(-10 ** 8, 10 ** 8)).scaleb(-places)
+    return value
+
+
+def same_value(a: str, b: str) -> bool:
+    # Decimal печатает обрезанный к нулю отрицательный результат как "-0.00"
+    return a == b or (Decimal(a) == Decimal(b) == 0)
+
+
+@pytest.mark.parametrize("convert_to_rub", [False, True])
+def test_matches_decimal_on_random_amounts(convert_to_rub):
+    rng = random.Random(20 + convert_to_rub)
+    rates = table()
+    codes = {"KZT": "37", "UAH": "18", "RUB": "5", "USD": "5", "EUR": "3", "GBP": "2"}
+    key = "converted_amount_rub" if convert_to_rub else "converted_amount_usd"
+
+    for _ in range(100_000):
+        amount = random_amount(rng)
+        code = rng.choice(list(codes))
+        expected = decimal_convert(RAW_RATES, amount, codes[code], convert_to_rub)
+        result = convert(rates, amount, code, convert_to_rub)
+        assert same_value(result[key], expected[key]), (amount, code, result, expected)
+
+
+def test_negative_amounts_truncate_toward_zero():
+    rates = table()
+    assert convert(rates, Decimal("-100"), "RUB")["converted_amount_usd"] == "-1.05"
+    assert convert(rates, Decimal("-0.001"), "RUB")["converted_amount_usd"] == "0.01"
+    assert convert(rates, Decimal("-1.234"), "USD", convert_to_rub=True)["converted_amount_rub"] == "-115.37"
+
+
+def test_usd_to_rub():
+    result = convert(table(), Decimal("10.5"), "USD", convert_to_rub=True)
+    assert result == {"original_amount_usd": "10.5", "converted_amount_rub": "981.75"}
+
+
+def test_missing_rub_rate():
+    rates = table({"37": "505.1"})
+    with pytest.raises(ConversionError) as e:
+        convert(rates, Decimal("1"), "KZT", convert_to_rub=True)
+    assert e.value.code == "rub_rate_missing"
+
+
+def test_missing_and_unsupported_currency():
+    rates = table({"5": "93.5"})
+    with pytest.raises(ConversionError) as e:
+        convert(rates, Decimal("1"), "KZT")
+    assert e.value.code == "rate_missing"
+    with pytest.raises(ConversionError) as e:
+        convert(rates, Decimal("1"), "XXX")
+    assert e.value.code == "unsupported_currency"
+
+
+def test_currency_by_id_and_non_finite_amount():
+    rates = table()
+    assert convert(rates, Decimal("505.1"), "37")["converted_amount_usd"] == "1.01"
+    with pytest.raises(ConversionError) as e:
+        convert(rates, Decimal("NaN"), "KZT")
+    assert e.value.code == "invalid_input"
+
+
+def test_parse_rate_rejects_bad_values():
+    assert parse_rate("5", "abc") is None
+    assert parse_rate("5", "0") is None
+    assert parse_rate("5", "-1") is None
+    assert parse_rate("5", "Infinity") is None
+    assert parse_rate("5", "0.5").numerator == 1
+
+
+def test_format_cents():
+    assert format_cents(0) == "0.00"
+    assert format_cents(5) == "0.05"
+    assert format_cents(-105) == "-1.05"
+    assert format_cents(123456) == "1234.56"
+
+
+@pytest.mark.parametrize("amount", ["1E+5000", "-1E+5000", "1E-5000", "1E+31"])
+def test_out_of_range_amount_is_invalid_input(amount):
+    for convert_to_rub in (False, True):
+        with pytest.raises(ConversionError) as e:
+            convert(table(), Decimal(amount), "USD", convert_to_rub)
+        assert e.value.code == "invalid_input"
+
+
+def test_zero_with_large_exponent():
+    assert convert(table(), Decimal("0E+5000"), "RUB")["converted_amount_usd"] == "0.01"
+    assert convert(table(), Decimal("1E+30"), "USD", convert_to_rub=True)["converted_amount_rub"] == format_cents(9350 * 10 ** 30)
@@ -0,0 +1,228 @@
+"""
+Пополнение Steam (app/topup.py, app/ledger.py): повторы reference, конфликты, исход unknown
+и очередь заданий с остановкой.
+"""
+
+import asyncio
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import select
+
+from app import ledger, topup as topup_module
+from app.database import TopupLedger, User
+from app.dessly_client import TopupResult
+from app.ledger import request_fields, valid_amount
+from app.topup import topup, TopupQueue, TopupQueueFull, TopupQueueStopped, DONE, QUEUED
+
+
+@pytest.fixture
+def dessly(db_session, monkeypatch):
+    """Журнал во временной базе; ответы Dessly — из очереди outcomes (TopupResult или исключение)"""
+    monkeypatch.setattr(ledger, "AsyncSessionLocal", db_session)
+    ledger.recent_references.clear()
+    state = {"outcomes": [], "calls": [], "gate": None, "session": db_session}
+
+    async def fake_topup(dessly_token, username, amount, reference):
+        state["calls"].append((username, amount, reference))
+        if state["gate"] is not None:
+            await state["gate"].wait()
+        outcome = state["outcomes"].pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    monkeypatch.setattr(topup_module.dessly_client, "topup", fake_topup)
+
+    async def create_user():
+        async with db_session() as s:
+            user = User(username="buyer")
+            s.add(user)
+            await s.commit()
+            return user.id
+
+    state["user_id"] = asyncio.run(create_user())
+    yield state
+    ledger.recent_references.clear()
+
+
+def ok(transaction_id):
+    return TopupResult(200, transaction_id=transaction_id)
+
+
+async def ledger_rows(state):
+    async with state["session"]() as s:
+        rows = (await s.execute(select(TopupLedger))).scalars().all()
+    return [(row.reference, row.status, row.transaction_id, row.error) for row in rows]
+
+
+def test_repeated_reference_is_served_from_ledger(dessly):
+    dessly["outcomes"] = [ok(101)]
+    user_id = dessly["user_id"]
+
+    async def main():
+        first = await topup("tok", "alice", 10, "ref-1", user_id=user_id)
+        ledger.recent_references.clear()  # второй раз — из таблицы, а не из памяти
+        second = await topup("tok", "alice", 10.0, "ref-1", user_id=user_id)
+        return first, second, await ledger_rows(dessly)
+
+    first, second, rows = asyncio.run(main())
+    assert first == {"status": True, "error": None, "transaction_id": 101}
+    assert second == {**first, "transaction_id": "101", "duplicate": True}
+    assert len(dessly["calls"]) == 1
+    assert rows == [("ref-1", "success", "101", None)]
+
+
+def test_failed_outcome_is_final(dessly):
+    dessly["outcomes"] = [TopupResult(200, error_code=-2)]
+    user_id = dessly["user_id"]
+
+    async def main():
+        await topup("tok", "alice", 10, "ref-1", user_id=user_id)
+        return await topup("tok", "alice", 10, "ref-1", user_id=user_id)
+
+    assert asyncio.run(main()) == {"status": False, "error": "insufficient_funds", "duplicate": True}
+    assert len(dessly["calls"]) == 1
+
+
+def test_unknown_outcome_is_retried_and_overwritten(dessly):
+    dessly["outcomes"] = [asyncio.TimeoutError(), TopupResult(200, error_code=-1), ok(7)]
+    user_id = dessly["user_id"]
+
+    async def main():
+        results = [await topup("tok", "alice", 10, "ref-1", user_id=user_id) for _ in range(3)]
+        results.append(await topup("tok", "alice", 10, "ref-1", user_id=user_id))
+        return results, await ledger_rows(dessly)
+
+    results, rows = asyncio.run(main())
+    assert [r["error"] for r in results] == ["connection_error", "server_error", None, None]
+    assert results[3].get("duplicate") is True
+    assert len(dessly["calls"]) == 3
+    assert rows == [("ref-1", "success", "7", None)]
+
+
+def test_reference_conflict(dessly):
+    dessly["outcomes"] = [ok(1)]
+    user_id = dessly["user_id"]
+
+    async def main():
+        await topup("tok", "alice", 10, "ref-1", user_id=user_id)
+        return (
+            await topup("tok", "alice", 11, "ref-1", user_id=user_id),
+            await topup("tok", "bob", 10, "ref-1", user_id=user_id),
+        )
+
+    assert asyncio.run(main()) == (topup_module.reference_conflict(),) * 2
+    assert len(dessly["calls"]) == 1
+
+
+def test_concurrent_repeats_share_one_request(dessly):
+    dessly["outcomes"] = [ok(5)]
+    user_id = dessly["user_id"]
+
+    async def main():
+        dessly["gate"] = asyncio.Event()
+        same = [asyncio.ensure_future(topup("tok", "alice", 10, "ref-1", user_id=user_id)) for _ in range(3)]
+        other = asyncio.ensure_future(topup("tok", "alice", 99, "ref-1", user_id=user_id))
+        await asyncio.sleep(0.01)
+        dessly["gate"].set()
+        return await asyncio.gather(*same), await other
+
+    same, other = asyncio.run(main())
+    assert all(r["transaction_id"] == 5 for r in same)
+    assert other == topup_module.reference_conflict()
+    assert len(dessly["calls"]) == 1
+
+
+def test_request_fields_and_amount_bounds():
+    assert request_fields("x" * 150, 10.005) == ("x" * 100, Decimal("10.00"))
+    assert request_fields("a", 1) == request_fields("a", 1.0)
+    assert valid_amount(1) and valid_amount(9_999_999_999.99)
+    for amount in (0, -1, 10 ** 10, 1e300, float("nan"), float("inf"), True, "10", None):
+        assert not valid_amount(amount), amount
+
+
+@pytest.mark.parametrize("amount", [0, -5, 1e300, 10 ** 10, float("nan")])
+def test_topup_model_rejects_out_of_range_amount(amount):
+    from pydantic import ValidationError
+    from app.routers.dessly.steam import topup_steam
+
+    with pytest.raises(ValidationError):
+        topup_steam(username="alice", dessly_token="tok", amount=amount)
+    assert topup_steam(username="alice", dessly_token="tok", amount=9_999_999_999.99).amount
+
+
+@pytest.fixture
+def slow_topup(monkeypatch):
+    """topup() для очереди: ждёт delay секунд и возвращает успех"""
+    state = {"delay": 0.0, "started": [], "finished": []}
+
+    async def fake_topup(dessly_token, username, amount, reference=None, user_id=None, api_token_id=None):
+        state["started"].append(reference)
+        await asyncio.sleep(state["delay"])
+        state["finished"].append(reference)
+        return {"status": True, "error": None, "transaction_id": reference}
+
+    monkeypatch.setattr(topup_module, "topup", fake_topup)
+    return state
+
+
+def submit(queue, reference, **kwargs):
+    return queue.submit(user_id=1, api_token_id=None, dessly_token="tok", username="alice", amount=1, reference=reference, **kwargs)
+
+
+def test_queue_runs_jobs_and_pushes_results(slow_topup):
+    pushed = []
+
+    async def push(job):
+        pushed.append(job.id)
+
+    async def main():
+        queue = TopupQueue(workers=2)
+        queue.start()
+        jobs = [submit(queue, f"r{i}", notify=push) for i in range(5)]
+        await queue.stop(timeout=5)
+        return queue, jobs
+
+    queue, jobs = asyncio.run(main())
+    assert [job.status for job in jobs] == [DONE] * 5
+    assert jobs[0].result["transaction_id"] == "r0" and jobs[0].dessly_token is None
+    assert sorted(pushed) == sorted(job.id for job in jobs)
+    assert queue.get(jobs[0].id, user_id=1) is jobs[0]
+    assert queue.get(jobs[0].id, user_id=2) is None
+
+
+def test_queue_full_and_stopped(slow_topup):
+    async def main():
+        queue = TopupQueue(workers=1, max_queue=2)
+        submit(queue, "a")
+        submit(queue, "b")
+        with pytest.raises(TopupQueueFull):
+            submit(queue, "c")
+        queue.start()
+        await queue.stop(timeout=5)
+        with pytest.raises(TopupQueueStopped):
+            submit(queue, "d")
+        return queue.stats()
+
+    stats = asyncio.run(main())
+    assert (stats["completed"], stats["rejected"], stats["accepting"]) == (2, 2, False)
+    assert slow_topup["finished"] == ["a", "b"]
+
+
+def test_stop_timeout_finishes_running_jobs(slow_topup):
+    slow_topup["delay"] = 0.2
+
+    async def main():
+        queue = TopupQueue(workers=1)
+        queue.start()
+        jobs = [submit(queue, f"r{i}") for i in range(3)]
+        await asyncio.sleep(0.01)
+        # первое задание уже в Dessly: таймаут остановки его не прерывает
+        await queue.stop(timeout=0.05)
+        return queue, jobs
+
+    queue, jobs = asyncio.run(main())
+    assert [job.status for job in jobs] == [DONE, QUEUED, QUEUED]
+    assert slow_topup["started"] == slow_topup["finished"] == ["r0"]
+    assert queue.stats()["running"] == 0 and queue.stats()["queued"] == 0
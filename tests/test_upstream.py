@@ -0,0 +1,158 @@
+"""
+Защита Dessly (app/upstream.py): AIMD-лимит параллельных запросов и circuit breaker.
+"""
+
+import asyncio
+import types
+
+import pytest
+
+from app import upstream
+from app.upstream import AIMDLimiter, CircuitBreaker, UpstreamGuard, UpstreamUnavailable, CLOSED, OPEN, HALF_OPEN
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Управляемое время модуля: clock.now сдвигается вручную"""
+    fake = types.SimpleNamespace(now=1000.0)
+    fake.monotonic = lambda: fake.now
+    monkeypatch.setattr(upstream, "time", fake)
+    return fake
+
+
+def test_limit_grows_on_fast_success_and_backs_off_once(clock):
+    limiter = AIMDLimiter(initial=10, min_limit=2, max_limit=11, latency_target=1.0, backoff=0.5)
+
+    async def main():
+        for _ in range(30):
+            await limiter.acquire(1.0, "t")
+            limiter.release(True, 0.1)
+        assert limiter.limit == 11  # не выше max_limit
+
+        # пачка одновременных ошибок — одно снижение за latency_target
+        for _ in range(5):
+            await limiter.acquire(1.0, "t")
+        for _ in range(5):
+            limiter.release(False, 0.1)
+        assert limiter.limit == 5.5 and limiter.decreases == 1
+
+        clock.now += 2
+        await limiter.acquire(1.0, "t")
+        limiter.release(True, 3.0)  # медленный ответ — тоже снижение
+        assert limiter.limit == 2.75
+
+        clock.now += 2
+        await limiter.acquire(1.0, "t")
+        limiter.release(None, 0.0)  # отменённый вызов лимит не меняет
+        clock.now += 2
+        await limiter.acquire(1.0, "t")
+        limiter.release(False, 0.0)
+        assert limiter.limit == 2  # не ниже min_limit
+        assert limiter.inflight == 0
+
+    asyncio.run(main())
+
+
+def test_waiters_get_freed_slots_or_time_out():
+    limiter = AIMDLimiter(initial=1, min_limit=1, max_limit=1, max_waiters=1)
+
+    async def main():
+        await limiter.acquire(1.0, "t")
+        waiter = asyncio.ensure_future(limiter.acquire(1.0, "t"))
+        await asyncio.sleep(0)
+        with pytest.raises(UpstreamUnavailable) as e:
+            await limiter.acquire(1.0, "t")
+        assert e.value.reason == "overloaded"
+
+        limiter.release(True, 0.1)
+        await waiter
+        assert limiter.inflight == 1
+
+        with pytest.raises(UpstreamUnavailable) as e:
+            await limiter.acquire(0.01, "t")
+        assert e.value.reason == "queue_timeout"
+        assert limiter.stats()["waiting"] == 0
+
+        # отменённый ожидающий не занимает слот
+        cancelled = asyncio.ensure_future(limiter.acquire(1.0, "t"))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        limiter.release(True, 0.1)
+        assert limiter.inflight == 0 and limiter.stats()["waiting"] == 0
+
+    asyncio.run(main())
+
+
+def test_breaker_opens_on_error_rate_and_recovers(clock):
+    breaker = CircuitBreaker(window=10, min_calls=4, error_rate=0.5, open_seconds=10, half_open_probes=2)
+
+    for ok in (True, False, True):
+        breaker.record(breaker.allow("t"), ok, 0.1, "t")
+    assert breaker.state == CLOSED  # меньше min_calls
+    breaker.record(breaker.allow("t"), False, 0.1, "t")
+    assert breaker.state == OPEN
+
+    with pytest.raises(UpstreamUnavailable) as e:
+        breaker.allow("t")
+    assert e.value.reason == "circuit_open"
+
+    clock.now += 10
+    probes = [breaker.allow("t"), breaker.allow("t")]
+    assert probes == [HALF_OPEN, HALF_OPEN]
+    with pytest.raises(UpstreamUnavailable) as e:
+        breaker.allow("t")
+    assert e.value.reason == "circuit_half_open"
+
+    for admitted in probes:
+        breaker.record(admitted, True, 0.1, "t")
+    assert breaker.state == CLOSED and breaker.stats()["window_calls"] == 0
+
+
+def test_breaker_failed_probe_reopens_and_slow_calls_open(clock):
+    breaker = CircuitBreaker(window=5, min_calls=5, error_rate=0.9, slow_rate=0.8, slow_call_seconds=1.0, open_seconds=5, half_open_probes=1)
+
+    for latency in (2, 2, 2, 0.1, 2):
+        breaker.record(breaker.allow("t"), True, latency, "t")
+    assert breaker.state == OPEN
+
+    clock.now += 5
+    breaker.record(breaker.allow("t"), False, 0.1, "t")
+    assert breaker.state == OPEN and breaker.opened == 2
+
+    clock.now += 5
+    admitted = breaker.allow("t")
+    breaker.record(admitted, None, 0.0, "t")  # отменённая проба не решает исход
+    assert breaker.state == HALF_OPEN
+    breaker.record(breaker.allow("t"), True, 0.1, "t")
+    assert breaker.state == CLOSED
+
+
+def test_guard_slot_outcomes(clock):
+    guard = UpstreamGuard(
+        "t",
+        limiter=AIMDLimiter(initial=4),
+        breaker=CircuitBreaker(window=10, min_calls=3, error_rate=0.5),
+    )
+
+    async def main():
+        async with guard.slot() as call:
+            call["ok"] = False  # плохой статус ответа
+        with pytest.raises(RuntimeError):
+            async with guard.slot():
+                raise RuntimeError("boom")
+
+        inner = asyncio.ensure_future(slow_call())
+        await asyncio.sleep(0)
+        inner.cancel()
+        await asyncio.gather(inner, return_exceptions=True)
+
+    async def slow_call():
+        async with guard.slot():
+            await asyncio.sleep(10)
+
+    asyncio.run(main())
+    # отмена не считается ошибкой и не двигает окно выключателя
+    assert guard.failures == 2
+    assert guard.breaker.stats()["window_calls"] == 2
+    assert guard.breaker.state == CLOSED
@@ -0,0 +1,77 @@
+"""
+WhitelistIndex (app/whitelist_index.py): IP, CIDR и домены с поддоменами.
+"""
+
+import pytest
+
+from app.whitelist_index import WhitelistIndex, normalize_domain
+
+
+@pytest.fixture
+def index():
+    return WhitelistIndex([
+        "1.2.3.4",
+        "2001:db8::1",
+        "10.0.0.0/8",
+        "192.168.1.0/24",
+        "2001:db8:ff::/48",
+        "example.com",
+        "*.apps.example.org",
+        "bad/net",
+        "",
+        None,
+    ])
+
+
+@pytest.mark.parametrize("ip, allowed", [
+    ("1.2.3.4", True),
+    ("1.2.3.5", False),
+    ("::ffff:1.2.3.4", True),
+    ("2001:db8::1", True),
+    ("10.255.0.1", True),
+    ("11.0.0.1", False),
+    ("192.168.1.200", True),
+    ("192.168.2.1", False),
+    ("2001:db8:ff:1::5", True),
+    ("2001:db8:fe::5", False),
+    ("not-an-ip", False),
+    (None, False),
+])
+def test_allows_ip(index, ip, allowed):
+    assert index.allows_ip(ip) is allowed
+
+
+@pytest.mark.parametrize("domain, allowed", [
+    ("example.com", True),
+    ("EXAMPLE.com:8443", True),
+    ("example.com.", True),
+    ("api.example.com", False),
+    ("com", False),
+    ("x.apps.example.org", True),
+    ("a.b.apps.example.org", True),
+    ("apps.example.org", False),
+    ("example.org", False),
+    # метки, совпадающие с прежними служебными ключами trie
+    ("$.example.com", False),
+    ("*.example.com", False),
+    ("$", False),
+    ("*", False),
+    ("$.apps.example.org", True),
+    ("", False),
+    (None, False),
+])
+def test_allows_domain(index, domain, allowed):
+    assert index.allows_domain(domain) is allowed
+
+
+def test_is_allowed_and_size(index):
+    assert index.is_allowed("8.8.8.8", "example.com")
+    assert index.is_allowed("1.2.3.4", None)
+    assert not index.is_allowed("8.8.8.8", "evil.com")
+    # пустые значения не считаются, неверная сеть — считается, но пропускается
+    assert index.size == 8
+
+
+def test_normalize_domain():
+    assert normalize_domain(" Example.COM:443 ") == "example.com"
+    assert normalize_domain("[::1]:80") == "[::1]:80"
@@ -0,0 +1,32 @@
+"""
+with_request_id (app/ws/dispatcher.py): request_id дописывается в уже упакованный msgpack-словарь.
+"""
+
+import msgpack
+import pytest
+
+from app.ws.dispatcher import with_request_id
+
+
+def suffix(request_id) -> bytes:
+    return msgpack.packb("request_id") + msgpack.packb(request_id, use_bin_type=True)
+
+
+@pytest.mark.parametrize("size", [0, 1, 14, 15, 16, 100, 0xFFFE, 0xFFFF, 0x10000])
+def test_map_sizes(size):
+    message = {f"k{i}": i for i in range(size)}
+    data = with_request_id(msgpack.packb(message, use_bin_type=True), suffix(42))
+    assert msgpack.unpackb(data, raw=False) == {**message, "request_id": 42}
+
+
+@pytest.mark.parametrize("request_id", [7, "abc", -1, 2 ** 40, 1.5, None, b"\x00bin"])
+def test_request_id_types(request_id):
+    message = {"type": "pong", "error": None, "items": [1, {"a": 2}]}
+    data = with_request_id(msgpack.packb(message, use_bin_type=True), suffix(request_id))
+    assert msgpack.unpackb(data, raw=False) == {**message, "request_id": request_id}
+
+
+@pytest.mark.parametrize("value", [[1, 2], "text", 5, None, b""])
+def test_non_map_is_unchanged(value):
+    data = msgpack.packb(value, use_bin_type=True)
+    assert with_request_id(data, suffix(1)) == data
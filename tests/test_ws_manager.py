@@ -0,0 +1,219 @@
+"""
+Рассылка WebSocket (app/ws_manager.py): очереди соединений, писатели
+и политики для медленных клиентов.
+"""
+
+import asyncio
+
+import msgpack
+import pytest
+
+from app.ws_manager import Connection, ConnectionClosed, WebSocketManager, DROP_OLDEST, COALESCE, DISCONNECT
+
+
+class FakeWebSocket:
+    """Сокет, запись в который можно задержать через gate"""
+
+    def __init__(self, gate: asyncio.Event = None):
+        self.gate = gate
+        self.sent = []
+        self.closed_with = None
+
+    async def accept(self):
+        pass
+
+    async def send_bytes(self, data: bytes):
+        if self.gate is not None:
+            await self.gate.wait()
+        self.sent.append(data)
+
+    async def close(self, code: int = 1000):
+        self.closed_with = code
+
+
+async def settle():
+    """Даёт писателям разобрать очереди"""
+    await asyncio.sleep(0.01)
+
+
+def test_broadcast_does_not_wait_for_slow_socket():
+    async def main():
+        manager = WebSocketManager(max_queue=10)
+        fast, slow = FakeWebSocket(), FakeWebSocket(asyncio.Event())
+        await manager.connect(fast)
+        await manager.connect(slow)
+
+        delivered = [await manager.broadcast({"type": "news", "n": i}) for i in range(3)]
+        await settle()
+        assert delivered == [2, 2, 2]
+        assert [msgpack.unpackb(d)["n"] for d in fast.sent] == [0, 1, 2]
+        assert slow.sent == [] and manager.connections[slow].qsize() == 2
+
+        slow.gate.set()
+        await settle()
+        # один и тот же упакованный кадр во всех соединениях
+        assert slow.sent == fast.sent and all(a is b for a, b in zip(slow.sent, fast.sent))
+
+        await manager.disconnect(fast)
+        await manager.disconnect(slow)
+        assert manager.stats()["connections"] == 0
+
+    asyncio.run(main())
+
+
+def test_replies_keep_order_with_broadcasts():
+    async def main():
+        ws = FakeWebSocket()
+        connection = Connection(ws, max_queue=10)
+        await connection.send_bytes(b"reply-1")
+        connection.send_nowait(b"news", "news")
+        await connection.send_bytes(b"reply-2")
+        connection.start()
+        await settle()
+        await connection.close()
+        return ws.sent
+
+    assert asyncio.run(main()) == [b"reply-1", b"news", b"reply-2"]
+
+
+def test_publish_reaches_only_subscribers():
+    async def main():
+        manager = WebSocketManager()
+        a, b = FakeWebSocket(), FakeWebSocket()
+        conn_a = await manager.connect(a)
+        await manager.connect(b)
+        assert manager.subscribe(conn_a, ["rates", "news"]) == ["news", "rates"]
+
+        assert await manager.publish("rates", {"type": "rates"}) == 1
+        assert await manager.publish("version", {"type": "version"}) == 0
+        assert manager.unsubscribe(conn_a, ["rates"]) == ["news"]
+        assert await manager.publish("rates", {"type": "rates"}) == 0
+        await settle()
+
+        await manager.disconnect(a)
+        assert manager.subscribers["news"] == set()
+        return a.sent, b.sent
+
+    sent_a, sent_b = asyncio.run(main())
+    assert [msgpack.unpackb(d)["type"] for d in sent_a] == ["rates"]
+    assert sent_b == []
+
+
+def test_close_while_writing_stops_writer():
+    async def main():
+        # отмена может совпасть с завершением записи на любом шаге писателя
+        for steps in range(12):
+            ws = FakeWebSocket()
+            connection = Connection(ws, max_queue=10)
+            for i in range(3):
+                connection.send_nowait(b"frame", "news")
+            connection.start()
+            for _ in range(steps):
+                await asyncio.sleep(0)
+            await asyncio.wait_for(connection.close(), 1)
+            assert connection._writer.done()
+
+    asyncio.run(main())
+
+
+def queued(connection):
+    return [data for _, data in connection._frames]
+
+
+def test_drop_oldest_keeps_replies():
+    async def main():
+        connection = Connection(FakeWebSocket(), max_queue=3, policy=DROP_OLDEST)
+        await connection.send_bytes(b"reply")
+        assert connection.send_nowait(b"n1", "news")
+        assert connection.send_nowait(b"n2", "news")
+        assert connection.send_nowait(b"n3", "news")
+        assert queued(connection) == [b"reply", b"n2", b"n3"]
+        assert connection.dropped == 1
+
+        # в очереди одни ответы — кадр рассылки не ставится
+        only_replies = Connection(FakeWebSocket(), max_queue=1, policy=DROP_OLDEST)
+        await only_replies.send_bytes(b"reply")
+        assert not only_replies.send_nowait(b"n", "news")
+        assert queued(only_replies) == [b"reply"] and only_replies.dropped == 1
+
+    asyncio.run(main())
+
+
+def test_coalesce_replaces_only_last_value_types():
+    connection = Connection(FakeWebSocket(), max_queue=3, policy=COALESCE)
+    connection.send_nowait(b"rates-1", "rates")
+    connection.send_nowait(b"news-1", "news")
+    connection.send_nowait(b"rates-2", "rates")
+    assert queued(connection) == [b"news-1", b"rates-2"] and connection.coalesced == 1
+
+    connection.send_nowait(b"news-2", "news")
+    connection.send_nowait(b"news-3", "news")
+    # news не схлопывается: при полной очереди выбрасывается старейший кадр
+    assert queued(connection) == [b"rates-2", b"news-2", b"news-3"]
+    assert (connection.coalesced, connection.dropped) == (1, 1)
+
+
+def test_disconnect_policy_closes_with_code():
+    async def main():
+        ws = FakeWebSocket(asyncio.Event())
+        connection = Connection(ws, max_queue=2, policy=DISCONNECT, close_code=4008)
+        connection.start()
+        assert connection.send_nowait(b"1", "news")
+        assert connection.send_nowait(b"2", "news")
+        await settle()
+        assert connection.send_nowait(b"3", "news")
+        assert not connection.send_nowait(b"4", "news")
+        await settle()
+        assert connection.closed and connection.slow_closed
+        assert ws.closed_with == 4008
+        with pytest.raises(ConnectionClosed):
+            await connection.send_bytes(b"reply")
+        assert not connection.send_nowait(b"5", "news")
+
+    asyncio.run(main())
+
+
+def test_reply_waits_for_space_then_closes_slow_client():
+    async def main():
+        ws = FakeWebSocket(asyncio.Event())
+        connection = Connection(ws, max_queue=1, send_timeout=0.05, close_code=4008)
+        connection.start()
+        await connection.send_bytes(b"1")  # писатель взял кадр и ждёт сокет
+        await settle()
+        await connection.send_bytes(b"2")
+        with pytest.raises(ConnectionClosed):
+            await connection.send_bytes(b"3")
+        await settle()
+        assert connection.slow_closed and ws.closed_with == 4008
+
+    asyncio.run(main())
+
+
+def test_write_timeout_closes_connection():
+    async def main():
+        ws = FakeWebSocket(asyncio.Event())
+        connection = Connection(ws, write_timeout=0.02, close_code=4008)
+        connection.start()
+        await connection.send_bytes(b"1")
+        await asyncio.sleep(0.1)
+        assert connection.slow_closed and ws.closed_with == 4008
+
+    asyncio.run(main())
+
+
+def test_manager_counts_policy_events():
+    async def main():
+        manager = WebSocketManager(max_queue=1, policy=COALESCE)
+        ws = FakeWebSocket(asyncio.Event())
+        await manager.connect(ws)
+        for i in range(4):
+            await manager.broadcast({"type": "rates", "n": i})
+        await manager.broadcast({"type": "news"})
+        stats = manager.stats()
+        await manager.disconnect(ws)
+        return stats, manager.stats()
+
+    live, after = asyncio.run(main())
+    assert live["coalesced"] == after["coalesced"] >= 2
+    assert live["dropped"] == after["dropped"] == 1
+    assert WebSocketManager(policy="bogus").policy == DROP_OLDEST